@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import tempfile
 from pathlib import Path
 from decouple import config
 
@@ -51,7 +52,7 @@ INSTALLED_APPS = [
 REST_FRAMEWORK = {
     'DEFAULT_SCHEMA_CLASS': 'drf_spectacular.openapi.AutoSchema',
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'rental_api.authentication.CachedJWTAuthentication',
     ],
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
@@ -66,12 +67,15 @@ REST_FRAMEWORK = {
 }
 
 MIDDLEWARE = [
+    'rental_api.middleware.MetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'rental_api.middleware.QueryStatsMiddleware',
+    'rental_api.middleware.ReplicaRoutingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     
@@ -120,9 +124,70 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+    },
+    # Click-tracking events and their rollups, kept off the booking database's
+    # write lock (see rental_api/routers.py); set up with
+    # `python manage.py migrate --database=analytics`
+    'analytics': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'analytics.sqlite3',
+    },
+}
+
+# Raw analytics events older than this, once rolled up, are removed by
+# `manage.py prune_analytics`
+ANALYTICS_RETENTION_DAYS = 90
+
+# Shared by every worker process on this host: JWT user versions, the facet
+# and availability versions and the replica sticky pins must be seen by all
+# of them, so this is never a per-process LocMemCache. Point CACHE_BACKEND and
+# CACHE_LOCATION at e.g. django.core.cache.backends.redis.RedisCache (needs
+# the redis package) when the app runs on more than one host.
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': config('CACHE_LOCATION', default=str(Path(tempfile.gettempdir()) / 'bike_rental_cache')),
+        'OPTIONS': {'MAX_ENTRIES': 20000},
     }
 }
 
+# Heavy read-only endpoints can read from replicas (see rental_api/routers.py).
+# LOCAL_READ_REPLICA adds a second connection to the same file as a stand-in.
+READ_REPLICAS = {
+    'ALIASES': [],
+    'STICKY_SECONDS': 10,
+    'RETRY_AFTER': 30,
+}
+if config('LOCAL_READ_REPLICA', default=False, cast=bool):
+    DATABASES['replica'] = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+    READ_REPLICAS['ALIASES'] = ['replica']
+
+DATABASE_ROUTERS = ['rental_api.routers.TelemetryRouter', 'rental_api.routers.ReplicaRouter']
+
+# Sampled per-endpoint SQL counts and N+1 detection (see rental_api/query_stats.py)
+QUERY_STATS = {
+    'SAMPLE_RATE': config('QUERY_STATS_SAMPLE_RATE', default=1.0 if DEBUG else 0.01, cast=float),
+    'REPEAT_THRESHOLD': 5,
+    'PATTERNS_PER_VIEW': 5,
+}
+
+# Request/DB/cache metrics (see rental_api/metrics.py). Worker processes
+# share their figures through files in DIR.
+METRICS = {
+    'DIR': config('METRICS_DIR', default=str(Path(tempfile.gettempdir()) / 'bike_rental_metrics')),
+    'FLUSH_INTERVAL': 5,
+}
+
+# Live bike availability stream (see rental_api/live.py). Workers on this host
+# relay changes to each other through sockets in FANOUT_DIR.
+LIVE_EVENTS = {
+    'FANOUT_DIR': config('LIVE_EVENTS_DIR', default=str(Path(tempfile.gettempdir()) / 'bike_rental_live')),
+    'HEARTBEAT': 15,
+    'QUEUE_SIZE': 100,
+    'MAX_LIFETIME': 300,
+    'RETRY': 10000,
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -166,7 +231,10 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'rental_api.User'
 
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+# Set EMAIL_BACKEND=django.core.mail.backends.filebased.EmailBackend (or the
+# console backend) to develop and test without SMTP
+EMAIL_BACKEND = config('EMAIL_BACKEND', default='django.core.mail.backends.smtp.EmailBackend')
+EMAIL_FILE_PATH = config('EMAIL_FILE_PATH', default=str(BASE_DIR / 'sent_emails'))
 EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_PORT = 587
 EMAIL_USE_TLS = True
@@ -186,3 +254,34 @@ SPECTACULAR_SETTINGS = {
 }
 
 
+
+# Click-tracking events are queued in-process and written in batches
+# (see rental_api/ingest.py)
+ANALYTICS_BUFFER = {
+    'ENABLED': True,
+    'BATCH_SIZE': 200,
+    'FLUSH_INTERVAL': 2.0,
+    'MAX_QUEUE': 10000,
+}
+
+# Authenticated requests resolve their user from an in-process LRU instead of
+# a query per request (see rental_api/authentication.py)
+JWT_USER_CACHE = {
+    'MAX_SIZE': 10000,
+    'TTL': 300,
+    'RECHECK': 5,
+}
+
+# Registration and password-reset mail is stored in an outbox table and sent
+# by background workers over a reused SMTP session (see rental_api/outbox.py)
+EMAIL_OUTBOX = {
+    'ENABLED': True,
+    'WORKERS': 2,
+    'BATCH_SIZE': 50,
+    'POLL_INTERVAL': 5.0,
+    'MAX_ATTEMPTS': 5,
+    'BACKOFF_BASE': 30,
+    'BACKOFF_MAX': 3600,
+    'CLAIM_TIMEOUT': 300,
+    'KEEP_SENT_DAYS': 7,
+}
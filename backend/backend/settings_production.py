@@ -43,13 +43,56 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
 
 # Database configuration (SQLite for Render)
+# Pragmas applied on every new connection: WAL lets readers run alongside the
+# single writer, synchronous=NORMAL is safe under WAL and skips an fsync per
+# commit, and busy_timeout makes a blocked writer wait instead of failing with
+# "database is locked". Write transactions start with BEGIN IMMEDIATE so they
+# queue for the write lock up front rather than deadlocking on a read->write
+# upgrade. Compare profiles with `manage.py bench_sqlite_writes`.
+SQLITE_PRAGMAS = [
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA busy_timeout=20000',         # ms
+    'PRAGMA cache_size=-65536',          # KiB, i.e. 64 MB of page cache
+    'PRAGMA mmap_size=268435456',        # 256 MB
+    'PRAGMA temp_store=MEMORY',
+]
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        # Keep connections (and their page cache) between requests. Under ASGI
+        # set CONN_MAX_AGE=0: connections opened in its sync threads are never reused
+        'CONN_MAX_AGE': config('CONN_MAX_AGE', default=600, cast=int),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': ';'.join(SQLITE_PRAGMAS),
+        },
+    },
+    'analytics': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'analytics.sqlite3',
+        'CONN_MAX_AGE': config('CONN_MAX_AGE', default=600, cast=int),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': ';'.join(SQLITE_PRAGMAS),
+        },
+    },
 }
 
+# DATABASES was replaced above, so the LOCAL_READ_REPLICA stand-in from
+# settings.py is rebuilt here: a second connection to the same file, with
+# the same pragmas (under WAL its reads never wait for the writer)
+if config('LOCAL_READ_REPLICA', default=False, cast=bool):
+    DATABASES['replica'] = {**DATABASES['default'], 'TEST': {'MIRROR': 'default'}}
+READ_REPLICAS = {**READ_REPLICAS, 'ALIASES': [alias for alias in READ_REPLICAS['ALIASES'] if alias in DATABASES]}
+
+# Sample 1% of requests for per-endpoint SQL stats
+QUERY_STATS = {**QUERY_STATS, 'SAMPLE_RATE': config('QUERY_STATS_SAMPLE_RATE', default=0.01, cast=float)}
+
 # Email configuration for production
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = 'smtp.gmail.com'
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_wsgi_application()
+
+# Load the booking availability index now rather than on the first booking request
+from rental_api.availability import availability_index  # noqa: E402
+
+availability_index.warm()
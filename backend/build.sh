@@ -5,4 +5,11 @@ set -o errexit
 pip install -r requirements.txt
 
 python manage.py collectstatic --no-input
-python manage.py migrate 
\ No newline at end of file
+python manage.py migrate 
+python manage.py migrate --database=analytics
+# Copy analytics rows written before the analytics database existed (once)
+python manage.py move_analytics --skip-existing
+# Popularity scores slide with a 30-day window; also run this hourly from cron
+python manage.py recompute_popularity
+# Fold new analytics events into the rollups; also run this from cron (see README)
+python manage.py rollup_analytics
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import User, Bike, Booking, Review, Analytics
+from .models import User, Bike, Booking, Review, Analytics, OutboxEmail
 
 class CustomUserAdmin(UserAdmin):
     list_display = ('username', 'email', 'first_name', 'last_name', 'is_verified', 'date_joined')
@@ -36,6 +36,17 @@ class ReviewAdmin(admin.ModelAdmin):
 class AnalyticsAdmin(admin.ModelAdmin):
     list_display = ('action', 'page', 'timestamp', 'user', 'ip_address')
     list_filter = ('action', 'page', 'timestamp')
-    search_fields = ('action', 'page', 'user__username')
+    # No user__ lookups: events may live on another database than users
+    search_fields = ('action', 'page')
     readonly_fields = ('timestamp',)
     ordering = ('-timestamp',)
+
+@admin.register(OutboxEmail)
+class OutboxEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'status', 'attempts', 'next_attempt_at', 'created_at', 'sent_at')
+    list_filter = ('status', 'created_at')
+    search_fields = ('subject', 'last_error')
+    readonly_fields = ('created_at', 'sent_at', 'claimed_at', 'last_error')
+    # Bodies can hold password-reset links
+    exclude = ('body',)
+    ordering = ('-created_at',)
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class RentalApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'rental_api'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from . import checks  # noqa: F401
+        # Before the first connection opens, so every connection gets the query timers
+        from . import metrics, query_stats  # noqa: F401
@@ -0,0 +1,85 @@
+"""
+Async DRF views for the read path.
+
+DRF's APIView is synchronous, so under ASGI Django runs every one of them in
+a worker thread and a request waiting on SQLite (or SMTP) holds that thread
+until it is done. AsyncAPIView keeps DRF's request handling (authentication,
+permissions, throttling, content negotiation, exception handling) but
+awaits coroutine handlers, so the view body can use Django's async ORM
+(`acount()`, `aaggregate()`, `afirst()`, `async for`) and leaves the event
+loop free while it waits.
+
+Authentication and permission checks may load the user, so `initial()` runs
+through sync_to_async; the JWT user cache (rental_api.authentication)
+usually answers it without a query.
+
+AsyncGenericViewSet does the same for router-registered viewsets: every
+action must then be a coroutine.
+
+Under WSGI (gunicorn's sync workers, runserver, the test client) Django
+runs these views with async_to_sync, so both deployments serve the same
+code.
+"""
+import inspect
+
+from asgiref.sync import markcoroutinefunction, sync_to_async
+from django.core.exceptions import ValidationError
+from django.http import Http404
+from django.utils.decorators import classonlymethod
+from rest_framework.generics import GenericAPIView
+from rest_framework.views import APIView
+from rest_framework.viewsets import ViewSetMixin
+
+
+class AsyncAPIView(APIView):
+    """APIView whose get()/post()/... handlers are coroutines"""
+
+    async def dispatch(self, request, *args, **kwargs):
+        # APIView.dispatch, awaiting the handler
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            response = handler(request, *args, **kwargs)
+            # OPTIONS and 405 are still answered by APIView's sync handlers
+            if inspect.isawaitable(response):
+                response = await response
+
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+
+class AsyncGenericViewSet(ViewSetMixin, AsyncAPIView, GenericAPIView):
+    """GenericViewSet with coroutine actions, plus async counterparts of its lookups"""
+
+    @classonlymethod
+    def as_view(cls, actions=None, **initkwargs):
+        # ViewSetMixin builds a plain function; Django must know it returns a coroutine
+        return markcoroutinefunction(super().as_view(actions, **initkwargs))
+
+    async def afilter_queryset(self, queryset):
+        return self.filter_queryset(queryset)
+
+    async def aget_object(self):
+        """GenericAPIView.get_object() on the async ORM"""
+        queryset = await self.afilter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            obj = await queryset.aget(**{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        except (queryset.model.DoesNotExist, TypeError, ValueError, ValidationError):
+            raise Http404
+        self.check_object_permissions(self.request, obj)
+        return obj
@@ -0,0 +1,189 @@
+"""
+JWT authentication that remembers who the token belongs to.
+
+simplejwt's JWTAuthentication loads the user by primary key on every
+request. CachedJWTAuthentication keeps a bounded in-process LRU of user
+snapshots instead, each tagged with the user's version number at load time.
+Versions live in the Django cache, which must be shared by every worker
+process (see CACHES in settings and rental_api.checks): with a per-process
+LocMemCache, a user demoted, deactivated or reset in one worker would stay
+signed in as before in the others until TTL. The rental_api signals bump a
+user's version whenever the user is saved (profile edits, role changes,
+password resets, last_login) or deleted, and a snapshot whose version no
+longer matches is reloaded.
+
+Reading the version is not free with a file-based cache (a file read and
+an unpickle, about what the primary-key lookup costs), so a snapshot is only
+compared against it once it is RECHECK seconds old. A hit within RECHECK
+costs nothing outside the process. Writes made in this process drop the
+snapshot at once; writes made in another worker are seen within RECHECK.
+
+Settings (all optional)::
+
+    JWT_USER_CACHE = {
+        'MAX_SIZE': 10000,  # snapshots kept per process
+        'TTL': 300,         # seconds; reload even without a version bump
+        'RECHECK': 5,       # seconds a snapshot is trusted before the version is read
+    }
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .metrics import cache_lookup
+
+DEFAULTS = {
+    'MAX_SIZE': 10000,
+    'TTL': 300,
+    'RECHECK': 5,
+}
+
+
+def user_cache_settings():
+    return {**DEFAULTS, **getattr(settings, 'JWT_USER_CACHE', {})}
+
+
+def _version_key(user_id):
+    return f'jwt_user_version:{user_id}'
+
+
+def user_version(user_id):
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        # Seed from the clock so an evicted counter never matches an old snapshot
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def invalidate_user(user_id):
+    try:
+        cache.incr(_version_key(user_id))
+    except ValueError:
+        # No version stored yet: the next read seeds a fresh one
+        pass
+    user_cache.discard(str(user_id))
+
+
+def invalidate_user_on_commit(user_id):
+    # Once now, so this process stops serving the old snapshot, and again
+    # after commit, in case a request re-cached it before the write landed
+    invalidate_user(user_id)
+    transaction.on_commit(lambda: invalidate_user(user_id))
+
+
+Snapshot = namedtuple('Snapshot', 'version user loaded_at checked_at')
+
+
+class UserCache:
+    """Thread-safe LRU of {user_id: Snapshot}"""
+
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, user_id, ttl):
+        """The snapshot for `user_id`, or None when there is none younger than `ttl`"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or time.monotonic() - entry.loaded_at > ttl:
+                return None
+            self._entries.move_to_end(user_id)
+            return entry
+
+    def confirm(self, user_id, version):
+        """Restart the RECHECK clock of a snapshot still at `version`"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry.version == version:
+                self._entries[user_id] = entry._replace(checked_at=time.monotonic())
+
+    def count(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def put(self, user_id, version, user, max_size):
+        with self._lock:
+            now = time.monotonic()
+            self._entries[user_id] = Snapshot(version, user, now, now)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > max_size:
+                self._entries.popitem(last=False)
+
+    def discard(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+user_cache = UserCache()
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """Drop-in JWTAuthentication that serves users from user_cache"""
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        # Tokens may carry the id as a string; signals see the integer pk
+        user_id = str(user_id)
+        options = user_cache_settings()
+        version = None
+        entry = user_cache.get(user_id, options['TTL'])
+        if entry is not None and time.monotonic() - entry.checked_at >= options['RECHECK']:
+            # Old enough that another worker may have changed the user
+            version = user_version(user_id)
+            if version == entry.version:
+                user_cache.confirm(user_id, version)
+            else:
+                entry = None
+        user = entry.user if entry is not None else None
+        user_cache.count(user is not None)
+        cache_lookup('jwt_user', user is not None)
+        if user is None:
+            if version is None:
+                # Read the version before loading, so a write that lands
+                # mid-load leaves this snapshot already stale
+                version = user_version(user_id)
+            try:
+                user = self.user_model.objects.get(**{api_settings.USER_ID_FIELD: user_id})
+            except self.user_model.DoesNotExist:
+                raise AuthenticationFailed(_("User not found"), code="user_not_found")
+            user_cache.put(user_id, version, user, options['MAX_SIZE'])
+
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+        # Each request gets its own copy, so views mutating request.user
+        # never leak into the shared snapshot
+        return copy.copy(user)
@@ -0,0 +1,323 @@
+"""
+In-process availability index for bike time slots.
+
+Each bike keeps its active bookings as a sorted list of non-overlapping
+[start, end) intervals, so "is this window free?" is a bisect instead of a
+scan over every Booking row. Alongside the intervals every bike has an
+occupancy bitmap with one bit per 15-minute slot across the booking horizon,
+so fleet-wide "which bikes are free between T1 and T2" is a single AND per
+bike.
+
+The index is built when the server starts (see backend/wsgi.py and asgi.py)
+and kept in sync with this process's own writes by the Booking signals in
+signals.py and by rental_api.transitions. Every committed change also
+stores a fresh generation token in the shared Django cache; a lookup that
+finds a token other than the one its index was loaded at reloads from the
+Booking table first, so other workers' bookings, cancellations and ended
+rides are picked up. The index is still only a pre-filter: callers confirm a
+"not free" answer against the database before refusing a booking.
+"""
+import logging
+import math
+import threading
+import uuid
+from bisect import bisect_left, bisect_right
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Bookings in these states hold their slot on the bike
+ACTIVE_BOOKING_STATUSES = ('pending', 'confirmed', 'in_use')
+
+# How far ahead BookingCreateView accepts start times
+BOOKING_HORIZON = timedelta(hours=36)
+
+SLOT_SECONDS = 15 * 60
+HORIZON_SLOTS = int(BOOKING_HORIZON.total_seconds()) // SLOT_SECONDS
+
+# Legacy bookings without an end time are charged (and held) for at least an hour
+DEFAULT_BOOKING_DURATION = timedelta(hours=1)
+
+GENERATION_KEY = 'availability:generation'
+
+
+def current_generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        # Evicted or never set: any fresh token makes every worker reload once
+        cache.add(GENERATION_KEY, uuid.uuid4().hex, None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def announce_change():
+    """Tell every worker's index that the Booking table changed"""
+    cache.set(GENERATION_KEY, uuid.uuid4().hex, None)
+
+
+def slot_of(moment):
+    """Index of the 15-minute slot containing `moment`"""
+    return int(moment.timestamp()) // SLOT_SECONDS
+
+
+def slot_span(start, end):
+    """Slots touched by [start, end), rounded outwards to whole slots"""
+    return slot_of(start), math.ceil(end.timestamp() / SLOT_SECONDS)
+
+
+def booking_interval(booking):
+    """Return the [start, end) window a booking occupies on its bike"""
+    end = booking.booked_end_time or booking.end_time
+    if end is None:
+        end = booking.start_time + DEFAULT_BOOKING_DURATION
+    return booking.start_time, end
+
+
+class BikeIntervals:
+    """Sorted, non-overlapping booking intervals for a single bike"""
+
+    __slots__ = ('starts', 'ends', 'booking_ids')
+
+    def __init__(self):
+        self.starts = []
+        self.ends = []
+        self.booking_ids = []
+
+    def __len__(self):
+        return len(self.starts)
+
+    def overlapping(self, start, end):
+        """Return the booking ids whose interval intersects [start, end)"""
+        # Intervals never overlap each other, so their ends are sorted too:
+        # everything in ends[lo:hi] finishes after `start` and begins before `end`.
+        lo = bisect_right(self.ends, start)
+        hi = bisect_left(self.starts, end)
+        return self.booking_ids[lo:hi]
+
+    def add(self, booking_id, start, end):
+        pos = bisect_right(self.starts, start)
+        self.starts.insert(pos, start)
+        self.ends.insert(pos, end)
+        self.booking_ids.insert(pos, booking_id)
+
+    def remove(self, booking_id, start):
+        pos = bisect_left(self.starts, start)
+        while pos < len(self.starts) and self.starts[pos] == start:
+            if self.booking_ids[pos] == booking_id:
+                del self.starts[pos]
+                del self.ends[pos]
+                del self.booking_ids[pos]
+                return True
+            pos += 1
+        return False
+
+
+class AvailabilityIndex:
+    """Per-bike interval index and slot bitmaps over active bookings"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._bikes = {}
+        self._bookings = {}  # booking_id -> (bike_id, start, end, status)
+        self._riding = {}  # bike_id -> ids of in_use bookings
+        self._bitmaps = {}  # bike_id -> int, bit i set when slot base_slot + i is taken
+        self._base_slot = 0
+        self._loaded = False
+        self._generation = None
+
+    def reset(self):
+        """Drop all state; the next lookup reloads from the database"""
+        with self._lock:
+            self._bikes = {}
+            self._bookings = {}
+            self._riding = {}
+            self._bitmaps = {}
+            self._loaded = False
+            self._generation = None
+
+    def rebuild(self, generation=None):
+        """Reload every active booking from the Booking table"""
+        from .models import Booking
+
+        # Read before loading: a change committed meanwhile leaves the token stale
+        if generation is None:
+            generation = current_generation()
+        bookings = Booking.objects.filter(status__in=ACTIVE_BOOKING_STATUSES).only(
+            'id', 'bike_id', 'start_time', 'booked_end_time', 'end_time', 'status'
+        ).order_by('start_time')
+        with self._lock:
+            self._bikes = {}
+            self._bookings = {}
+            self._riding = {}
+            for booking in bookings.iterator():
+                self._insert(booking)
+            self._rebuild_bitmaps(slot_of(timezone.now()))
+            self._loaded = True
+            self._generation = generation
+
+    def warm(self):
+        """Build the index at server start instead of on the first booking request"""
+        try:
+            self.rebuild()
+        except DatabaseError as e:
+            # e.g. migrations not applied yet; the first lookup will try again
+            logger.warning('Availability index not built at startup: %s', e)
+
+    def _ensure_loaded(self):
+        generation = current_generation()
+        if not self._loaded or generation != self._generation:
+            self.rebuild(generation)
+            return
+        current_slot = slot_of(timezone.now())
+        if current_slot != self._base_slot:
+            # The horizon moved forward; bookings further out may now fall
+            # inside it, so rebuild the bitmaps (at most once per slot)
+            self._rebuild_bitmaps(current_slot)
+
+    def _bike_bitmap(self, bike_id):
+        bitmap = 0
+        intervals = self._bikes.get(bike_id)
+        if intervals is None:
+            return bitmap
+        horizon_end = self._base_slot + HORIZON_SLOTS
+        for start, end in zip(intervals.starts, intervals.ends):
+            first, last = slot_span(start, end)
+            first = max(first, self._base_slot)
+            last = min(last, horizon_end)
+            if first < last:
+                bitmap |= ((1 << (last - first)) - 1) << (first - self._base_slot)
+        return bitmap
+
+    def _rebuild_bitmaps(self, base_slot):
+        self._base_slot = base_slot
+        bitmaps = {}
+        for bike_id in self._bikes:
+            bitmap = self._bike_bitmap(bike_id)
+            if bitmap:
+                bitmaps[bike_id] = bitmap
+        self._bitmaps = bitmaps
+
+    def _refresh_bitmap(self, bike_id):
+        # Neighbouring bookings can share a partially used slot, so a bike's
+        # bitmap is recomputed from its intervals rather than patched bit by bit
+        bitmap = self._bike_bitmap(bike_id)
+        if bitmap:
+            self._bitmaps[bike_id] = bitmap
+        else:
+            self._bitmaps.pop(bike_id, None)
+
+    def _insert(self, booking):
+        start, end = booking_interval(booking)
+        self._bikes.setdefault(booking.bike_id, BikeIntervals()).add(booking.id, start, end)
+        self._bookings[booking.id] = (booking.bike_id, start, end, booking.status)
+        if booking.status == 'in_use':
+            self._riding.setdefault(booking.bike_id, set()).add(booking.id)
+
+    def _discard(self, booking_id):
+        entry = self._bookings.pop(booking_id, None)
+        if entry is None:
+            return None
+        bike_id, start, _end, booking_status = entry
+        if booking_status == 'in_use':
+            riding = self._riding.get(bike_id)
+            if riding is not None:
+                riding.discard(booking_id)
+                if not riding:
+                    del self._riding[bike_id]
+        intervals = self._bikes.get(bike_id)
+        if intervals is not None:
+            intervals.remove(booking_id, start)
+            if not intervals:
+                del self._bikes[bike_id]
+        return bike_id
+
+    def sync(self, booking):
+        """Bring the index in line with a booking's current row state"""
+        transaction.on_commit(announce_change)
+        with self._lock:
+            if not self._loaded:
+                # The first lookup will read this booking from the database
+                return
+            old_bike_id = self._discard(booking.id)
+            if old_bike_id is not None and old_bike_id != booking.bike_id:
+                self._refresh_bitmap(old_bike_id)
+            if booking.status in ACTIVE_BOOKING_STATUSES:
+                self._insert(booking)
+            self._refresh_bitmap(booking.bike_id)
+
+    def discard(self, booking_id):
+        transaction.on_commit(announce_change)
+        with self._lock:
+            bike_id = self._discard(booking_id)
+            if bike_id is not None:
+                self._refresh_bitmap(bike_id)
+
+    def _conflicts(self, bike_id, start, end, exclude=None):
+        intervals = self._bikes.get(bike_id)
+        if intervals is None:
+            return []
+        found = set(intervals.overlapping(start, end))
+        # A ride in progress holds the bike until it is ended, even after
+        # its booked end time has passed
+        now = timezone.now()
+        for booking_id in self._riding.get(bike_id, ()):
+            _bike_id, ride_start, ride_end, _status = self._bookings[booking_id]
+            if ride_start < end and max(ride_end, now) > start:
+                found.add(booking_id)
+        found.discard(exclude)
+        return sorted(found)
+
+    def conflicts(self, bike_id, start, end, exclude=None):
+        """Return ids of active bookings on `bike_id` that overlap [start, end)"""
+        with self._lock:
+            self._ensure_loaded()
+            return self._conflicts(bike_id, start, end, exclude)
+
+    def is_free(self, bike_id, start, end, exclude=None):
+        """True if no active booking on the bike overlaps [start, end)"""
+        return not self.conflicts(bike_id, start, end, exclude=exclude)
+
+    def has_active_bookings(self, bike_id, exclude=None):
+        with self._lock:
+            self._ensure_loaded()
+            intervals = self._bikes.get(bike_id)
+            if intervals is None:
+                return False
+            return any(booking_id != exclude for booking_id in intervals.booking_ids)
+
+    def free_bikes(self, bike_ids, start, end):
+        """Return the subset of `bike_ids` with no active booking in [start, end)
+
+        Inside the horizon this is one AND of the window mask against each
+        bike's bitmap. Slots are rounded outwards, so a bike whose booking
+        shares a partial slot with the window is reported busy; windows that
+        reach outside the horizon are confirmed against the exact intervals.
+        """
+        with self._lock:
+            self._ensure_loaded()
+            first, last = slot_span(start, end)
+            horizon_end = self._base_slot + HORIZON_SLOTS
+            clipped_first = max(first, self._base_slot)
+            clipped_last = min(last, horizon_end)
+            mask = 0
+            if clipped_first < clipped_last:
+                mask = ((1 << (clipped_last - clipped_first)) - 1) << (clipped_first - self._base_slot)
+            needs_exact_check = first < self._base_slot or last > horizon_end
+
+            bitmaps = self._bitmaps
+            riding = self._riding
+            free = []
+            for bike_id in bike_ids:
+                if bitmaps.get(bike_id, 0) & mask:
+                    continue
+                if (needs_exact_check or bike_id in riding) and self._conflicts(bike_id, start, end):
+                    continue
+                free.append(bike_id)
+            return free
+
+
+availability_index = AvailabilityIndex()
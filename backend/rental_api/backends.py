@@ -1,6 +1,8 @@
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth import get_user_model
 
+from .models import user_email_match
+
 User = get_user_model()
 
 class EmailBackend(ModelBackend):
@@ -9,7 +11,7 @@ class EmailBackend(ModelBackend):
             return None
         
         try:
-            user = User.objects.get(email=email)
+            user = User.objects.get(user_email_match(email))
         except User.DoesNotExist:
             return None
         
@@ -0,0 +1,58 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+from django.db import DatabaseError, connections
+
+from .search import FTS_TABLE, FTS_TRIGGERS
+
+PER_PROCESS_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register()
+def check_shared_cache(app_configs, **kwargs):
+    """JWT user versions, facet/availability versions and sticky pins need a cache every worker shares"""
+    backend = settings.CACHES.get('default', {}).get('BACKEND', PER_PROCESS_CACHES[0])
+    if backend in PER_PROCESS_CACHES:
+        return [Warning(
+            f'The default cache ({backend}) is not shared between worker processes.',
+            hint='Invalidations made in one worker (user roles and passwords, bike facets, availability, '
+                 'read-your-writes pins) will not reach the others; configure a shared CACHES backend '
+                 'or run a single process.',
+            id='rental_api.W001',
+        )]
+    return []
+
+
+@register(Tags.database)
+def check_bike_fts_triggers(app_configs, databases=None, **kwargs):
+    """Rebuilding rental_api_bike on SQLite drops the triggers that keep the search index current"""
+    warnings = []
+    for alias in databases or []:
+        connection = connections[alias]
+        if connection.vendor != 'sqlite':
+            continue
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SELECT type, name FROM sqlite_master WHERE (type = 'table' AND name = %s) "
+                    "OR (type = 'trigger' AND tbl_name = 'rental_api_bike')",
+                    [FTS_TABLE],
+                )
+                found = set(cursor.fetchall())
+        except DatabaseError:
+            continue
+        if ('table', FTS_TABLE) not in found:
+            # Not migrated that far (or not the bike database)
+            continue
+        missing = [trigger for trigger in FTS_TRIGGERS if ('trigger', trigger) not in found]
+        if missing:
+            warnings.append(Warning(
+                f'The bike search triggers {", ".join(missing)} are missing on {alias!r}; '
+                f'{FTS_TABLE} no longer follows rental_api_bike.',
+                hint='A migration rebuilt rental_api_bike. Add one that runs restore_triggers from '
+                     'rental_api/migrations/0032_restore_bike_fts_triggers.py.',
+                id='rental_api.W002',
+            ))
+    return warnings
@@ -0,0 +1,344 @@
+"""
+Incrementally maintained counters behind AdminDashboardStatsView.
+
+Every User, Bike, Booking and Review write turns into a small set of
+(counter name, delta) pairs that are applied with F() updates, so the
+dashboard becomes one indexed read of the DashboardCounter table instead of
+~20 COUNT/SUM queries. Day and month buckets (`bookings_day:2025-08-02`,
+`revenue_month:2025-08`) cover the recent-activity and revenue figures.
+
+Both paths count days in the current time zone (TIME_ZONE): "recent" is
+today and the RECENT_DAYS - 1 days before it, from local midnight, and
+"daily" and "monthly" revenue are today's and this month's local dates, so
+the counters and aggregate_dashboard_stats() always give the same numbers.
+
+Counters only start tracking once `manage.py rebuild_dashboard_counters`
+has filled them; until then the dashboard falls back to
+aggregate_dashboard_stats(), which needs one conditional-aggregation query
+per table, and writes cost nothing extra: each process remembers that the
+counters are cold and asks again at most every COLD_RECHECK seconds. So a
+first rebuild sets TRACKING_MARKER, waits COLD_RECHECK for every process to
+start applying deltas, and only then computes the totals. The totals are
+computed inside the transaction that replaces the rows, after its DELETE
+has taken the write lock, so no write can land between the two.
+"""
+from collections import Counter
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from time import monotonic, sleep
+
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate, TruncMonth
+from django.utils import timezone
+
+from .models import Bike, Booking, DashboardCounter, Review
+
+User = get_user_model()
+
+BUILT_MARKER = 'counters_built'
+# Set before the first rebuild, so writes start moving the counters
+TRACKING_MARKER = 'counters_tracking'
+COLD_RECHECK = 30  # seconds a process trusts "not tracking" before asking again
+RECENT_DAYS = 7
+
+# Fields whose values feed a model's counters
+TRACKED_FIELDS = {
+    User: ('is_staff', 'is_superuser', 'is_verified', 'date_joined'),
+    Bike: ('status',),
+    Booking: ('status', 'created_at', 'total_price'),
+    Review: ('rating', 'created_at'),
+}
+
+
+def _day_key(prefix, moment):
+    return f'{prefix}_day:{timezone.localdate(moment).isoformat()}'
+
+
+def _month_key(prefix, moment):
+    return f"{prefix}_month:{timezone.localdate(moment).strftime('%Y-%m')}"
+
+
+def user_contribution(state):
+    contribution = Counter({'users_total': 1})
+    if state['is_staff']:
+        contribution['users_admin'] += 1
+    if not state['is_staff'] and not state['is_superuser']:
+        contribution['users_customer'] += 1
+    if state['is_verified']:
+        contribution['users_verified'] += 1
+    if state['date_joined']:
+        contribution[_day_key('users', state['date_joined'])] += 1
+    return contribution
+
+
+def bike_contribution(state):
+    return Counter({'bikes_total': 1, f"bikes_{state['status']}": 1})
+
+
+def booking_contribution(state):
+    contribution = Counter({'bookings_total': 1, f"bookings_{state['status']}": 1})
+    created_at = state['created_at']
+    if created_at:
+        contribution[_day_key('bookings', created_at)] += 1
+    if state['status'] == 'completed' and state['total_price']:
+        contribution['revenue_total'] += state['total_price']
+        if created_at:
+            contribution[_day_key('revenue', created_at)] += state['total_price']
+            contribution[_month_key('revenue', created_at)] += state['total_price']
+    return contribution
+
+
+def review_contribution(state):
+    contribution = Counter({'reviews_total': 1, 'reviews_rating_sum': state['rating']})
+    if state['created_at']:
+        contribution[_day_key('reviews', state['created_at'])] += 1
+    return contribution
+
+
+CONTRIBUTIONS = {
+    User: user_contribution,
+    Bike: bike_contribution,
+    Booking: booking_contribution,
+    Review: review_contribution,
+}
+
+
+def snapshot(instance):
+    """Tracked field values of an instance, or None if any were deferred"""
+    values = instance.__dict__
+    fields = TRACKED_FIELDS[type(instance)]
+    if any(field not in values for field in fields):
+        return None
+    return {field: values[field] for field in fields}
+
+
+def remember(instance):
+    """Record the instance's current tracked values as its baseline"""
+    instance._counter_state = snapshot(instance)
+
+
+def stored_state(instance):
+    """Tracked values as last loaded or saved, reading the row if they were deferred"""
+    state = getattr(instance, '_counter_state', None)
+    if state is None:
+        model = type(instance)
+        state = model._default_manager.filter(pk=instance.pk).values(*TRACKED_FIELDS[model]).first()
+    return state
+
+
+def contribution_of(model, state):
+    if state is None:
+        return Counter()
+    return CONTRIBUTIONS[model](state)
+
+
+def diff(model, old_state, new_state):
+    """Counter deltas for a row moving from old_state to new_state (None = absent)"""
+    deltas = Counter(contribution_of(model, new_state))
+    deltas.subtract(contribution_of(model, old_state))
+    return {name: value for name, value in deltas.items() if value}
+
+
+class _Tracking:
+    """This process's memo of whether writes should move the counters"""
+    on = False
+    checked_at = None
+
+
+def counters_tracking():
+    """Whether writes move the counters; cold answers are trusted for COLD_RECHECK seconds"""
+    if _Tracking.on:
+        return True
+    now = monotonic()
+    if _Tracking.checked_at is None or now - _Tracking.checked_at >= COLD_RECHECK:
+        _Tracking.on = DashboardCounter.objects.filter(name=TRACKING_MARKER).exists()
+        _Tracking.checked_at = now
+    return _Tracking.on
+
+
+def forget_tracking():
+    """Make the next write ask the database again (tests, or after emptying the table)"""
+    _Tracking.on = False
+    _Tracking.checked_at = None
+
+
+def apply_deltas(deltas):
+    """Add `deltas` to the counters; a no-op, without queries, while they are cold"""
+    if not deltas or not counters_tracking():
+        return
+    with transaction.atomic():
+        for name, delta in deltas.items():
+            if DashboardCounter.objects.filter(name=name).update(value=F('value') + delta):
+                continue
+            # A brand-new bucket (e.g. the first booking of the day) needs a row
+            try:
+                with transaction.atomic():
+                    DashboardCounter.objects.create(name=name, value=delta)
+            except IntegrityError:
+                DashboardCounter.objects.filter(name=name).update(value=F('value') + delta)
+
+
+def record_change(model, old_state, new_state):
+    apply_deltas(diff(model, old_state, new_state))
+
+
+def rebuild_counters(settle=COLD_RECHECK):
+    """Recompute every counter from the source tables and mark them live
+
+    On the first run, waits `settle` seconds after turning tracking on, so
+    every process applies its writes from before the totals are read.
+    """
+    if not DashboardCounter.objects.filter(name=TRACKING_MARKER).exists():
+        try:
+            DashboardCounter.objects.create(name=TRACKING_MARKER, value=1)
+        except IntegrityError:
+            pass
+        if settle:
+            sleep(settle)
+
+    with transaction.atomic():
+        # First, so the write lock is held while the totals are read
+        DashboardCounter.objects.all().delete()
+        totals = _full_totals()
+        totals[TRACKING_MARKER] = 1
+        totals[BUILT_MARKER] = 1
+        DashboardCounter.objects.bulk_create(
+            [DashboardCounter(name=name, value=value) for name, value in totals.items() if value],
+            batch_size=500,
+        )
+    _Tracking.on = True
+    return len(totals)
+
+
+def _full_totals():
+    """Every counter, aggregated from the source tables"""
+    totals = Counter()
+    for name, value in aggregate_totals().items():
+        totals[name] = value
+
+    for row in User.objects.annotate(day=TruncDate('date_joined')).values('day').annotate(n=Count('id')).order_by():
+        if row['day']:
+            totals[f"users_day:{row['day'].isoformat()}"] = row['n']
+    for row in Review.objects.annotate(day=TruncDate('created_at')).values('day').annotate(n=Count('id')).order_by():
+        if row['day']:
+            totals[f"reviews_day:{row['day'].isoformat()}"] = row['n']
+
+    bookings_by_day = Booking.objects.annotate(day=TruncDate('created_at')).values('day').annotate(
+        n=Count('id'),
+        revenue=Sum('total_price', filter=Q(status='completed')),
+    ).order_by()
+    for row in bookings_by_day:
+        if row['day']:
+            totals[f"bookings_day:{row['day'].isoformat()}"] = row['n']
+            if row['revenue']:
+                totals[f"revenue_day:{row['day'].isoformat()}"] = row['revenue']
+    revenue_by_month = Booking.objects.filter(status='completed').annotate(
+        month=TruncMonth('created_at')
+    ).values('month').annotate(revenue=Sum('total_price')).order_by()
+    for row in revenue_by_month:
+        if row['month'] and row['revenue']:
+            totals[f"revenue_month:{row['month'].strftime('%Y-%m')}"] = row['revenue']
+
+    return totals
+
+
+def aggregate_totals(week_ago=None, today=None):
+    """Counts and sums with one conditional-aggregation query per table
+
+    With `week_ago`/`today` the recent-activity and daily/monthly revenue
+    figures are folded into the same queries.
+    """
+    user_extra, booking_extra, review_extra = {}, {}, {}
+    if week_ago is not None:
+        user_extra['users_recent'] = Count('id', filter=Q(date_joined__gte=week_ago))
+        booking_extra['bookings_recent'] = Count('id', filter=Q(created_at__gte=week_ago))
+        review_extra['reviews_recent'] = Count('id', filter=Q(created_at__gte=week_ago))
+    if today is not None:
+        booking_extra['revenue_daily'] = Sum(
+            'total_price', filter=Q(status='completed', created_at__date=today)
+        )
+        booking_extra['revenue_monthly'] = Sum(
+            'total_price',
+            filter=Q(status='completed', created_at__month=today.month, created_at__year=today.year),
+        )
+
+    users = User.objects.aggregate(
+        users_total=Count('id'),
+        users_admin=Count('id', filter=Q(is_staff=True)),
+        users_customer=Count('id', filter=Q(is_staff=False, is_superuser=False)),
+        users_verified=Count('id', filter=Q(is_verified=True)),
+        **user_extra,
+    )
+    bikes = Bike.objects.aggregate(
+        bikes_total=Count('id'),
+        **{f'bikes_{value}': Count('id', filter=Q(status=value)) for value, _label in Bike.BIKE_STATUS_CHOICES},
+    )
+    bookings = Booking.objects.aggregate(
+        bookings_total=Count('id'),
+        revenue_total=Sum('total_price', filter=Q(status='completed')),
+        **{f'bookings_{value}': Count('id', filter=Q(status=value)) for value, _label in Booking.STATUS_CHOICES},
+        **booking_extra,
+    )
+    reviews = Review.objects.aggregate(
+        reviews_total=Count('id'),
+        reviews_rating_sum=Sum('rating'),
+        **review_extra,
+    )
+    totals = {**users, **bikes, **bookings, **reviews}
+    return {name: value or 0 for name, value in totals.items()}
+
+
+def recent_days(now):
+    """The local dates counted as recent: today and the RECENT_DAYS - 1 before it"""
+    today = timezone.localdate(now)
+    return [today - timedelta(days=offset) for offset in range(RECENT_DAYS)]
+
+
+def recent_since(now):
+    """Local midnight at the start of recent_days(now)"""
+    return timezone.make_aware(datetime.combine(recent_days(now)[-1], time.min))
+
+
+def _recent_day_keys(prefix, now):
+    return [f'{prefix}_day:{day.isoformat()}' for day in recent_days(now)]
+
+
+def read_counters():
+    """Dashboard figures from the counters table, or None while it is cold"""
+    now = timezone.now()
+    recent_keys = {prefix: _recent_day_keys(prefix, now) for prefix in ('bookings', 'users', 'reviews')}
+    daily_revenue_key = _day_key('revenue', now)
+    monthly_revenue_key = _month_key('revenue', now)
+    static_keys = [
+        BUILT_MARKER, 'users_total', 'users_admin', 'users_customer', 'users_verified',
+        'bikes_total', 'bikes_available', 'bikes_booked', 'bikes_in_use',
+        'bookings_total', 'bookings_pending', 'bookings_confirmed', 'bookings_completed', 'bookings_cancelled',
+        'revenue_total', 'reviews_total', 'reviews_rating_sum',
+    ]
+    names = static_keys + [daily_revenue_key, monthly_revenue_key]
+    for keys in recent_keys.values():
+        names.extend(keys)
+
+    values = dict(DashboardCounter.objects.filter(name__in=names).values_list('name', 'value'))
+    if BUILT_MARKER not in values:
+        return None
+
+    counters = {name: values.get(name, Decimal('0')) for name in static_keys}
+    for prefix, keys in recent_keys.items():
+        counters[f'{prefix}_recent'] = sum(values.get(key, 0) for key in keys)
+    counters['revenue_daily'] = values.get(daily_revenue_key, 0)
+    counters['revenue_monthly'] = values.get(monthly_revenue_key, 0)
+    return counters
+
+
+def aggregate_dashboard_stats():
+    """Cold-path equivalent of read_counters(), one query per table"""
+    now = timezone.now()
+    return aggregate_totals(week_ago=recent_since(now), today=timezone.localdate(now))
+
+
+def dashboard_stats():
+    """Figures for AdminDashboardStatsView, from the counters when they are warm"""
+    return read_counters() or aggregate_dashboard_stats()
@@ -0,0 +1,130 @@
+"""
+Facet counts for the bike catalogue.
+
+facet_counts() answers every facet (bike_type, brand, status, price bucket)
+for a filtered Bike queryset with one GROUP BY over all four columns and
+folds the groups in Python, instead of one COUNT per facet value.
+
+Snapshots are cached under a version number: any Bike save/delete (admin
+edits included) and every status change made by rental_api.transitions bump
+the version once their transaction commits, which orphans all older
+snapshots at once. The version and the snapshots live in the shared Django
+cache (settings.CACHES), so a change made in one worker process is seen by
+all of them.
+"""
+import hashlib
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, CharField, Count, Q, Value, When
+
+from .metrics import cache_lookup
+
+VERSION_KEY = 'bike_facets:version'
+SNAPSHOT_TTL = 600  # seconds; the version bump is what keeps snapshots fresh
+
+# (label, lower bound inclusive, upper bound exclusive) on price_per_hour
+PRICE_BUCKETS = [
+    ('0-100', None, 100),
+    ('100-200', 100, 200),
+    ('200-500', 200, 500),
+    ('500+', 500, None),
+]
+
+
+def _price_bucket():
+    whens = []
+    for label, low, high in PRICE_BUCKETS:
+        condition = Q()
+        if low is not None:
+            condition &= Q(price_per_hour__gte=low)
+        if high is not None:
+            condition &= Q(price_per_hour__lt=high)
+        whens.append(When(condition, then=Value(label)))
+    return Case(*whens, output_field=CharField())
+
+
+def _sorted_counts(counts):
+    return dict(sorted(counts.items(), key=lambda item: (-item[1], item[0])))
+
+
+def _groups(queryset):
+    return queryset.order_by().annotate(price_bucket=_price_bucket()).values(
+        'bike_type', 'brand', 'status', 'price_bucket'
+    ).annotate(n=Count('id'))
+
+
+def _fold(groups):
+    facets = {'bike_type': {}, 'brand': {}, 'status': {}}
+    prices = {label: 0 for label, _low, _high in PRICE_BUCKETS}
+    total = 0
+    for group in groups:
+        n = group['n']
+        total += n
+        for facet, counts in facets.items():
+            counts[group[facet]] = counts.get(group[facet], 0) + n
+        prices[group['price_bucket']] += n
+    return {
+        'total': total,
+        **{facet: _sorted_counts(counts) for facet, counts in facets.items()},
+        'price': prices,
+    }
+
+
+def facet_counts(queryset):
+    """Counts per bike_type, brand, status and price bucket for `queryset`, in one query"""
+    return _fold(_groups(queryset))
+
+
+async def afacet_counts(queryset):
+    return _fold([group async for group in _groups(queryset)])
+
+
+def facet_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Seed from the clock so an evicted counter never reuses an old version
+        cache.add(VERSION_KEY, int(time.time() * 1000))
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def invalidate_facets():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        # No version stored yet: the next read seeds a fresh one
+        pass
+
+
+def invalidate_facets_on_commit():
+    transaction.on_commit(invalidate_facets)
+
+
+def _snapshot_key(params):
+    version = facet_version()
+    digest = hashlib.md5(repr(sorted(params.items())).encode()).hexdigest()
+    return version, f'bike_facets:{version}:{digest}'
+
+
+def cached_facet_counts(queryset, params):
+    """facet_counts() for `queryset`, cached under the filter params that produced it"""
+    version, key = _snapshot_key(params)
+    facets = cache.get(key)
+    cache_lookup('facets', facets is not None)
+    if facets is None:
+        facets = facet_counts(queryset)
+        cache.set(key, facets, SNAPSHOT_TTL)
+    return {**facets, 'version': version}
+
+
+async def acached_facet_counts(queryset, params):
+    """cached_facet_counts() for async views; only a cache miss touches the database"""
+    version, key = _snapshot_key(params)
+    facets = cache.get(key)
+    cache_lookup('facets', facets is not None)
+    if facets is None:
+        facets = await afacet_counts(queryset)
+        cache.set(key, facets, SNAPSHOT_TTL)
+    return {**facets, 'version': version}
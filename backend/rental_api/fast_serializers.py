@@ -0,0 +1,191 @@
+"""
+Fast read-only serialization for booking lists.
+
+BookingSerializer and AdminBookingSerializer build every row through DRF's
+field machinery: a model instance per booking (plus a user and a bike for
+the admin list), three SerializerMethodFields and per-field timezone and
+decimal handling. For list responses we instead compile the serializer's
+field layout once into plain accessors over `.values()` rows, so a page of
+bookings is one joined query and one dict per row.
+
+The accessors are derived from the DRF serializers themselves (trimmed by
+the request's ?fields=/?expand=, see rental_api.fieldsets) and mirror
+their to_representation() exactly, so the rendered JSON is byte-identical;
+FastBookingSerializerTest holds both paths to that, and
+`manage.py bench_booking_serializers` checks it again while timing them.
+A field type we do not know how to mirror fails at compile time rather than
+producing different output.
+"""
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+
+from .fieldsets import parse_fieldset
+from .models import Bike
+from .serializers import AdminBookingSerializer, BookingSerializer, duration_hours
+
+
+def _lookup(prefix, source):
+    return prefix + source.replace('.', '__')
+
+
+def _passthrough(key):
+    return lambda row, context: row[key]
+
+
+def _datetime(key, field):
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    if output_format is None or output_format.lower() != ISO_8601 or hasattr(field, 'timezone'):
+        return lambda row, context: None if row[key] is None else field.to_representation(row[key])
+
+    def datetime_to_iso(row, context):
+        value = row[key]
+        if not value:
+            return None
+        tz = context['timezone']
+        if tz is None or value.tzinfo is None:
+            return field.to_representation(value)
+        value = value.astimezone(tz).isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+    return datetime_to_iso
+
+
+def _decimal(key, field):
+    coerce_to_string = getattr(field, 'coerce_to_string', api_settings.COERCE_DECIMAL_TO_STRING)
+    if field.normalize_output or field.localize or not coerce_to_string:
+        return lambda row, context: None if row[key] is None else field.to_representation(row[key])
+    quantize = field.quantize
+
+    def decimal_to_string(row, context):
+        value = row[key]
+        if value is None:
+            return None
+        return '{:f}'.format(quantize(value))
+    return decimal_to_string
+
+
+def _image(key, field):
+    if not getattr(field, 'use_url', api_settings.UPLOADED_FILES_USE_URL):
+        return lambda row, context: row[key] or None
+    storage = Bike._meta.get_field('image').storage
+
+    def image_url(row, context):
+        name = row[key]
+        if not name:
+            return None
+        url = storage.url(name)
+        request = context['request']
+        if request is not None:
+            return request.build_absolute_uri(url)
+        return url
+    return image_url
+
+
+def _duration(prefix, end_field):
+    start_key, end_key = prefix + 'start_time', prefix + end_field
+    return [start_key, end_key], lambda row, context: duration_hours(row[start_key], row[end_key])
+
+
+def _is_available(prefix):
+    key = prefix + 'status'
+    return [key], lambda row, context: row[key] == 'available'
+
+
+def _rating_display(prefix):
+    rating_key, reviews_key = prefix + 'rating', prefix + 'total_reviews'
+    return [rating_key, reviews_key], lambda row, context: f"{row[rating_key]}/5 ({row[reviews_key]} reviews)"
+
+
+# SerializerMethodFields, by name: prefix -> (lookups, accessor)
+METHOD_FIELDS = {
+    'actual_duration_hours': lambda prefix: _duration(prefix, 'actual_end_time'),
+    'original_duration_hours': lambda prefix: _duration(prefix, 'end_time'),
+    'booked_duration_hours': lambda prefix: _duration(prefix, 'booked_end_time'),
+    'is_available': _is_available,
+    'rating_display': _rating_display,
+}
+
+
+def _compile(serializer, prefix=''):
+    """(output key, accessor) pairs for a serializer, plus the .values() lookups they read"""
+    accessors, lookups = [], []
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        if isinstance(field, serializers.SerializerMethodField):
+            if name not in METHOD_FIELDS:
+                raise ImproperlyConfigured(f'No fast accessor for {type(serializer).__name__}.{name}')
+            field_lookups, accessor = METHOD_FIELDS[name](prefix)
+            lookups.extend(field_lookups)
+        elif isinstance(field, serializers.BaseSerializer):
+            nested, nested_lookups = _compile(field, _lookup(prefix, field.source) + '__')
+            lookups.extend(nested_lookups)
+            accessor = lambda row, context, nested=nested: {key: get(row, context) for key, get in nested}
+        else:
+            key = _lookup(prefix, field.source)
+            lookups.append(key)
+            if isinstance(field, serializers.DateTimeField):
+                accessor = _datetime(key, field)
+            elif isinstance(field, serializers.DecimalField):
+                accessor = _decimal(key, field)
+            elif isinstance(field, serializers.ImageField):
+                accessor = _image(key, field)
+            elif isinstance(field, (serializers.CharField, serializers.ChoiceField, serializers.IntegerField,
+                                    serializers.FloatField, serializers.BooleanField,
+                                    serializers.PrimaryKeyRelatedField)):
+                # Values coming out of these columns already are their representation
+                accessor = _passthrough(key)
+            else:
+                raise ImproperlyConfigured(
+                    f'No fast accessor for {type(serializer).__name__}.{name} ({type(field).__name__})'
+                )
+        accessors.append((name, accessor))
+    return accessors, list(dict.fromkeys(lookups))
+
+
+class FastListSerializer:
+    """Read-only list serializer compiled from a DRF serializer class"""
+
+    # Distinct ?fields=/?expand= combinations kept compiled
+    MAX_COMPILED = 64
+
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+        self._compiled = {}
+
+    def _get_compiled(self, request):
+        fieldset = parse_fieldset(request)
+        compiled = self._compiled.get(fieldset)
+        if compiled is None:
+            compiled = _compile(self.serializer_class(context={'fieldset': fieldset}))
+            if len(self._compiled) < self.MAX_COMPILED:
+                self._compiled[fieldset] = compiled
+        return compiled
+
+    def values(self, queryset, request=None, extra=()):
+        """The queryset as the .values() rows the accessors read, plus any `extra` lookups"""
+        _accessors, lookups = self._get_compiled(request)
+        return queryset.values(*dict.fromkeys([*lookups, *extra]))
+
+    def serialize(self, rows, request=None):
+        """Dicts for .values() rows, matching serializer_class(many=True, context={'request': request}).data"""
+        accessors, _lookups = self._get_compiled(request)
+        context = {
+            'timezone': timezone.get_current_timezone() if settings.USE_TZ else None,
+            'request': request,
+        }
+        return [{key: get(row, context) for key, get in accessors} for row in rows]
+
+    def data(self, queryset, request=None):
+        return self.serialize(self.values(queryset, request), request)
+
+    async def adata(self, queryset, request=None):
+        return self.serialize([row async for row in self.values(queryset, request)], request)
+
+
+booking_list_serializer = FastListSerializer(BookingSerializer)
+admin_booking_list_serializer = FastListSerializer(AdminBookingSerializer)
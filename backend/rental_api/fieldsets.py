@@ -0,0 +1,91 @@
+"""
+Sparse fieldsets and relation-aware querysets for list serializers.
+
+GET requests may trim the payload with two query parameters:
+
+    ?fields=id,status,bike      only these top-level keys are rendered
+    ?expand=bike                only these relations are rendered as nested
+                                objects; the others collapse to their pk
+
+Without `expand` every nested relation stays expanded, so existing clients
+see the same payload. Unknown names are ignored.
+
+related_paths() walks a (possibly trimmed) serializer and returns the
+select_related/prefetch_related paths it will touch, so a page costs a
+constant number of queries whatever the serializer nests.
+"""
+from rest_framework import serializers
+
+
+def _names(query_params, param):
+    raw = query_params.get(param)
+    if raw is None:
+        return None
+    return frozenset(name.strip() for name in raw.split(',') if name.strip())
+
+
+def parse_fieldset(request):
+    """(fields, expand) requested by a GET, each a frozenset or None when not given"""
+    if request is None or request.method != 'GET':
+        return None, None
+    query_params = getattr(request, 'query_params', request.GET)
+    return _names(query_params, 'fields'), _names(query_params, 'expand')
+
+
+def apply_fieldset(fields, fieldset):
+    """Drop and collapse entries of a serializer's (unbound) `fields` dict in place"""
+    only, expand = fieldset
+    if only is not None:
+        for name in list(fields):
+            if name not in only:
+                fields.pop(name)
+    if expand is not None:
+        for name, field in list(fields.items()):
+            if isinstance(field, serializers.BaseSerializer) and name not in expand:
+                source = field.source or name
+                fields[name] = serializers.PrimaryKeyRelatedField(
+                    read_only=True, **({'source': source} if source != name else {})
+                )
+
+
+class SparseFieldsetMixin:
+    """Honours ?fields= and ?expand= on GET (see rental_api.fieldsets)
+
+    The fieldset comes from context['fieldset'] when given, otherwise from
+    context['request'].
+    """
+
+    def get_fields(self):
+        fields = super().get_fields()
+        apply_fieldset(fields, self.context.get('fieldset') or parse_fieldset(self.context.get('request')))
+        return fields
+
+
+def related_paths(serializer, prefix=''):
+    """(select_related, prefetch_related) paths for the relations a serializer reads"""
+    select, prefetch = [], []
+    for field in serializer.fields.values():
+        if field.write_only or field.source == '*':
+            continue
+        path = prefix + field.source.replace('.', '__')
+        if isinstance(field, serializers.ListSerializer):
+            prefetch.append(path)
+        elif isinstance(field, serializers.BaseSerializer):
+            select.append(path)
+            nested_select, nested_prefetch = related_paths(field, path + '__')
+            select.extend(nested_select)
+            prefetch.extend(nested_prefetch)
+        elif '__' in path[len(prefix):]:
+            # e.g. source='bike.name' needs the bike row
+            select.append(path.rsplit('__', 1)[0])
+    return list(dict.fromkeys(select)), list(dict.fromkeys(prefetch))
+
+
+def optimize_queryset(queryset, serializer):
+    """`queryset` with the joins and prefetches `serializer` needs"""
+    select, prefetch = related_paths(serializer)
+    if select:
+        queryset = queryset.select_related(*select)
+    if prefetch:
+        queryset = queryset.prefetch_related(*prefetch)
+    return queryset
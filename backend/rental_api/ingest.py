@@ -0,0 +1,170 @@
+"""
+Buffered ingestion for click-tracking events.
+
+AnalyticsTrackView only validates the event and appends it to an in-process
+queue. A background thread writes queued events with bulk_create, either when
+BATCH_SIZE events are waiting or FLUSH_INTERVAL seconds after the first one
+arrived, so landing-page clicks no longer take the database write lock on the
+request path. Whatever is still queued is flushed when the process exits.
+
+Settings (all optional)::
+
+    ANALYTICS_BUFFER = {
+        'ENABLED': True,        # False writes each event synchronously
+        'BATCH_SIZE': 200,
+        'FLUSH_INTERVAL': 2.0,  # seconds
+        'MAX_QUEUE': 10000,     # events beyond this are dropped and counted
+    }
+"""
+import atexit
+import ipaddress
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .models import Analytics
+
+DEFAULTS = {
+    'ENABLED': True,
+    'BATCH_SIZE': 200,
+    'FLUSH_INTERVAL': 2.0,
+    'MAX_QUEUE': 10000,
+}
+
+VALID_ACTIONS = frozenset(value for value, _label in Analytics.ACTION_CHOICES)
+PAGE_MAX_LENGTH = Analytics._meta.get_field('page').max_length
+
+
+def buffer_settings():
+    return {**DEFAULTS, **getattr(settings, 'ANALYTICS_BUFFER', {})}
+
+
+def clean_event(action, page, user_id=None, ip_address=None, user_agent=None):
+    """Cheap validation of one event; returns (event, errors)"""
+    errors = {}
+    # A JSON list or object is unhashable, so check the type before the set lookup
+    if not isinstance(action, str) or action not in VALID_ACTIONS:
+        errors['action'] = [f'"{action}" is not a valid choice.']
+    if not isinstance(page, str):
+        errors['page'] = ['Not a valid string.']
+    elif not page:
+        errors['page'] = ['This field may not be blank.']
+    elif len(page) > PAGE_MAX_LENGTH:
+        errors['page'] = [f'Ensure this field has no more than {PAGE_MAX_LENGTH} characters.']
+    if errors:
+        return None, errors
+
+    if ip_address:
+        try:
+            ip_address = str(ipaddress.ip_address(ip_address.strip()))
+        except ValueError:
+            ip_address = None
+    return {
+        'action': action,
+        'page': page,
+        'user_id': user_id,
+        'ip_address': ip_address or None,
+        'user_agent': user_agent or '',
+        'timestamp': timezone.now(),
+    }, None
+
+
+class AnalyticsBuffer:
+    """Bounded queue of analytics events drained by one writer thread"""
+
+    def __init__(self):
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._stopping = False
+        self.stats = {'enqueued': 0, 'flushed': 0, 'dropped': 0, 'failed': 0, 'batches': 0}
+
+    def _ensure_worker(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name='analytics-ingest', daemon=True)
+            self._thread.start()
+
+    def enqueue(self, event):
+        """Queue an event for the next batch; returns False if it was dropped"""
+        config = buffer_settings()
+        if not config['ENABLED']:
+            self._write([event])
+            return True
+        with self._condition:
+            if len(self._queue) >= config['MAX_QUEUE']:
+                self.stats['dropped'] += 1
+                return False
+            self._queue.append(event)
+            self.stats['enqueued'] += 1
+            self._ensure_worker()
+            # Wake the writer to start the flush timer, or to flush a full batch now
+            if len(self._queue) == 1 or len(self._queue) >= config['BATCH_SIZE']:
+                self._condition.notify()
+        return True
+
+    def _take_batch(self, size):
+        with self._condition:
+            batch = []
+            while self._queue and len(batch) < size:
+                batch.append(self._queue.popleft())
+            return batch
+
+    def _write(self, events):
+        try:
+            Analytics.objects.bulk_create([Analytics(**event) for event in events])
+        except Exception as e:
+            print(f"Analytics flush error: {e}")
+            with self._condition:
+                self.stats['failed'] += len(events)
+            return
+        with self._condition:
+            self.stats['flushed'] += len(events)
+            self.stats['batches'] += 1
+
+    def flush(self):
+        """Write everything currently queued, in BATCH_SIZE chunks"""
+        size = buffer_settings()['BATCH_SIZE']
+        with self._flush_lock:
+            while True:
+                batch = self._take_batch(size)
+                if not batch:
+                    break
+                self._write(batch)
+
+    def _run(self):
+        while True:
+            config = buffer_settings()
+            with self._condition:
+                if not self._queue and not self._stopping:
+                    self._condition.wait()
+                if self._queue and len(self._queue) < config['BATCH_SIZE'] and not self._stopping:
+                    # Give the batch FLUSH_INTERVAL to fill up unless it is already full
+                    self._condition.wait(config['FLUSH_INTERVAL'])
+                stopping = self._stopping
+            self.flush()
+            close_old_connections()
+            if stopping:
+                return
+
+    def shutdown(self, timeout=5.0):
+        """Stop the writer thread after it has flushed the queue"""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout)
+        # Anything enqueued after the worker stopped
+        self.flush()
+
+    def snapshot(self):
+        with self._condition:
+            return {**self.stats, 'queued': len(self._queue)}
+
+
+analytics_buffer = AnalyticsBuffer()
+atexit.register(analytics_buffer.shutdown)
@@ -0,0 +1,313 @@
+"""
+Live bike availability over server-sent events.
+
+Every bike status change (bookings, rides, cancellations; see
+rental_api.transitions) and every admin create/update/delete of a bike is
+published once its transaction commits, as one pre-encoded SSE frame::
+
+    event: bike
+    data: {"bike": 12, "action": "status", "status": "in_use",
+           "previous": "booked", "fleet": {"total": 40, "available": 31, ...}}
+
+The frame is built and the fleet counters are read (from the cached facet
+snapshot) once per change, in the process that made it; each open stream
+then only receives the bytes. A stream starts with a `retry:` hint and an
+`event: fleet` snapshot, sends a comment every HEARTBEAT seconds so proxies
+keep it open, and is closed after MAX_LIFETIME seconds or if the client
+falls more than QUEUE_SIZE events behind (EventSource reconnects and gets a
+fresh snapshot).
+
+Only ASGI requests get a long-lived stream, since waiting costs no thread
+there. Under WSGI an open stream would hold a worker thread for as long as
+an anonymous client stays connected, so the response is just the hint and
+the snapshot: EventSource reconnects after RETRY milliseconds, which makes
+it a poll of the fleet counts.
+
+Worker processes on one host reach each other through Unix datagram
+sockets in FANOUT_DIR, one per process: a stand-in for Redis pub/sub or
+similar when the app runs on more than one host.
+
+Settings (all optional)::
+
+    LIVE_EVENTS = {
+        'FANOUT_DIR': '/tmp/bike_rental_live',  # None keeps events in this process
+        'HEARTBEAT': 15,       # seconds
+        'QUEUE_SIZE': 100,     # events buffered per stream
+        'MAX_LIFETIME': 300,   # seconds before an ASGI stream is closed
+        'RETRY': 10000,        # ms before EventSource reconnects
+    }
+"""
+import asyncio
+import atexit
+import json
+import os
+import queue
+import socket
+import threading
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from rest_framework.renderers import BaseRenderer
+
+from .facets import cached_facet_counts
+from .models import Bike
+
+DEFAULTS = {
+    'FANOUT_DIR': None,
+    'HEARTBEAT': 15,
+    'QUEUE_SIZE': 100,
+    'MAX_LIFETIME': 300,
+    'RETRY': 10000,
+}
+
+HEARTBEAT_FRAME = b': keep-alive\n\n'
+SOCKET_SUFFIX = '.sock'
+
+
+def live_settings():
+    return {**DEFAULTS, **getattr(settings, 'LIVE_EVENTS', {})}
+
+
+def retry_frame():
+    return f"retry: {int(live_settings()['RETRY'])}\n\n".encode()
+
+
+def encode_event(event, data):
+    payload = json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':'))
+    return f'event: {event}\ndata: {payload}\n\n'.encode()
+
+
+class EventStreamRenderer(BaseRenderer):
+    """Lets `Accept: text/event-stream` through content negotiation; the view streams its own body"""
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        # Only error responses get here
+        return encode_event('error', data)
+
+
+def fleet_counts(facets):
+    """The bike_stats figures, from a facet snapshot"""
+    return {
+        'total': facets['total'],
+        'available': facets['status'].get('available', 0),
+        'booked': facets['status'].get('booked', 0),
+        'in_use': facets['status'].get('in_use', 0),
+    }
+
+
+class Subscription:
+    """One open stream's queue of encoded frames; fed from any thread"""
+
+    def __init__(self, maxsize, loop=None):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize) if loop is not None else queue.Queue(maxsize)
+        self.overflowed = False
+
+    def put(self, frame):
+        if self.loop is not None:
+            try:
+                self.loop.call_soon_threadsafe(self._put_nowait, frame)
+            except RuntimeError:
+                # The stream's event loop is gone without it unsubscribing
+                self.overflowed = True
+        else:
+            self._put_nowait(frame)
+
+    def _put_nowait(self, frame):
+        try:
+            self.queue.put_nowait(frame)
+        except (asyncio.QueueFull, queue.Full):
+            self.overflowed = True
+
+    def get(self, timeout):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    async def aget(self, timeout):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class UnixSocketFanout:
+    """Relays frames to the other processes that have a socket in `directory`"""
+
+    def __init__(self, directory, on_frame):
+        self.directory = directory
+        self.on_frame = on_frame
+        self.path = None
+        self._sock = None
+        self._pid = None
+
+    def listen(self):
+        """Bind this process's socket, once per process (so again after a fork)"""
+        if self._pid == os.getpid():
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        self._pid = os.getpid()
+        self.path = os.path.join(self.directory, f'{self._pid}{SOCKET_SUFFIX}')
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.bind(self.path)
+        threading.Thread(target=self._listen, args=(self._sock,), name='live-events-fanout', daemon=True).start()
+
+    def _listen(self, sock):
+        while True:
+            try:
+                frame = sock.recv(65536)
+            except OSError:
+                return
+            self.on_frame(frame)
+
+    def peers(self):
+        """Socket paths of the other listening processes"""
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        own = self.path if self._pid == os.getpid() else None
+        return [
+            os.path.join(self.directory, name) for name in names
+            if name.endswith(SOCKET_SUFFIX) and os.path.join(self.directory, name) != own
+        ]
+
+    def send(self, frame):
+        sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        # A process too busy to drain its socket misses the frame rather than blocking us
+        sender.setblocking(False)
+        try:
+            for path in self.peers():
+                try:
+                    sender.sendto(frame, path)
+                except (ConnectionRefusedError, FileNotFoundError):
+                    # Left behind by a process that is gone
+                    try:
+                        os.unlink(path)
+                    except OSError:
+                        pass
+                except OSError as e:
+                    print(f"Live event fan-out to {path} failed: {e}")
+        finally:
+            sender.close()
+
+    def close(self):
+        if self._sock is not None and self._pid == os.getpid():
+            self._sock.close()
+            try:
+                os.unlink(self.path)
+            except OSError:
+                pass
+        self._sock = self._pid = None
+
+
+class LiveEventBroker:
+    """In-process pub/sub of encoded SSE frames, with optional fan-out to sibling processes"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = set()
+        self._fanout = None
+
+    def _get_fanout(self):
+        directory = live_settings()['FANOUT_DIR']
+        if not directory or not hasattr(socket, 'AF_UNIX'):
+            return None
+        directory = str(directory)
+        if self._fanout is None or self._fanout.directory != directory:
+            if self._fanout is not None:
+                self._fanout.close()
+            self._fanout = UnixSocketFanout(directory, self.deliver)
+        return self._fanout
+
+    def subscribe(self, loop=None):
+        fanout = self._get_fanout()
+        if fanout is not None:
+            # Hear changes made by the other workers from now on
+            fanout.listen()
+        subscription = Subscription(live_settings()['QUEUE_SIZE'], loop)
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def has_listeners(self):
+        """Whether a change would reach any stream, here or in another process"""
+        if self._subscriptions:
+            return True
+        fanout = self._get_fanout()
+        return fanout is not None and bool(fanout.peers())
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def deliver(self, frame):
+        """Hand a frame to this process's streams"""
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            subscription.put(frame)
+
+    def publish(self, frame):
+        self.deliver(frame)
+        fanout = self._get_fanout()
+        if fanout is not None:
+            try:
+                fanout.send(frame)
+            except OSError as e:
+                print(f"Live event fan-out error: {e}")
+
+    async def astream(self, first_frame):
+        """Frames for an ASGI response, for at most MAX_LIFETIME seconds; costs no thread while waiting"""
+        loop = asyncio.get_running_loop()
+        subscription = self.subscribe(loop)
+        config = live_settings()
+        deadline = loop.time() + config['MAX_LIFETIME']
+        try:
+            yield retry_frame() + first_frame
+            while not subscription.overflowed:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    return
+                frame = await subscription.aget(min(config['HEARTBEAT'], remaining))
+                if frame is None and loop.time() >= deadline:
+                    return
+                yield frame or HEARTBEAT_FRAME
+        finally:
+            self.unsubscribe(subscription)
+
+    def close(self):
+        if self._fanout is not None:
+            self._fanout.close()
+
+    def __len__(self):
+        return len(self._subscriptions)
+
+
+live_events = LiveEventBroker()
+atexit.register(live_events.close)
+
+
+def publish_bike_change(bike_id, action, status, previous):
+    """Send one change with the fleet counters as they are now"""
+    try:
+        if not live_events.has_listeners():
+            return
+        fleet = fleet_counts(cached_facet_counts(Bike.objects.all(), {}))
+        live_events.publish(encode_event('bike', {
+            'bike': bike_id, 'action': action, 'status': status, 'previous': previous, 'fleet': fleet,
+        }))
+    except Exception as e:
+        # Never let a live-update problem fail the request that made the change
+        print(f"Live event publish error for bike {bike_id}: {e}")
+
+
+def publish_bike_change_on_commit(bike_id, action, status, previous=None):
+    transaction.on_commit(lambda: publish_bike_change(bike_id, action, status, previous))
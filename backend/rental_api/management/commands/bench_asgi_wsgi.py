@@ -0,0 +1,271 @@
+import asyncio
+import importlib.util
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from rental_api.management.commands.bench_sqlite_writes import production_profile, scratch_databases
+from rental_api.models import Bike, Booking, Review, User
+from rental_api.routers import TELEMETRY_DB, telemetry_enabled
+
+SETTINGS_MODULE = 'bench_settings'
+
+PUBLIC_PATHS = [
+    '/api/v1/bikes/',
+    '/api/v1/bikes/?search=trek&status=available',
+    '/api/v1/bikes/stats/',
+    '/api/v1/reviews/',
+    '/api/v1/admin/contact-info/',
+]
+# Polled by signed-in users
+USER_PATHS = [
+    '/api/v1/user/current-bookings/',
+    '/api/v1/user/dashboard-stats/',
+]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def http_get(reader, writer, path, headers):
+    """One keep-alive GET; returns (status, whether the server closed the connection)"""
+    writer.write(f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\n{headers}\r\n'.encode('latin-1'))
+    await writer.drain()
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError('connection closed')
+    status = int(status_line.split()[1])
+    length, chunked, closing = None, False, False
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _sep, value = line.decode('latin-1').partition(':')
+        name, value = name.strip().lower(), value.strip().lower()
+        if name == 'content-length':
+            length = int(value)
+        elif name == 'transfer-encoding':
+            chunked = 'chunked' in value
+        elif name == 'connection':
+            closing = value == 'close'
+    if chunked:
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if not size:
+                break
+    elif length is not None:
+        await reader.readexactly(length)
+    else:
+        await reader.read()
+        closing = True
+    return status, closing
+
+
+class Command(BaseCommand):
+    help = (
+        'Serve the async read endpoints from a seeded scratch copy of the databases, once with gunicorn '
+        '(WSGI, gthread workers) and once with uvicorn (ASGI), and compare throughput, latency and '
+        'failures as the number of concurrent keep-alive connections grows. The real database is not touched.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--connections', default='16,64,256',
+                            help='Comma-separated concurrent connection counts to try')
+        parser.add_argument('--duration', type=float, default=10.0, help='Seconds per connection count')
+        parser.add_argument('--workers', type=int, default=2, help='Server processes, for both servers')
+        parser.add_argument('--threads', type=int, default=8, help='Threads per gunicorn worker')
+        parser.add_argument('--timeout', type=float, default=10.0, help='Seconds before a request counts as failed')
+        parser.add_argument('--bikes', type=int, default=200)
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--servers', default='wsgi,asgi')
+
+    def handle(self, *args, **options):
+        for module in ('gunicorn', 'uvicorn'):
+            if importlib.util.find_spec(module) is None:
+                raise CommandError(f'{module} is not installed (pip install -r requirements.txt).')
+        if connections['default'].vendor != 'sqlite':
+            raise CommandError('The scratch copies are SQLite files; the default database is not SQLite.')
+        levels = [int(level) for level in options['connections'].split(',')]
+
+        aliases = ['default'] + ([TELEMETRY_DB] if telemetry_enabled() else [])
+        workdir = tempfile.mkdtemp(prefix='bench-asgi-')
+        try:
+            self.stdout.write('Seeding scratch databases...')
+            paths = {alias: os.path.join(workdir, f'{alias}.sqlite3') for alias in aliases}
+            with scratch_databases({alias: {'NAME': path, 'CONN_MAX_AGE': 0, 'OPTIONS': {}}
+                                    for alias, path in paths.items()}):
+                for alias in aliases:
+                    call_command('migrate', database=alias, verbosity=0)
+                tokens = self._seed(options['bikes'], options['users'])
+            self._write_settings(workdir, paths)
+
+            for server in options['servers'].split(','):
+                port = free_port()
+                process = self._start(server, port, workdir, options)
+                try:
+                    self._wait_ready(process, port)
+                    for level in levels:
+                        self._report(server, level, asyncio.run(self._load(port, level, tokens, options)))
+                finally:
+                    process.terminate()
+                    try:
+                        process.wait(10)
+                    except subprocess.TimeoutExpired:
+                        process.kill()
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def _seed(self, bike_count, user_count):
+        now = timezone.now()
+        bikes = Bike.objects.bulk_create([
+            Bike(
+                name=f'Bench {i}', brand=['Trek', 'Giant', 'Hero'][i % 3], model=f'B{i}',
+                bike_type=['mountain', 'road', 'city', 'electric'][i % 4],
+                status=['available', 'booked'][i % 2], price_per_hour=Decimal(80 + i % 50),
+            )
+            for i in range(bike_count)
+        ])
+        users = User.objects.bulk_create([
+            User(username=f'bench{i}', email=f'bench{i}@example.com', is_verified=True) for i in range(user_count)
+        ])
+        User.objects.create(username='benchadmin', email='benchadmin@example.com', is_staff=True)
+        statuses = [status for status, _label in Booking.STATUS_CHOICES]
+        Booking.objects.bulk_create([
+            Booking(
+                user=users[i % user_count], bike=bikes[i % bike_count], status=statuses[i % len(statuses)],
+                start_time=now - timedelta(hours=i), booked_end_time=now - timedelta(hours=i) + timedelta(hours=2),
+                total_price=Decimal('150.00'),
+            )
+            for i in range(user_count * 40)
+        ])
+        Review.objects.bulk_create([
+            Review(user=users[i % user_count], bike=bikes[i % bike_count], rating=1 + i % 5, comment='ok')
+            for i in range(bike_count * 5)
+        ])
+        return [str(RefreshToken.for_user(user).access_token) for user in users]
+
+    def _write_settings(self, workdir, paths):
+        # Both servers load the same settings: the project's, on the scratch
+        # files with the production SQLite profile
+        databases = {
+            alias: {**settings.DATABASES[alias], **production_profile(alias), 'NAME': path}
+            for alias, path in paths.items()
+        }
+        with open(os.path.join(workdir, f'{SETTINGS_MODULE}.py'), 'w') as f:
+            f.write(
+                'from backend.settings import *\n\n'
+                'DEBUG = False\n'
+                "ALLOWED_HOSTS = ['*']\n"
+                f'DATABASES = {databases!r}\n'
+                "READ_REPLICAS = {**READ_REPLICAS, 'ALIASES': []}\n"
+            )
+
+    def _start(self, server, port, workdir, options):
+        bind = ['--bind', f'127.0.0.1:{port}']
+        commands = {
+            'wsgi': ['gunicorn', 'backend.wsgi:application', *bind, '--workers', str(options['workers']),
+                     '--worker-class', 'gthread', '--threads', str(options['threads']), '--log-level', 'warning'],
+            'asgi': ['uvicorn', 'backend.asgi:application', '--host', '127.0.0.1', '--port', str(port),
+                     '--workers', str(options['workers']), '--log-level', 'warning', '--no-access-log'],
+        }
+        if server not in commands:
+            raise CommandError(f'Unknown server {server!r}; use wsgi and/or asgi.')
+        env = {
+            **os.environ,
+            'DJANGO_SETTINGS_MODULE': SETTINGS_MODULE,
+            'PYTHONPATH': os.pathsep.join([workdir, str(settings.BASE_DIR), os.environ.get('PYTHONPATH', '')]),
+        }
+        return subprocess.Popen([sys.executable, '-m', *commands[server]], cwd=settings.BASE_DIR, env=env)
+
+    def _wait_ready(self, process, port, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise CommandError(f'Server exited with code {process.returncode}')
+            try:
+                status = asyncio.run(self._get_once(port, PUBLIC_PATHS[0]))
+                if status == 200:
+                    return
+            except OSError:
+                pass
+            time.sleep(0.2)
+        raise CommandError('Server did not come up in time')
+
+    async def _get_once(self, port, path):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        try:
+            status, _closing = await http_get(reader, writer, path, 'Connection: close\r\n')
+            return status
+        finally:
+            writer.close()
+
+    async def _load(self, port, connection_count, tokens, options):
+        latencies = []
+        counts = {'ok': 0, 'errors': 0}
+        deadline = time.monotonic() + options['duration']
+
+        async def client(index):
+            paths = [(path, '') for path in PUBLIC_PATHS]
+            auth = f'Authorization: Bearer {tokens[index % len(tokens)]}\r\n'
+            paths += [(path, auth) for path in USER_PATHS]
+            reader = writer = None
+            i = index
+            while time.monotonic() < deadline:
+                path, headers = paths[i % len(paths)]
+                i += 1
+                started = time.perf_counter()
+                try:
+                    if writer is None:
+                        reader, writer = await asyncio.wait_for(
+                            asyncio.open_connection('127.0.0.1', port), options['timeout']
+                        )
+                    status, closing = await asyncio.wait_for(
+                        http_get(reader, writer, path, headers), options['timeout']
+                    )
+                except (OSError, ValueError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+                    counts['errors'] += 1
+                    status, closing = None, True
+                if status == 200:
+                    counts['ok'] += 1
+                    latencies.append(time.perf_counter() - started)
+                elif status is not None:
+                    counts['errors'] += 1
+                if closing and writer is not None:
+                    writer.close()
+                    reader = writer = None
+            if writer is not None:
+                writer.close()
+
+        started = time.perf_counter()
+        await asyncio.gather(*(client(i) for i in range(connection_count)))
+        elapsed = time.perf_counter() - started
+        latencies.sort()
+        return {
+            'elapsed': elapsed,
+            **counts,
+            'p50': latencies[len(latencies) // 2] if latencies else 0,
+            'p99': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] if latencies else 0,
+        }
+
+    def _report(self, server, level, result):
+        self.stdout.write(
+            f"{server:>5} {level:>5} conns: {result['ok'] / result['elapsed']:7.0f} req/s, {result['ok']} ok, "
+            f"{result['errors']} failed, p50 {result['p50'] * 1000:.1f} ms, p99 {result['p99'] * 1000:.1f} ms"
+        )
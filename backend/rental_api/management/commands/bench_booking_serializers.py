@@ -0,0 +1,95 @@
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+
+from rental_api.fast_serializers import admin_booking_list_serializer, booking_list_serializer
+from rental_api.models import Bike, Booking, User
+from rental_api.serializers import AdminBookingSerializer, BookingSerializer
+
+STATUSES = ['pending', 'confirmed', 'in_use', 'completed', 'cancelled']
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Time BookingSerializer/AdminBookingSerializer against the fast .values() path on seeded '
+        'bookings and check both render the same JSON. Seed data is rolled back afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000], help='Booking counts to test')
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--bikes', type=int, default=50)
+
+    def handle(self, *args, **options):
+        for size in options['sizes']:
+            try:
+                with transaction.atomic():
+                    bikes = self._seed(size, options['users'], options['bikes'])
+                    queryset = Booking.objects.filter(bike__in=bikes).order_by('-created_at', '-id')
+                    self._compare('BookingSerializer', BookingSerializer, booking_list_serializer, queryset)
+                    self._compare(
+                        'AdminBookingSerializer', AdminBookingSerializer, admin_booking_list_serializer, queryset
+                    )
+                    raise Rollback
+            except Rollback:
+                pass
+
+    def _seed(self, size, user_count, bike_count):
+        self.stdout.write(f'Seeding {size} bookings...')
+        tag = int(time.time())
+        users = User.objects.bulk_create([
+            User(username=f'bench{tag}_{i}', email=f'bench{tag}_{i}@example.com', full_name=f'Bench User {i}')
+            for i in range(user_count)
+        ])
+        bikes = Bike.objects.bulk_create([
+            Bike(
+                name=f'Bench {i}', brand='Trek', model=f'M{i}', bike_type='mountain',
+                price_per_hour=Decimal('150.00') + i, image=f'bikes/bench{i}.jpg' if i % 2 else None,
+            )
+            for i in range(bike_count)
+        ])
+        now = timezone.now()
+        bookings = []
+        for i in range(size):
+            start = now - timedelta(minutes=37 * i)
+            booking_status = STATUSES[i % len(STATUSES)]
+            finished = booking_status == 'completed'
+            bookings.append(Booking(
+                user=users[i % user_count],
+                bike=bikes[i % bike_count],
+                start_time=start,
+                booked_end_time=start + timedelta(minutes=30 + i % 240),
+                end_time=start + timedelta(hours=2) if i % 7 == 0 else None,
+                actual_end_time=start + timedelta(minutes=45 + i % 90) if finished else None,
+                total_price=Decimal('300.50') if finished else None,
+                actual_total_price=Decimal(i % 1000) / 4 if finished else None,
+                status=booking_status,
+            ))
+        Booking.objects.bulk_create(bookings, batch_size=2000)
+        return bikes
+
+    def _compare(self, label, serializer_class, fast_serializer, queryset):
+        started = time.perf_counter()
+        slow = serializer_class(queryset.select_related('user', 'bike'), many=True).data
+        slow_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        fast = fast_serializer.data(queryset)
+        fast_seconds = time.perf_counter() - started
+
+        renderer = JSONRenderer()
+        if renderer.render(slow) != renderer.render(fast):
+            raise CommandError(f'{label}: fast path output differs from the serializer')
+        self.stdout.write(
+            f'  {label:<24} {len(fast):>7} rows  serializer {slow_seconds:8.3f}s  '
+            f'fast {fast_seconds:8.3f}s  ({slow_seconds / fast_seconds:.1f}x)'
+        )
@@ -0,0 +1,158 @@
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, close_old_connections, connections
+from django.utils import timezone
+
+from rental_api.availability import availability_index
+from rental_api.models import Analytics, Bike, User
+from rental_api.routers import TELEMETRY_DB, telemetry_enabled
+from rental_api.transitions import BookingTransitionError, create_booking
+
+
+def production_profile(alias):
+    from backend.settings_production import DATABASES
+    profile = dict(DATABASES.get(alias, DATABASES['default']))
+    profile.pop('NAME')
+    return profile
+
+
+@contextmanager
+def scratch_databases(overrides):
+    """Point each alias at another file/profile, for every thread"""
+    originals = {alias: connections.settings[alias] for alias in overrides}
+    connections.close_all()
+    for alias, settings_dict in overrides.items():
+        connections.settings[alias] = {**originals[alias], **settings_dict}
+        if hasattr(connections._connections, alias):
+            del connections[alias]
+    try:
+        yield
+    finally:
+        connections.close_all()
+        for alias, original in originals.items():
+            connections.settings[alias] = original
+            if hasattr(connections._connections, alias):
+                del connections[alias]
+
+
+class Command(BaseCommand):
+    help = (
+        'Run N threads of booking and analytics writes against scratch SQLite files, once with the '
+        'development database settings and once with the settings_production profile, and compare '
+        'throughput and "database is locked" failures. The real database is not touched.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--ops', type=int, default=200, help='Writes per thread, half bookings, half events')
+        parser.add_argument('--bikes', type=int, default=20)
+
+    def handle(self, *args, **options):
+        if connections['default'].vendor != 'sqlite':
+            raise CommandError('This benchmark compares SQLite profiles; the default database is not SQLite.')
+
+        # Bookings go to default and events to the telemetry database, when there is one
+        aliases = ['default'] + ([TELEMETRY_DB] if telemetry_enabled() else [])
+        workdir = tempfile.mkdtemp(prefix='bench-sqlite-')
+        profiles = [
+            ('development', {alias: {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False, 'OPTIONS': {}}
+                             for alias in aliases}),
+            ('production', {alias: production_profile(alias) for alias in aliases}),
+        ]
+        try:
+            self.stdout.write('Migrating scratch databases...')
+            templates = {alias: os.path.join(workdir, f'template-{alias}.sqlite3') for alias in aliases}
+            with scratch_databases({alias: {'NAME': path, 'CONN_MAX_AGE': 0, 'OPTIONS': {}}
+                                    for alias, path in templates.items()}):
+                for alias in aliases:
+                    call_command('migrate', database=alias, verbosity=0)
+                self._seed(options['threads'], options['bikes'])
+
+            for label, profile in profiles:
+                overrides = {}
+                for alias in aliases:
+                    path = os.path.join(workdir, f'{label}-{alias}.sqlite3')
+                    shutil.copyfile(templates[alias], path)
+                    overrides[alias] = {**profile[alias], 'NAME': path}
+                with scratch_databases(overrides):
+                    availability_index.reset()
+                    self._report(label, self._run(options['threads'], options['ops']))
+        finally:
+            availability_index.reset()
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def _seed(self, thread_count, bike_count):
+        User.objects.bulk_create([
+            User(username=f'bench{i}', email=f'bench{i}@example.com', is_verified=True) for i in range(thread_count)
+        ])
+        Bike.objects.bulk_create([
+            Bike(name=f'Bench {i}', brand='Trek', model=f'B{i}', bike_type='city', price_per_hour=Decimal('100.00'))
+            for i in range(bike_count)
+        ])
+
+    def _run(self, thread_count, ops):
+        users = list(User.objects.order_by('id'))
+        bike_ids = list(Bike.objects.order_by('id').values_list('id', flat=True))
+        first_start = timezone.now() + timedelta(days=1)
+        barrier = threading.Barrier(thread_count)
+        outcomes = []
+        latencies = []
+        lock = threading.Lock()
+
+        def work(index):
+            barrier.wait()
+            for i in range(ops):
+                started = time.perf_counter()
+                try:
+                    if i % 2:
+                        Analytics.objects.create(action='browse_bikes_clicked', page='home')
+                    else:
+                        # A window of its own, so every booking is free to succeed
+                        slot = index * ops + i
+                        start = first_start + timedelta(hours=slot)
+                        create_booking(users[index], bike_ids[slot % len(bike_ids)], start, start + timedelta(minutes=30))
+                    outcome = 'ok'
+                except OperationalError:
+                    outcome = 'locked'
+                except BookingTransitionError:
+                    outcome = 'rejected'
+                finally:
+                    # End of a "request": CONN_MAX_AGE decides whether the connection survives
+                    close_old_connections()
+                with lock:
+                    outcomes.append(outcome)
+                    latencies.append(time.perf_counter() - started)
+            connections.close_all()
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=work, args=(i,)) for i in range(thread_count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        latencies.sort()
+        return {
+            'elapsed': elapsed,
+            'ok': outcomes.count('ok'),
+            'locked': outcomes.count('locked'),
+            'rejected': outcomes.count('rejected'),
+            'p50': latencies[len(latencies) // 2],
+            'p99': latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+        }
+
+    def _report(self, label, result):
+        self.stdout.write(
+            f"{label:>12}: {result['ok'] / result['elapsed']:7.0f} writes/s, {result['ok']} ok, "
+            f"{result['locked']} locked, {result['rejected']} rejected, "
+            f"p50 {result['p50'] * 1000:.1f} ms, p99 {result['p99'] * 1000:.1f} ms"
+        )
@@ -0,0 +1,72 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import override_settings
+
+from rental_api.models import User
+from rental_api.usernames import create_user_with_unique_username
+
+
+class Rollback(Exception):
+    pass
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def legacy_create(prefix, password, **fields):
+    """The old exists()-per-collision loop, kept here for comparison"""
+    username = prefix
+    counter = 1
+    while User.objects.filter(username=username).exists():
+        username = f"{prefix}{counter}"
+        counter += 1
+    user = User(username=username, **fields)
+    user.set_password(password)
+    user.save()
+    return user
+
+
+class Command(BaseCommand):
+    help = (
+        'Register many users whose emails share a local part, with the counter-based allocator and '
+        'the old exists() loop. Password hashing is switched to MD5 so allocation dominates; '
+        'everything is rolled back afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000, help='Signups with the allocator')
+        parser.add_argument('--legacy-users', type=int, default=1000, help='Signups with the old loop (quadratic)')
+        parser.add_argument('--prefix', default='info')
+
+    def handle(self, *args, **options):
+        with override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher']):
+            self._run('allocator', create_user_with_unique_username, options['users'], options['prefix'])
+            if options['legacy_users']:
+                self._run('legacy loop', legacy_create, options['legacy_users'], options['prefix'])
+
+    def _run(self, label, create, count, prefix):
+        counter = QueryCounter()
+        try:
+            with transaction.atomic():
+                tag = int(time.time())
+                started = time.perf_counter()
+                with connection.execute_wrapper(counter):
+                    for i in range(count):
+                        user = create(prefix, 'bench-password', email=f'{prefix}@bench{tag}-{i}.example.com')
+                elapsed = time.perf_counter() - started
+                last = user.username
+                raise Rollback
+        except Rollback:
+            pass
+        self.stdout.write(
+            f'{label:>12}: {count} signups in {elapsed:.2f}s '
+            f'({count / elapsed:.0f}/s, {counter.count / count:.1f} queries each, last username {last})'
+        )
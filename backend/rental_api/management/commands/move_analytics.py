@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+from rental_api.models import Analytics, AnalyticsDailyRollup, AnalyticsHourlyRollup, RollupWatermark
+from rental_api.routers import TELEMETRY_DB, telemetry_enabled
+
+MODELS = (Analytics, AnalyticsHourlyRollup, AnalyticsDailyRollup, RollupWatermark)
+
+
+class Command(BaseCommand):
+    help = (
+        'Copy Analytics events, rollups and the rollup watermark from the default database into the '
+        'analytics database (run `migrate --database=analytics` first). Ids are kept, so the watermark '
+        'stays valid.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--delete', action='store_true', help='Empty the old tables on default afterwards')
+        parser.add_argument(
+            '--skip-existing', action='store_true',
+            help='Skip tables that already have rows on the analytics database instead of stopping, '
+                 'so the command can run on every deploy',
+        )
+
+    def handle(self, *args, **options):
+        if not telemetry_enabled():
+            raise CommandError(f'DATABASES has no {TELEMETRY_DB!r} alias to move telemetry to.')
+        tables = connections[DEFAULT_DB_ALIAS].introspection.table_names()
+        for model in MODELS:
+            if model._meta.db_table not in tables:
+                self.stdout.write(f'{model.__name__}: no table on {DEFAULT_DB_ALIAS}, skipped')
+                continue
+            if model.objects.using(TELEMETRY_DB).exists():
+                if options['skip_existing']:
+                    self.stdout.write(f'{model.__name__}: already on {TELEMETRY_DB}, skipped')
+                    continue
+                raise CommandError(f'{model.__name__} already has rows on {TELEMETRY_DB}; refusing to merge.')
+            copied = self._copy(model, options['batch_size'])
+            self.stdout.write(f'{model.__name__}: copied {copied} rows')
+            if options['delete']:
+                model.objects.using(DEFAULT_DB_ALIAS).all().delete()
+        self.stdout.write(self.style.SUCCESS('Telemetry moved.'))
+
+    def _copy(self, model, batch_size):
+        source = model.objects.using(DEFAULT_DB_ALIAS).order_by('pk')
+        copied = 0
+        last_pk = None
+        with transaction.atomic(using=TELEMETRY_DB):
+            while True:
+                batch = source if last_pk is None else source.filter(pk__gt=last_pk)
+                rows = list(batch[:batch_size])
+                if not rows:
+                    return copied
+                model.objects.using(TELEMETRY_DB).bulk_create(rows)
+                copied += len(rows)
+                last_pk = rows[-1].pk
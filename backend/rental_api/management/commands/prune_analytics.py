@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from rental_api.rollups import prune_events
+
+
+class Command(BaseCommand):
+    help = 'Delete raw Analytics events older than the retention period that are already in the rollups'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.ANALYTICS_RETENTION_DAYS,
+                            help='Keep this many days of raw events (default: ANALYTICS_RETENTION_DAYS)')
+        parser.add_argument('--batch-size', type=int, default=10000, help='Events deleted per transaction')
+
+    def handle(self, *args, **options):
+        removed = prune_events(options['days'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Pruned {removed} events older than {options['days']} days."))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from rental_api.counters import COLD_RECHECK, rebuild_counters
+
+
+class Command(BaseCommand):
+    help = 'Recompute the admin dashboard counters from the User, Bike, Booking and Review tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--settle', type=int, default=COLD_RECHECK,
+            help='Seconds to wait on the first run for every process to start tracking writes',
+        )
+
+    def handle(self, *args, **options):
+        written = rebuild_counters(settle=options['settle'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {written} dashboard counters.'))
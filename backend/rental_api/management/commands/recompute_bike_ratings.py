@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from rental_api.ratings import recompute_ratings
+
+
+class Command(BaseCommand):
+    help = 'Rebuild every bike\'s rating_sum, total_reviews and rating from the Review table in one pass'
+
+    def handle(self, *args, **options):
+        rated = recompute_ratings()
+        self.stdout.write(self.style.SUCCESS(f'Recomputed ratings; {rated} bikes have reviews.'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from rental_api.popularity import recompute_popularity
+
+
+class Command(BaseCommand):
+    help = 'Rescore every bike\'s popularity (run periodically; the booking window slides)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Bikes per UPDATE')
+
+    def handle(self, *args, **options):
+        scored = recompute_popularity(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rescored {scored} bikes.'))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from rental_api.rollups import reset_rollups, rollup_analytics
+
+
+class Command(BaseCommand):
+    help = 'Fold Analytics events past the high-water mark into the hourly and daily rollup tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50000, help='Analytics rows per transaction')
+        parser.add_argument('--rebuild', action='store_true', help='Drop the rollups and reprocess every event')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            reset_rollups()
+        rows, buckets = rollup_analytics(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rolled up {rows} events into {buckets} bucket updates.'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from rental_api.outbox import drain
+
+
+class Command(BaseCommand):
+    help = 'Send every due message in the email outbox, one SMTP session per batch'
+
+    def handle(self, *args, **options):
+        results = drain()
+        self.stdout.write(self.style.SUCCESS(
+            f"Sent {results['sent']} emails; {results['retried']} will be retried, {results['failed']} failed."
+        ))
@@ -0,0 +1,351 @@
+"""
+Request, database and cache metrics, in Prometheus text format.
+
+MetricsMiddleware times every request into a latency histogram per resolved
+view name and method, counts responses by status code, and keeps an
+in-flight gauge. Every connection, on every alias, counts its opens and
+times its queries; cache_lookup() counts hits and misses of the facet
+snapshot and JWT user caches.
+
+Recording is lock-free: each thread writes to its own shard, and shards are
+only merged when read. Each process writes its merged figures to
+`<DIR>/<pid>.json` every FLUSH_INTERVAL seconds from a background thread, a
+stand-in for a shared-memory or push-gateway store. GET
+/api/v1/admin/metrics/ adds this process's live figures to every other
+running process's last flush, so all workers appear as one; files left by
+processes that have exited are removed (a restart resets the counters, as
+Prometheus expects). Quantiles (p50/p95/p99) are estimated from the
+histogram buckets, as Prometheus' histogram_quantile() does.
+
+Settings (all optional)::
+
+    METRICS = {
+        'DIR': '/tmp/bike_rental_metrics',  # None reports this process only
+        'FLUSH_INTERVAL': 5,                # seconds
+    }
+"""
+import atexit
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+
+DEFAULTS = {
+    'DIR': None,
+    'FLUSH_INTERVAL': 5,
+}
+
+# Upper bounds, in seconds
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1.0)
+QUANTILES = (0.5, 0.95, 0.99)
+# 5xx counts are also kept per minute, for SystemStatusView
+ERROR_MINUTES = 60
+
+# name -> (type, help, buckets)
+METRICS = {
+    'http_request_duration_seconds': ('histogram', 'Request latency by view and method', REQUEST_BUCKETS),
+    'http_responses_total': ('counter', 'Responses by view, method and status code', None),
+    'http_requests_in_flight': ('gauge', 'Requests being handled', None),
+    'db_query_duration_seconds': ('histogram', 'SQL statement time by database alias', QUERY_BUCKETS),
+    'db_connections_opened_total': ('counter', 'Database connections opened, by alias', None),
+    'cache_requests_total': ('counter', 'Cache lookups by cache and result', None),
+}
+SUFFIX = '.json'
+
+
+def metrics_settings():
+    return {**DEFAULTS, **getattr(settings, 'METRICS', {})}
+
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+
+class Shard:
+    """One thread's figures; only that thread writes to it"""
+
+    def __init__(self):
+        self.values = {}      # (name, labels) -> counter or gauge value
+        self.histograms = {}  # (name, labels) -> [count per bucket..., count above the last, sum]
+        self.errors = {}      # minute -> 5xx responses
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+        self._lock = threading.Lock()
+        self._flusher_pid = None
+
+    def _forked(self):
+        # A worker forked from a process that already recorded something
+        # must not report the parent's figures as its own
+        self.__init__()
+
+    def _shard(self):
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = Shard()
+            with self._lock:
+                self._shards.append(shard)
+            self._start_flusher()
+        return shard
+
+    def inc(self, name, labels, amount=1):
+        values = self._shard().values
+        key = _key(name, labels)
+        values[key] = values.get(key, 0) + amount
+
+    def observe(self, name, labels, value):
+        histograms = self._shard().histograms
+        key = _key(name, labels)
+        buckets = METRICS[name][2]
+        histogram = histograms.get(key)
+        if histogram is None:
+            histogram = histograms[key] = [0] * (len(buckets) + 1) + [0.0]
+        histogram[bisect_left(buckets, value)] += 1
+        histogram[-1] += value
+
+    def server_error(self):
+        errors = self._shard().errors
+        minute = int(time.time() // 60)
+        errors[minute] = errors.get(minute, 0) + 1
+        if len(errors) > ERROR_MINUTES:
+            for old in [old for old in errors if old <= minute - ERROR_MINUTES]:
+                del errors[old]
+
+    def snapshot(self):
+        """This process's figures, merged across threads"""
+        with self._lock:
+            shards = list(self._shards)
+        merged = {'values': {}, 'histograms': {}, 'errors': {}}
+        oldest = int(time.time() // 60) - ERROR_MINUTES
+        for shard in shards:
+            # dict.copy() is atomic under the GIL, so the owner may keep writing
+            _merge(merged, {
+                'values': shard.values.copy(),
+                'histograms': {key: list(value) for key, value in shard.histograms.copy().items()},
+                'errors': {minute: count for minute, count in shard.errors.copy().items() if minute > oldest},
+            })
+        return merged
+
+    def collect(self):
+        """Every process's figures: this one live, the others from their last flush"""
+        merged = self.snapshot()
+        directory = metrics_settings()['DIR']
+        if directory:
+            for pid, figures in _read_flushes(str(directory)):
+                if pid != os.getpid():
+                    _merge(merged, figures)
+        return merged
+
+    def reset(self):
+        with self._lock:
+            for shard in self._shards:
+                shard.values.clear()
+                shard.histograms.clear()
+                shard.errors.clear()
+
+    def _start_flusher(self):
+        if not metrics_settings()['DIR'] or self._flusher_pid == os.getpid():
+            return
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            # Once per process, so again in each worker after a fork
+            self._flusher_pid = os.getpid()
+        threading.Thread(target=self._flush_forever, name='metrics-flush', daemon=True).start()
+
+    def _flush_forever(self):
+        while True:
+            time.sleep(metrics_settings()['FLUSH_INTERVAL'])
+            self.flush()
+
+    def flush(self):
+        directory = metrics_settings()['DIR']
+        if not directory:
+            return
+        try:
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(str(directory), f'{os.getpid()}{SUFFIX}')
+            with open(f'{path}.tmp', 'w') as f:
+                json.dump(_dump(self.snapshot()), f)
+            # Readers see either the previous flush or this one, never half of it
+            os.replace(f'{path}.tmp', path)
+        except OSError as e:
+            print(f"Metrics flush error: {e}")
+
+
+def _merge(into, figures):
+    for key, value in figures['values'].items():
+        into['values'][key] = into['values'].get(key, 0) + value
+    for key, histogram in figures['histograms'].items():
+        existing = into['histograms'].get(key)
+        if existing is None:
+            into['histograms'][key] = list(histogram)
+        elif len(existing) == len(histogram):
+            # A flush from before a bucket change is skipped
+            into['histograms'][key] = [a + b for a, b in zip(existing, histogram)]
+    for minute, count in figures['errors'].items():
+        into['errors'][minute] = into['errors'].get(minute, 0) + count
+
+
+def _dump(figures):
+    return {
+        'values': [[name, labels, value] for (name, labels), value in figures['values'].items()],
+        'histograms': [[name, labels, value] for (name, labels), value in figures['histograms'].items()],
+        'errors': list(figures['errors'].items()),
+    }
+
+
+def _load(data):
+    return {
+        'values': {(name, tuple(map(tuple, labels))): value for name, labels, value in data['values']},
+        'histograms': {(name, tuple(map(tuple, labels))): value for name, labels, value in data['histograms']},
+        'errors': {int(minute): count for minute, count in data['errors']},
+    }
+
+
+def _read_flushes(directory):
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return
+    for name in names:
+        if not name.endswith(SUFFIX) or not name[:-len(SUFFIX)].isdigit():
+            continue
+        pid = int(name[:-len(SUFFIX)])
+        path = os.path.join(directory, name)
+        try:
+            if not _alive(pid):
+                os.unlink(path)
+                continue
+            with open(path) as f:
+                yield pid, _load(json.load(f))
+        except (OSError, ValueError) as e:
+            print(f"Skipping metrics file {name}: {e}")
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+metrics = MetricsRegistry()
+atexit.register(metrics.flush)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=metrics._forked)
+
+
+def cache_lookup(cache_name, hit):
+    metrics.inc('cache_requests_total', {'cache': cache_name, 'result': 'hit' if hit else 'miss'})
+
+
+def recent_server_errors(minutes=15):
+    """5xx responses in the last `minutes`, across processes"""
+    since = int(time.time() // 60) - minutes
+    return sum(count for minute, count in metrics.collect()['errors'].items() if minute > since)
+
+
+def _time_query(execute, sql, params, many, context):
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.observe('db_query_duration_seconds', {'alias': context['connection'].alias},
+                        time.perf_counter() - started)
+
+
+def install_query_metrics(sender, connection, **kwargs):
+    metrics.inc('db_connections_opened_total', {'alias': connection.alias})
+    if _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_query)
+
+
+connection_created.connect(install_query_metrics, dispatch_uid='metrics-query-timer')
+
+
+def quantile(q, buckets, histogram):
+    """Estimate a quantile from bucket counts, interpolating inside the bucket"""
+    counts = histogram[:-1]
+    total = sum(counts)
+    if not total:
+        return None
+    rank = q * total
+    seen = 0
+    for i, count in enumerate(counts):
+        if seen + count >= rank and count:
+            if i == len(buckets):
+                # Above the last bound: the last bound is the best estimate
+                return buckets[-1]
+            lower = buckets[i - 1] if i else 0.0
+            return lower + (buckets[i] - lower) * (rank - seen) / count
+        seen += count
+    return buckets[-1]
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels, **extra):
+    pairs = [*labels, *extra.items()]
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def exposition(figures=None):
+    """Prometheus text exposition format (version 0.0.4)"""
+    figures = metrics.collect() if figures is None else figures
+    lines = []
+    for name, (kind, help_text, buckets) in METRICS.items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+        if kind != 'histogram':
+            for (metric, labels), value in sorted(figures['values'].items()):
+                if metric == name:
+                    lines.append(f'{name}{_labels(labels)} {_number(value)}')
+            continue
+        series = sorted((labels, histogram) for (metric, labels), histogram in figures['histograms'].items()
+                        if metric == name)
+        for labels, histogram in series:
+            cumulative = 0
+            for bound, count in zip((*map(str, buckets), '+Inf'), histogram[:-1]):
+                cumulative += count
+                lines.append(f'{name}_bucket{_labels(labels, le=bound)} {cumulative}')
+            lines.append(f'{name}_sum{_labels(labels)} {_number(histogram[-1])}')
+            lines.append(f'{name}_count{_labels(labels)} {cumulative}')
+        if series:
+            lines += [f'# HELP {name}_quantile Estimated from {name} buckets',
+                      f'# TYPE {name}_quantile gauge']
+            for labels, histogram in series:
+                for q in QUANTILES:
+                    estimate = quantile(q, buckets, histogram)
+                    if estimate is not None:
+                        lines.append(f'{name}_quantile{_labels(labels, quantile=q)} {_number(estimate)}')
+
+    lookups = {}
+    for (metric, labels), value in figures['values'].items():
+        if metric == 'cache_requests_total':
+            labels = dict(labels)
+            hits, total = lookups.get(labels['cache'], (0, 0))
+            lookups[labels['cache']] = (hits + (value if labels['result'] == 'hit' else 0), total + value)
+    lines += ['# HELP cache_hit_ratio Hits over lookups, by cache', '# TYPE cache_hit_ratio gauge']
+    for cache_name, (hits, total) in sorted(lookups.items()):
+        if total:
+            lines.append(f'cache_hit_ratio{_labels((("cache", cache_name),))} {_number(hits / total)}')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,138 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from .metrics import metrics
+
+from .query_stats import begin_sampling, end_sampling, query_stats, should_sample
+from .routers import begin_request, end_request, pin_to_primary
+
+
+class ReplicaRoutingMiddleware:
+    """Per-request state for rental_api.routers; pins users who wrote to the primary"""
+
+    # Both, so ASGI requests to async views never detour through a thread here
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state, token = begin_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            end_request(token)
+        self._pin_writer(request, state)
+        return response
+
+    async def __acall__(self, request):
+        state, token = begin_request()
+        try:
+            response = await self.get_response(request)
+        finally:
+            end_request(token)
+        self._pin_writer(request, state)
+        return response
+
+    def _pin_writer(self, request, state):
+        # DRF copies the authenticated user back onto the Django request
+        user = getattr(request, 'user', None)
+        if state.wrote and user is not None and user.is_authenticated:
+            pin_to_primary(user.pk)
+
+
+class MetricsMiddleware:
+    """Latency, status code and in-flight figures for rental_api.metrics"""
+
+    sync_capable = True
+    async_capable = True
+    # Anything else is labelled 'other', so clients cannot add label values
+    METHODS = frozenset({'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'})
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        metrics.inc('http_requests_in_flight', {})
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.inc('http_requests_in_flight', {}, -1)
+        self._record(request, response, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        metrics.inc('http_requests_in_flight', {})
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.inc('http_requests_in_flight', {}, -1)
+        self._record(request, response, time.perf_counter() - started)
+        return response
+
+    def _record(self, request, response, duration):
+        # Streaming responses (the live bike feed) are timed up to their first byte
+        match = getattr(request, 'resolver_match', None)
+        labels = {
+            'view': (match.view_name or match._func_path) if match is not None else 'unmatched',
+            'method': request.method if request.method in self.METHODS else 'other',
+        }
+        metrics.observe('http_request_duration_seconds', labels, duration)
+        metrics.inc('http_responses_total', {**labels, 'status': str(response.status_code)})
+        if response.status_code >= 500:
+            metrics.server_error()
+
+
+class QueryStatsMiddleware:
+    """Samples requests' SQL into rental_api.query_stats, keyed by resolved view name"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not should_sample():
+            return self.get_response(request)
+        log, token = begin_sampling()
+        try:
+            response = self.get_response(request)
+        finally:
+            end_sampling(token)
+        self._record(request, log)
+        return response
+
+    async def __acall__(self, request):
+        if not should_sample():
+            return await self.get_response(request)
+        log, token = begin_sampling()
+        try:
+            response = await self.get_response(request)
+        finally:
+            end_sampling(token)
+        self._record(request, log)
+        return response
+
+    def _record(self, request, log):
+        match = getattr(request, 'resolver_match', None)
+        if match is None:
+            # 404s and the like: nothing to attribute the queries to
+            return
+        query_stats.record(match.view_name or match._func_path, log)
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.4 on 2026-10-18 00:56
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rental_api', '0020_dashboardcounter'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='analytics',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.4 on 2026-10-18 00:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rental_api', '0021_alter_analytics_timestamp'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('name', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='AnalyticsDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('action', models.CharField(choices=[('browse_bikes_clicked', 'Browse Bikes Clicked'), ('about_page_visited', 'About Page Visited'), ('contact_clicked', 'Contact Clicked'), ('feature_clicked', 'Feature Clicked')], max_length=50)),
+                ('page', models.CharField(max_length=50)),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['bucket'],
+                'abstract': False,
+                'unique_together': {('bucket', 'action', 'page')},
+            },
+        ),
+        migrations.CreateModel(
+            name='AnalyticsHourlyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('action', models.CharField(choices=[('browse_bikes_clicked', 'Browse Bikes Clicked'), ('about_page_visited', 'About Page Visited'), ('contact_clicked', 'Contact Clicked'), ('feature_clicked', 'Feature Clicked')], max_length=50)),
+                ('page', models.CharField(max_length=50)),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['bucket'],
+                'abstract': False,
+                'unique_together': {('bucket', 'action', 'page')},
+            },
+        ),
+    ]
@@ -0,0 +1,64 @@
+from django.db import migrations
+
+# External-content FTS5 index over the searchable Bike columns. The triggers
+# keep it in step with every write to rental_api_bike, including bulk and
+# queryset updates that bypass model signals.
+FTS_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE rental_api_bike_fts USING fts5(
+        name, model, brand, bike_type, description,
+        content='rental_api_bike', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    """
+    CREATE TRIGGER rental_api_bike_fts_ai AFTER INSERT ON rental_api_bike BEGIN
+        INSERT INTO rental_api_bike_fts(rowid, name, model, brand, bike_type, description)
+        VALUES (new.id, new.name, new.model, new.brand, new.bike_type, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER rental_api_bike_fts_ad AFTER DELETE ON rental_api_bike BEGIN
+        INSERT INTO rental_api_bike_fts(rental_api_bike_fts, rowid, name, model, brand, bike_type, description)
+        VALUES ('delete', old.id, old.name, old.model, old.brand, old.bike_type, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER rental_api_bike_fts_au AFTER UPDATE OF name, model, brand, bike_type, description
+    ON rental_api_bike BEGIN
+        INSERT INTO rental_api_bike_fts(rental_api_bike_fts, rowid, name, model, brand, bike_type, description)
+        VALUES ('delete', old.id, old.name, old.model, old.brand, old.bike_type, old.description);
+        INSERT INTO rental_api_bike_fts(rowid, name, model, brand, bike_type, description)
+        VALUES (new.id, new.name, new.model, new.brand, new.bike_type, new.description);
+    END
+    """,
+    "INSERT INTO rental_api_bike_fts(rental_api_bike_fts) VALUES ('rebuild')",
+]
+
+FTS_REVERSE = [
+    'DROP TRIGGER IF EXISTS rental_api_bike_fts_au',
+    'DROP TRIGGER IF EXISTS rental_api_bike_fts_ad',
+    'DROP TRIGGER IF EXISTS rental_api_bike_fts_ai',
+    'DROP TABLE IF EXISTS rental_api_bike_fts',
+]
+
+
+def _run(statements):
+    def run(apps, schema_editor):
+        # Other databases use the LIKE-based fallback in rental_api.search
+        if schema_editor.connection.vendor != 'sqlite':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rental_api', '0023_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(_run(FTS_FORWARD), _run(FTS_REVERSE)),
+    ]
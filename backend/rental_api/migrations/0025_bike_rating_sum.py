@@ -0,0 +1,33 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:06
+
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_rating_totals(apps, schema_editor):
+    Bike = apps.get_model('rental_api', 'Bike')
+    Review = apps.get_model('rental_api', 'Review')
+    totals = Review.objects.values('bike_id').annotate(rating_sum=Sum('rating'), n=Count('id'))
+    for row in totals.order_by():
+        average = (Decimal(row['rating_sum']) / row['n']).quantize(Decimal('0.1'), rounding=ROUND_HALF_UP)
+        Bike.objects.filter(id=row['bike_id']).update(
+            rating_sum=row['rating_sum'], total_reviews=row['n'], rating=average
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rental_api', '0024_bike_fts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bike',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_rating_totals, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rental_api', '0025_bike_rating_sum'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bike',
+            name='popularity',
+            field=models.FloatField(db_index=True, default=0),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rental_api', '0027_outbox_email'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UsernameCounter',
+            fields=[
+                ('prefix', models.CharField(max_length=150, primary_key=True, serialize=False)),
+                ('next_suffix', models.PositiveIntegerField(default=1)),
+            ],
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:24
+
+from collections import defaultdict
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+def check_duplicate_emails(apps, schema_editor):
+    """Trim emails, and stop if two accounts share one ignoring case"""
+    User = apps.get_model('rental_api', 'User')
+    accounts = defaultdict(list)
+    for user in User.objects.exclude(email='').only('id', 'email'):
+        accounts[user.email.strip().lower()].append(user)
+
+    # Which account keeps a shared address is for an admin to decide, not
+    # the migration: nothing is changed until there are no conflicts
+    conflicts = {address: sorted(u.id for u in users) for address, users in accounts.items() if len(users) > 1}
+    if conflicts:
+        listing = '\n'.join(f'  {address}: users {ids}' for address, ids in sorted(conflicts.items()))
+        raise RuntimeError(
+            f"{len(conflicts)} email address(es) are used by more than one account, ignoring case:\n{listing}\n"
+            "Change or clear the email of all but one account per address, then run migrate again."
+        )
+
+    for users in accounts.values():
+        user = users[0]
+        if user.email != user.email.strip():
+            User.objects.filter(id=user.id).update(email=user.email.strip())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('rental_api', '0028_username_counter'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_emails, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='user',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('email'), condition=models.Q(('email', ''), _negated=True), name='user_email_ci_unique'),
+        ),
+    ]
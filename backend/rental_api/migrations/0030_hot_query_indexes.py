@@ -0,0 +1,51 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:25
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rental_api', '0029_user_email_ci_unique'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='analytics',
+            index=models.Index(fields=['action', 'timestamp', 'id'], name='analytics_action_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bike',
+            index=models.Index(fields=['status', 'bike_type', 'price_per_hour'], name='bike_status_type_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['user', 'status', 'created_at'], name='booking_user_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['bike', 'status'], name='booking_bike_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['status', 'created_at'], name='booking_status_created_idx'),
+        ),
+        # The FK indexes go only once the composite indexes replacing them exist
+        migrations.AlterField(
+            model_name='booking',
+            name='bike',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='rental_api.bike'),
+        ),
+        migrations.AlterField(
+            model_name='booking',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='review',
+            name='bike',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='reviews', to='rental_api.bike'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.4 on 2026-10-18 01:32
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rental_api', '0030_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='analytics',
+            name='user',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.4 on 2026-10-18 02:20
+
+from django.db import migrations
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from rental_api.popularity import WINDOW, score
+
+
+def backfill_popularity(apps, schema_editor):
+    """Score existing bikes; 0026 added the column as 0 for all of them"""
+    Bike = apps.get_model('rental_api', 'Bike')
+    Booking = apps.get_model('rental_api', 'Booking')
+    ride_length = ExpressionWrapper(
+        Coalesce('actual_end_time', 'booked_end_time', 'end_time') - F('start_time'),
+        output_field=DurationField(),
+    )
+    rides = Booking.objects.filter(status='completed', start_time__gte=timezone.now() - WINDOW)
+    activity = {
+        row['bike_id']: (row['n'], row['ridden'].total_seconds() if row['ridden'] else 0)
+        for row in rides.values('bike_id').annotate(n=Count('id'), ridden=Sum(ride_length)).order_by()
+    }
+    bikes = []
+    for bike_id, rating_sum, review_count in Bike.objects.values_list('id', 'rating_sum', 'total_reviews'):
+        completed, ridden_seconds = activity.get(bike_id, (0, 0))
+        bikes.append(Bike(id=bike_id, popularity=score(rating_sum, review_count, completed, ridden_seconds)))
+    Bike.objects.bulk_update(bikes, ['popularity'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('rental_api', '0032_restore_bike_fts_triggers'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_popularity, migrations.RunPython.noop),
+    ]
@@ -1,4 +1,8 @@
 from django.db import models
+from django.db.models import Q
+from django.db.models.functions import Lower
+from django.db.models.lookups import Exact
+from django.utils import timezone
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MinValueValidator, MaxValueValidator
 
@@ -11,13 +15,36 @@ class User(AbstractUser):
     class Meta:
         verbose_name = 'User'
         verbose_name_plural = 'Users'
+        indexes = [
+            # Keyset pagination of the admin user list
+            models.Index(fields=['date_joined', 'id'], name='user_joined_keyset_idx'),
+        ]
+        constraints = [
+            # One account per address, ignoring case; also the index behind
+            # email logins (see user_email_match)
+            models.UniqueConstraint(Lower('email'), condition=~Q(email=''), name='user_email_ci_unique'),
+        ]
 
     def save(self, *args, **kwargs):
         # Auto-generate full_name from first_name and last_name if not set
         if not self.full_name and (self.first_name or self.last_name):
             self.full_name = f"{self.first_name or ''} {self.last_name or ''}".strip()
+        # Stored as typed, minus stray whitespace; the unique index lowercases it
+        self.email = (self.email or '').strip()
         super().save(*args, **kwargs)
 
+
+def normalize_email(email):
+    return (email or '').strip().lower()
+
+
+def user_email_match(email):
+    """Filter for the user with `email`, in any case, answered by user_email_ci_unique"""
+    # The ~Q(email='') term mirrors the constraint's condition so the planner
+    # can use the partial index
+    return Exact(Lower('email'), normalize_email(email)) & ~Q(email='')
+
+
 class Bike(models.Model):
     BIKE_STATUS_CHOICES = [
         ('available', 'Available'),
@@ -37,12 +64,20 @@ class Bike(models.Model):
     added_on = models.DateTimeField(auto_now_add=True)
     rating = models.DecimalField(max_digits=3, decimal_places=1, default=4.5, validators=[MinValueValidator(0), MaxValueValidator(5)])
     total_reviews = models.IntegerField(default=0)
+    # Sum of all review ratings; rating = rating_sum / total_reviews (see rental_api.ratings)
+    rating_sum = models.PositiveIntegerField(default=0)
+    # Ranking score for ?ordering=-popularity, maintained by rental_api.popularity
+    popularity = models.FloatField(default=0, db_index=True)
 
     def __str__(self):
         return f"{self.brand} {self.model} - {self.name}"
 
     class Meta:
         ordering = ['-added_on']
+        indexes = [
+            # Catalogue filters: ?status=&bike_type= with a price range or sort
+            models.Index(fields=['status', 'bike_type', 'price_per_hour'], name='bike_status_type_price_idx'),
+        ]
 
 
 
@@ -55,8 +90,9 @@ class Booking(models.Model):
            ('cancelled', 'Cancelled'),
        ]
 
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
-    bike = models.ForeignKey(Bike, on_delete=models.CASCADE)
+    # Both FKs lead composite indexes below, which also serve plain FK lookups
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
+    bike = models.ForeignKey(Bike, on_delete=models.CASCADE, db_index=False)
     start_time = models.DateTimeField()
     booked_end_time = models.DateTimeField(null=True, blank=True)  # User-selected end time (required for new bookings)
     end_time = models.DateTimeField(null=True, blank=True)  # Legacy field (deprecated)
@@ -71,13 +107,25 @@ class Booking(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset pagination (see rental_api.pagination)
+            models.Index(fields=['created_at', 'id'], name='booking_created_keyset_idx'),
+            models.Index(fields=['user', 'created_at', 'id'], name='booking_user_keyset_idx'),
+            # Current bookings / rental history / dashboard counts per user
+            models.Index(fields=['user', 'status', 'created_at'], name='booking_user_status_idx'),
+            # Active bookings on a bike (availability, overlap checks)
+            models.Index(fields=['bike', 'status'], name='booking_bike_status_idx'),
+            # Revenue and completed-ride stats
+            models.Index(fields=['status', 'created_at'], name='booking_status_created_idx'),
+        ]
 
 
 
 
 class Review(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reviews')
-    bike = models.ForeignKey(Bike, on_delete=models.CASCADE, related_name='reviews')
+    # review_bike_keyset_idx (bike, created_at, id) covers per-bike lookups
+    bike = models.ForeignKey(Bike, on_delete=models.CASCADE, related_name='reviews', db_index=False)
     rating = models.IntegerField(validators=[MinValueValidator(1), MaxValueValidator(5)])
     comment = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
@@ -85,6 +133,13 @@ class Review(models.Model):
     def __str__(self):
         return f"Review by {self.user.username} on {self.bike.name}"
 
+    class Meta:
+        indexes = [
+            # Keyset pagination (see rental_api.pagination)
+            models.Index(fields=['created_at', 'id'], name='review_created_keyset_idx'),
+            models.Index(fields=['bike', 'created_at', 'id'], name='review_bike_keyset_idx'),
+        ]
+
 
 class Analytics(models.Model):
     ACTION_CHOICES = [
@@ -96,15 +151,111 @@ class Analytics(models.Model):
 
     action = models.CharField(max_length=50, choices=ACTION_CHOICES)
     page = models.CharField(max_length=50)
-    timestamp = models.DateTimeField(auto_now_add=True)
-    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
+    # Set when the event is tracked, not when the ingestion buffer writes it
+    timestamp = models.DateTimeField(default=timezone.now, editable=False)
+    # Events live on their own database (see rental_api.routers), so no DB
+    # constraint and no cascade; a deleted user's events are detached instead
+    user = models.ForeignKey(
+        User, on_delete=models.DO_NOTHING, null=True, blank=True, db_constraint=False
+    )
     ip_address = models.GenericIPAddressField(null=True, blank=True)
     user_agent = models.TextField(blank=True, null=True)
 
     class Meta:
         verbose_name_plural = "Analytics"
         ordering = ['-timestamp']
+        indexes = [
+            # Keyset pagination of the raw event list
+            models.Index(fields=['timestamp', 'id'], name='analytics_ts_keyset_idx'),
+            # Events of one action over a time range (and the ?action= event list)
+            models.Index(fields=['action', 'timestamp', 'id'], name='analytics_action_ts_idx'),
+        ]
 
     def __str__(self):
         return f"{self.action} - {self.timestamp}"
-   
+
+
+class DashboardCounter(models.Model):
+    """Running totals behind the admin dashboard, maintained by rental_api.counters"""
+    name = models.CharField(max_length=64, primary_key=True)
+    value = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+
+    def __str__(self):
+        return f"{self.name} = {self.value}"
+
+
+class AnalyticsRollup(models.Model):
+    """Event counts per (bucket, action, page), filled by the rollup_analytics command"""
+    bucket = models.DateTimeField()
+    action = models.CharField(max_length=50, choices=Analytics.ACTION_CHOICES)
+    page = models.CharField(max_length=50)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+        ordering = ['bucket']
+
+    def __str__(self):
+        return f"{self.bucket} {self.action} {self.page}: {self.count}"
+
+
+class AnalyticsHourlyRollup(AnalyticsRollup):
+    class Meta(AnalyticsRollup.Meta):
+        unique_together = ('bucket', 'action', 'page')
+
+
+class AnalyticsDailyRollup(AnalyticsRollup):
+    class Meta(AnalyticsRollup.Meta):
+        unique_together = ('bucket', 'action', 'page')
+
+
+class RollupWatermark(models.Model):
+    """Highest source row id already folded into a rollup"""
+    name = models.CharField(max_length=64, primary_key=True)
+    last_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.last_id}"
+
+
+class OutboxEmail(models.Model):
+    """Mail waiting to be sent by the rental_api.outbox worker pool"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254)
+    to = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    # When a worker claimed the row; stale claims are picked up again
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['created_at']
+        indexes = [
+            # Workers look for due rows by status and next attempt
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.to)} ({self.status})"
+
+
+class UsernameCounter(models.Model):
+    """Next numeric suffix to hand out for a username prefix, maintained by rental_api.usernames"""
+    prefix = models.CharField(max_length=150, primary_key=True)
+    next_suffix = models.PositiveIntegerField(default=1)
+
+    def __str__(self):
+        return f"{self.prefix} -> {self.next_suffix}"
@@ -0,0 +1,252 @@
+"""
+Persistent outbox for transactional mail.
+
+Views call queue_email(), which only INSERTs an OutboxEmail row; once the
+surrounding transaction commits, a small pool of worker threads is woken to
+send it. Each worker claims up to BATCH_SIZE due rows (compare-and-swap on
+status, so workers in other processes never send the same row twice) and
+delivers the whole batch over one SMTP session. A failed message goes back
+to pending with exponential backoff until MAX_ATTEMPTS, after which it is
+marked failed and left for inspection. Rows claimed by a worker that died
+are picked up again after CLAIM_TIMEOUT.
+
+Bodies can carry password-reset links, so a row's body is blanked as soon
+as it is sent or has finally failed, and sent rows are deleted after
+KEEP_SENT_DAYS; subject, recipients and errors stay for inspection.
+
+Workers also poll every POLL_INTERVAL for retries coming due. Mail still
+pending when a process restarts is sent on the next wake-up, or by
+`manage.py send_outbox` (e.g. every minute from cron).
+
+Settings (all optional)::
+
+    EMAIL_OUTBOX = {
+        'ENABLED': True,        # False sends right after commit, in the request
+        'WORKERS': 2,
+        'BATCH_SIZE': 50,       # messages per claim / SMTP session
+        'POLL_INTERVAL': 5.0,   # seconds
+        'MAX_ATTEMPTS': 5,
+        'BACKOFF_BASE': 30,     # seconds before the first retry, doubled each time
+        'BACKOFF_MAX': 3600,
+        'CLAIM_TIMEOUT': 300,   # seconds before a claimed row is considered abandoned
+        'KEEP_SENT_DAYS': 7,    # sent rows are deleted after this
+    }
+
+Point EMAIL_BACKEND at Django's console or file backend to exercise the
+outbox without SMTP.
+"""
+import atexit
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import close_old_connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import OutboxEmail
+
+DEFAULTS = {
+    'ENABLED': True,
+    'WORKERS': 2,
+    'BATCH_SIZE': 50,
+    'POLL_INTERVAL': 5.0,
+    'MAX_ATTEMPTS': 5,
+    'BACKOFF_BASE': 30,
+    'BACKOFF_MAX': 3600,
+    'CLAIM_TIMEOUT': 300,
+    'KEEP_SENT_DAYS': 7,
+}
+
+
+def outbox_settings():
+    return {**DEFAULTS, **getattr(settings, 'EMAIL_OUTBOX', {})}
+
+
+def queue_email(subject, message, recipient_list, from_email=None):
+    """Store a message for the worker pool; costs one INSERT on the request path"""
+    email = OutboxEmail.objects.create(
+        subject=subject,
+        body=message,
+        from_email=from_email or settings.DEFAULT_FROM_EMAIL,
+        to=list(recipient_list),
+    )
+    if outbox_settings()['ENABLED']:
+        transaction.on_commit(outbox_pool.wake)
+    else:
+        transaction.on_commit(drain)
+    return email
+
+
+def backoff(attempts, config):
+    """Delay before retry number `attempts` (1-based)"""
+    return timedelta(seconds=min(config['BACKOFF_MAX'], config['BACKOFF_BASE'] * 2 ** (attempts - 1)))
+
+
+def _due(now, config):
+    abandoned = now - timedelta(seconds=config['CLAIM_TIMEOUT'])
+    return Q(status='pending', next_attempt_at__lte=now) | Q(status='sending', claimed_at__lt=abandoned)
+
+
+def claim_batch(config):
+    """Claim up to BATCH_SIZE due rows for this worker"""
+    now = timezone.now()
+    due = _due(now, config)
+    candidates = OutboxEmail.objects.filter(due).order_by('next_attempt_at', 'id')[:config['BATCH_SIZE']]
+    claimed = []
+    for email in candidates:
+        # Only one worker wins each row, whichever process it runs in
+        if OutboxEmail.objects.filter(due, id=email.id).update(status='sending', claimed_at=now):
+            claimed.append(email)
+    return claimed
+
+
+def _mark_sent(email):
+    OutboxEmail.objects.filter(id=email.id).update(
+        status='sent', attempts=email.attempts + 1, sent_at=timezone.now(), claimed_at=None, last_error='',
+        body='',
+    )
+
+
+def _mark_failed(email, error, config):
+    attempts = email.attempts + 1
+    if attempts >= config['MAX_ATTEMPTS']:
+        OutboxEmail.objects.filter(id=email.id).update(
+            status='failed', attempts=attempts, claimed_at=None, last_error=str(error), body='',
+        )
+        return 'failed'
+    OutboxEmail.objects.filter(id=email.id).update(
+        status='pending', attempts=attempts, claimed_at=None, last_error=str(error),
+        next_attempt_at=timezone.now() + backoff(attempts, config),
+    )
+    return 'retried'
+
+
+def deliver(emails, config):
+    """Send claimed rows over one connection; returns {'sent', 'retried', 'failed'} counts"""
+    results = {'sent': 0, 'retried': 0, 'failed': 0}
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as e:
+        print(f"Outbox connection error: {e}")
+        for email in emails:
+            results[_mark_failed(email, e, config)] += 1
+        return results
+
+    try:
+        for email in emails:
+            message = EmailMessage(email.subject, email.body, email.from_email, email.to, connection=connection)
+            try:
+                message.send()
+            except Exception as e:
+                print(f"Outbox send error for email {email.id}: {e}")
+                results[_mark_failed(email, e, config)] += 1
+                # The session may be unusable now; start a fresh one for the rest
+                connection.close()
+                try:
+                    connection.open()
+                except Exception:
+                    pass
+                continue
+            _mark_sent(email)
+            results['sent'] += 1
+    finally:
+        connection.close()
+    return results
+
+
+def purge_sent(config):
+    """Delete sent rows older than KEEP_SENT_DAYS"""
+    cutoff = timezone.now() - timedelta(days=config['KEEP_SENT_DAYS'])
+    return OutboxEmail.objects.filter(status='sent', sent_at__lt=cutoff).delete()[0]
+
+
+def drain():
+    """Send everything currently due, batch by batch; returns the combined counts"""
+    config = outbox_settings()
+    totals = {'sent': 0, 'retried': 0, 'failed': 0}
+    while True:
+        emails = claim_batch(config)
+        if not emails:
+            purge_sent(config)
+            return totals
+        for key, count in deliver(emails, config).items():
+            totals[key] += count
+
+
+class OutboxWorkerPool:
+    """WORKERS threads that claim and deliver outbox batches"""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._threads = []
+        self._stopping = False
+        self._wakeups = 0
+        self.stats = {'sent': 0, 'retried': 0, 'failed': 0, 'batches': 0}
+
+    def _ensure_workers(self):
+        self._threads = [thread for thread in self._threads if thread.is_alive()]
+        self._stopping = False
+        for index in range(len(self._threads), outbox_settings()['WORKERS']):
+            thread = threading.Thread(target=self._run, name=f'email-outbox-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def wake(self):
+        """Start the workers if needed and have one look for due mail now"""
+        with self._condition:
+            self._ensure_workers()
+            self._wakeups += 1
+            self._condition.notify()
+
+    def _work_once(self, config):
+        emails = claim_batch(config)
+        if not emails:
+            return False
+        results = deliver(emails, config)
+        if results['sent']:
+            purge_sent(config)
+        with self._condition:
+            for key, count in results.items():
+                self.stats[key] += count
+            self.stats['batches'] += 1
+        return True
+
+    def _run(self):
+        while True:
+            config = outbox_settings()
+            try:
+                busy = self._work_once(config)
+            except Exception as e:
+                print(f"Outbox worker error: {e}")
+                busy = False
+            finally:
+                close_old_connections()
+            with self._condition:
+                if self._stopping:
+                    return
+                if not busy:
+                    if not self._wakeups:
+                        self._condition.wait(config['POLL_INTERVAL'])
+                    self._wakeups = max(0, self._wakeups - 1)
+                if self._stopping:
+                    return
+
+    def shutdown(self, timeout=5.0):
+        """Stop the workers; unsent rows stay pending in the table"""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def snapshot(self):
+        with self._condition:
+            return {**self.stats, 'workers': sum(thread.is_alive() for thread in self._threads)}
+
+
+outbox_pool = OutboxWorkerPool()
+atexit.register(outbox_pool.shutdown)
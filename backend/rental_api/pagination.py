@@ -0,0 +1,230 @@
+"""
+Keyset pagination for the list endpoints.
+
+Pages are cut with `WHERE (created_at, id) < (last seen)` on a composite
+index instead of COUNT(*) + OFFSET, so the 500th page costs the same as the
+first. Responses look like::
+
+    {"next": "<url with ?cursor=...>" | null, "results": [...]}
+
+Order is fixed newest-first by the paginator's key; `?page_size=` (up to
+MAX_PAGE_SIZE) sets the page length.
+
+`?pagination=legacy` opts back into the previous behaviour of each endpoint:
+PageNumberPagination where the endpoint used to be paginated, the whole list
+where it was not.
+
+Keyset pages can only follow their own key, so on a view with an
+OrderingFilter any other `?ordering=` also switches to the legacy paginator
+(and is a 400 where the endpoint has none), instead of being ignored.
+"""
+import base64
+import json
+import math
+
+from asgiref.sync import sync_to_async
+from django.core.paginator import Page
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.filters import OrderingFilter
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+LEGACY_PARAM = 'pagination'
+
+
+def wants_legacy(request):
+    return request.query_params.get(LEGACY_PARAM) == 'legacy'
+
+
+class KeysetPagination(BasePagination):
+    """Newest-first pages over (key_fields[0], id), continued by an opaque cursor"""
+
+    key_fields = ('created_at', 'id')
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    MAX_PAGE_SIZE = 100
+    # Used for ?pagination=legacy; None means "return the whole list"
+    legacy_pagination_class = None
+
+    def __init__(self):
+        self.legacy = None
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, api_settings.PAGE_SIZE or 10))
+        except ValueError:
+            size = api_settings.PAGE_SIZE or 10
+        return max(1, min(size, self.MAX_PAGE_SIZE))
+
+    def encode_cursor(self, position):
+        moment, pk = position
+        raw = json.dumps([moment.isoformat(), pk]).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4))
+            moment, pk = json.loads(raw)
+            moment = parse_datetime(moment)
+            if moment is None:
+                raise ValueError
+            return moment, int(pk)
+        except (TypeError, ValueError):
+            raise NotFound('Invalid cursor.')
+
+    def _position_of(self, item):
+        if isinstance(item, dict):
+            return tuple(item[field] for field in self.key_fields)
+        return tuple(getattr(item, field) for field in self.key_fields)
+
+    def _reordered(self, request, view):
+        """Whether `view` was asked to sort by something other than this paginator's key"""
+        backends = getattr(view, 'filter_backends', None) or ()
+        ordering = [
+            field.strip() for field in request.query_params.get(api_settings.ORDERING_PARAM, '').split(',')
+            if field.strip()
+        ]
+        if not ordering or not any(issubclass(backend, OrderingFilter) for backend in backends):
+            return False
+        key, pk = self.key_fields
+        return ordering not in ([f'-{key}'], [f'-{key}', f'-{pk}'])
+
+    def _use_legacy(self, request, view):
+        if wants_legacy(request):
+            return True
+        if not self._reordered(request, view):
+            return False
+        if self.legacy_pagination_class is None:
+            key, pk = self.key_fields
+            raise ValidationError({api_settings.ORDERING_PARAM: [
+                f'Only -{key} ordering is supported here, or add ?{LEGACY_PARAM}=legacy.'
+            ]})
+        return True
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self._use_legacy(request, view):
+            if self.legacy_pagination_class is None:
+                return None
+            self.legacy = self.legacy_pagination_class()
+            return self.legacy.paginate_queryset(queryset, request, view)
+
+        return self._cut(list(self._page_query(queryset, request)))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset() for async views"""
+        if self._use_legacy(request, view):
+            if self.legacy_pagination_class is None:
+                return None
+            return await sync_to_async(self.paginate_queryset)(queryset, request, view)
+        return self._cut([item async for item in self._page_query(queryset, request)])
+
+    def _page_query(self, queryset, request):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        key, pk = self.key_fields
+        queryset = queryset.order_by(f'-{key}', f'-{pk}')
+
+        position = self.decode_cursor(request)
+        if position is not None:
+            moment, last_pk = position
+            queryset = queryset.filter(Q(**{f'{key}__lt': moment}) | Q(**{key: moment, f'{pk}__lt': last_pk}))
+        return queryset[:self.page_size + 1]
+
+    def _cut(self, page):
+        self.has_next = len(page) > self.page_size
+        page = page[:self.page_size]
+        self.next_position = self._position_of(page[-1]) if self.has_next else None
+        return page
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def get_paginated_response(self, data):
+        if self.legacy is not None:
+            return self.legacy.get_paginated_response(data)
+        return Response({'next': self.get_next_link(), 'results': data})
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+class AsyncPageNumberPagination(PageNumberPagination):
+    """PageNumberPagination whose page is fetched with the async ORM"""
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+
+        paginator = self.django_paginator_class(queryset, page_size)
+        # Seed the paginator's cached count, so nothing below queries synchronously
+        paginator.count = await queryset.acount()
+        num_pages = max(1, math.ceil(paginator.count / page_size))
+        page_number = request.query_params.get(self.page_query_param) or 1
+        if page_number in self.last_page_strings:
+            page_number = num_pages
+        try:
+            number = int(page_number)
+            if not 1 <= number <= num_pages:
+                raise ValueError
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_page_message.format(page_number=page_number, message='Invalid page.'))
+
+        offset = (number - 1) * page_size
+        object_list = [item async for item in queryset[offset:offset + page_size]]
+        self.page = Page(object_list, number, paginator)
+        if num_pages > 1 and self.template is not None:
+            self.display_page_controls = True
+        self.request = request
+        return object_list
+
+
+class CreatedAtKeysetPagination(KeysetPagination):
+    key_fields = ('created_at', 'id')
+
+
+class PagedCreatedAtKeysetPagination(CreatedAtKeysetPagination):
+    """For endpoints that used PageNumberPagination before keyset paging"""
+    legacy_pagination_class = PageNumberPagination
+
+
+class DateJoinedKeysetPagination(KeysetPagination):
+    key_fields = ('date_joined', 'id')
+
+
+class TimestampKeysetPagination(KeysetPagination):
+    key_fields = ('timestamp', 'id')
+    legacy_pagination_class = PageNumberPagination
+
+
+def paginated_response(paginator, request, queryset, serialize, view=None):
+    """Paginate `queryset` for an APIView, rendering rows with `serialize`"""
+    page = paginator.paginate_queryset(queryset, request, view)
+    if page is None:
+        return Response(serialize(queryset))
+    return paginator.get_paginated_response(serialize(page))
+
+
+async def apaginated_response(paginator, request, queryset, serialize, view=None):
+    """paginated_response() for async views"""
+    page = await paginator.apaginate_queryset(queryset, request, view)
+    if page is None:
+        return Response(serialize([item async for item in queryset]))
+    return paginator.get_paginated_response(serialize(page))
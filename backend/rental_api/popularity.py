@@ -0,0 +1,83 @@
+"""
+Precomputed popularity score behind `?ordering=-popularity`.
+
+    popularity = 0.60 * bayesian rating        (rating pulled toward PRIOR_RATING
+                                                until a bike has a few reviews)
+               + 0.25 * booking volume          (completed rides in the last
+                                                WINDOW, log-scaled, capped)
+               + 0.15 * utilisation             (share of WINDOW spent on rides)
+
+Each part is scaled to 0..1, so the score is too. It lives in the indexed
+Bike.popularity column and is refreshed for a single bike whenever one of
+its reviews or completed bookings changes. Because the window slides,
+`manage.py recompute_popularity` should also run periodically (e.g. hourly
+from cron) to rescore every bike.
+"""
+import math
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, DurationField, ExpressionWrapper, F, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Bike, Booking
+
+WINDOW = timedelta(days=30)
+PRIOR_RATING = 3.5
+PRIOR_WEIGHT = 5  # reviews' worth of confidence in the prior
+VOLUME_CAP = 50  # completed rides per WINDOW that count as full volume
+WEIGHTS = {'rating': 0.60, 'volume': 0.25, 'utilisation': 0.15}
+
+
+def score(rating_sum, review_count, completed, ridden_seconds):
+    bayesian = (PRIOR_WEIGHT * PRIOR_RATING + rating_sum) / (PRIOR_WEIGHT + review_count)
+    rating_part = (bayesian - 1) / 4
+    volume_part = min(1.0, math.log1p(completed) / math.log1p(VOLUME_CAP))
+    utilisation = min(1.0, max(0.0, ridden_seconds / WINDOW.total_seconds()))
+    return round(
+        WEIGHTS['rating'] * rating_part + WEIGHTS['volume'] * volume_part + WEIGHTS['utilisation'] * utilisation,
+        6,
+    )
+
+
+def recent_activity(bike_ids=None):
+    """{bike_id: (completed rides, seconds ridden)} over the last WINDOW, in one grouped query"""
+    ride_length = ExpressionWrapper(
+        Coalesce('actual_end_time', 'booked_end_time', 'end_time') - F('start_time'),
+        output_field=DurationField(),
+    )
+    rides = Booking.objects.filter(status='completed', start_time__gte=timezone.now() - WINDOW)
+    if bike_ids is not None:
+        rides = rides.filter(bike_id__in=bike_ids)
+    activity = {}
+    for row in rides.values('bike_id').annotate(n=Count('id'), ridden=Sum(ride_length)).order_by():
+        activity[row['bike_id']] = (row['n'], row['ridden'].total_seconds() if row['ridden'] else 0)
+    return activity
+
+
+def _scores(bikes, activity):
+    for bike_id, rating_sum, review_count in bikes:
+        completed, ridden_seconds = activity.get(bike_id, (0, 0))
+        yield bike_id, score(rating_sum, review_count, completed, ridden_seconds)
+
+
+def refresh_popularity(bike_ids):
+    """Rescore the given bikes"""
+    bike_ids = list(bike_ids)
+    bikes = Bike.objects.filter(id__in=bike_ids).values_list('id', 'rating_sum', 'total_reviews')
+    for bike_id, popularity in _scores(bikes, recent_activity(bike_ids)):
+        Bike.objects.filter(id=bike_id).update(popularity=popularity)
+
+
+def refresh_popularity_on_commit(*bike_ids):
+    transaction.on_commit(lambda: refresh_popularity(bike_ids))
+
+
+def recompute_popularity(batch_size=500):
+    """Rescore every bike; returns how many were scored"""
+    bikes = Bike.objects.values_list('id', 'rating_sum', 'total_reviews').order_by('id')
+    scored = [Bike(id=bike_id, popularity=popularity) for bike_id, popularity in _scores(bikes, recent_activity())]
+    with transaction.atomic():
+        Bike.objects.bulk_update(scored, ['popularity'], batch_size=batch_size)
+    return len(scored)
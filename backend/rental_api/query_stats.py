@@ -0,0 +1,193 @@
+"""
+Per-endpoint SQL query counts and times, with N+1 detection.
+
+QueryStatsMiddleware samples SAMPLE_RATE of requests. For a sampled request,
+every query on every database alias is timed and reduced to its shape
+(literals and IN-lists folded, so `WHERE id = 3` and `WHERE id = 7` match).
+When the request finishes, its totals are added to the stats of its resolved
+view name. A shape that runs more than REPEAT_THRESHOLD times in one request
+is reported as a suspected N+1, logged as a warning on the
+`rental_api.query_stats` logger, and kept among that view's worst patterns.
+Unsampled requests cost one context variable lookup per query.
+
+The figures are per worker process and are not shared: GET
+/api/v1/admin/query-stats/ reports only the worker that happens to answer
+it (its `pid` is in the response), and DELETE clears only that worker's.
+With several workers, the N+1 warnings in the logs cover them all; the
+cross-worker latency and SQL-time figures are in /api/v1/admin/metrics/.
+
+Settings (all optional)::
+
+    QUERY_STATS = {
+        'SAMPLE_RATE': 0.01,      # 0 turns the middleware off
+        'REPEAT_THRESHOLD': 5,    # same shape more often than this is an N+1
+        'PATTERNS_PER_VIEW': 5,   # repeated shapes kept per view
+    }
+"""
+import contextvars
+import logging
+import random
+import re
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'SAMPLE_RATE': 0.01,
+    'REPEAT_THRESHOLD': 5,
+    'PATTERNS_PER_VIEW': 5,
+}
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_LIST = re.compile(r'\((?:\s*(?:%s|\?)\s*,)+\s*(?:%s|\?)\s*\)')
+_SPACE = re.compile(r'\s+')
+
+
+def query_stats_settings():
+    return {**DEFAULTS, **getattr(settings, 'QUERY_STATS', {})}
+
+
+def fingerprint(sql):
+    """The shape of a statement: its text with every literal and IN-list folded"""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _LIST.sub('(...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+class QueryLog:
+    """The queries of one sampled request"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def record(self, sql, duration):
+        self.count += 1
+        self.duration += duration
+        self.shapes[fingerprint(sql)] += 1
+
+    def repeated(self, threshold):
+        """(shape, times) for every shape run more than `threshold` times"""
+        return [(shape, times) for shape, times in self.shapes.most_common() if times > threshold]
+
+
+_query_log = contextvars.ContextVar('query_log', default=None)
+
+
+def should_sample():
+    rate = query_stats_settings()['SAMPLE_RATE']
+    return rate > 0 and (rate >= 1 or random.random() < rate)
+
+
+def begin_sampling():
+    log = QueryLog()
+    return log, _query_log.set(log)
+
+
+def end_sampling(token):
+    _query_log.reset(token)
+
+
+def _time_query(execute, sql, params, many, context):
+    log = _query_log.get()
+    if log is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        log.record(sql, time.perf_counter() - started)
+
+
+def install_query_timer(sender, connection, **kwargs):
+    if _time_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_time_query)
+
+
+connection_created.connect(install_query_timer, dispatch_uid='query-stats-timer')
+
+
+class ViewStats:
+    def __init__(self):
+        self.requests = 0
+        self.queries = 0
+        self.max_queries = 0
+        self.duration = 0.0
+        self.max_duration = 0.0
+        self.n_plus_one = 0
+        # shape -> [requests it repeated in, most repeats in one request]
+        self.patterns = {}
+
+    def add(self, log, repeated, keep):
+        self.requests += 1
+        self.queries += log.count
+        self.max_queries = max(self.max_queries, log.count)
+        self.duration += log.duration
+        self.max_duration = max(self.max_duration, log.duration)
+        if repeated:
+            self.n_plus_one += 1
+        for shape, times in repeated:
+            pattern = self.patterns.setdefault(shape, [0, 0])
+            pattern[0] += 1
+            pattern[1] = max(pattern[1], times)
+        if len(self.patterns) > keep:
+            worst = sorted(self.patterns.items(), key=lambda item: item[1][1], reverse=True)[:keep]
+            self.patterns = dict(worst)
+
+    def as_dict(self):
+        return {
+            'sampled_requests': self.requests,
+            'avg_queries': round(self.queries / self.requests, 1),
+            'max_queries': self.max_queries,
+            'avg_sql_ms': round(self.duration * 1000 / self.requests, 2),
+            'max_sql_ms': round(self.max_duration * 1000, 2),
+            'n_plus_one_requests': self.n_plus_one,
+            'repeated_queries': [
+                {'sql': shape, 'requests': requests, 'max_repeats': max_repeats}
+                for shape, (requests, max_repeats) in
+                sorted(self.patterns.items(), key=lambda item: item[1][1], reverse=True)
+            ],
+        }
+
+
+class QueryStatsRegistry:
+    """Per-view totals for this process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+        self._since = timezone.now()
+
+    def record(self, view_name, log):
+        config = query_stats_settings()
+        repeated = log.repeated(config['REPEAT_THRESHOLD'])
+        for shape, times in repeated:
+            logger.warning("Possible N+1 in %s: %d x %s", view_name, times, shape[:300])
+        with self._lock:
+            self._views.setdefault(view_name, ViewStats()).add(log, repeated, config['PATTERNS_PER_VIEW'])
+
+    def snapshot(self):
+        with self._lock:
+            views = {name: stats.as_dict() for name, stats in self._views.items()}
+        return dict(sorted(views.items(), key=lambda item: item[1]['avg_queries'], reverse=True))
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+            self._since = timezone.now()
+
+    @property
+    def since(self):
+        return self._since
+
+
+query_stats = QueryStatsRegistry()
@@ -0,0 +1,105 @@
+"""
+Running review totals on Bike.
+
+Each bike stores rating_sum and total_reviews; every review create, update
+and delete moves them with one F() UPDATE that also rewrites the displayed
+`rating` (their average, or the 4.5 default while a bike has no reviews),
+so listings read and sort by rating without aggregating Review.
+
+The review signals in rental_api.signals call apply_review_change(); views
+wrap review writes in transaction.atomic() so the bike totals commit or roll
+back with the review itself. `manage.py recompute_bike_ratings` rebuilds
+every bike's totals from the Review table.
+"""
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import (
+    Case, Count, DecimalField, ExpressionWrapper, F, FloatField, OuterRef, Subquery, Sum, Value, When,
+)
+from django.db.models.functions import Cast, Coalesce, Round
+from django.db.models.lookups import GreaterThan
+
+from .models import Bike, Review
+
+DEFAULT_RATING = Decimal('4.5')
+
+
+def rating_expression(rating_sum, review_count):
+    """SQL for the displayed rating given sum/count expressions"""
+    average = Cast(
+        ExpressionWrapper(Cast(rating_sum, FloatField()) / review_count, output_field=FloatField()),
+        DecimalField(max_digits=10, decimal_places=4),
+    )
+    return Case(
+        When(GreaterThan(review_count, 0), then=Round(average, 1)),
+        default=Value(DEFAULT_RATING),
+        output_field=Bike._meta.get_field('rating'),
+    )
+
+
+def apply_review_change(bike_id, rating_delta, count_delta):
+    """Move one bike's totals by the given deltas, in a single UPDATE"""
+    if not rating_delta and not count_delta:
+        return
+    rating_sum = F('rating_sum') + rating_delta
+    review_count = F('total_reviews') + count_delta
+    Bike.objects.filter(id=bike_id).update(
+        rating_sum=rating_sum,
+        total_reviews=review_count,
+        rating=rating_expression(rating_sum, review_count),
+    )
+
+
+def review_moved(previous, current):
+    """Apply the change from review state `previous` to `current`; each is {'bike_id', 'rating'} or None"""
+    if previous and current and previous['bike_id'] == current['bike_id']:
+        apply_review_change(current['bike_id'], current['rating'] - previous['rating'], 0)
+        return
+    if previous:
+        apply_review_change(previous['bike_id'], -previous['rating'], -1)
+    if current:
+        apply_review_change(current['bike_id'], current['rating'], 1)
+
+
+RECOMPUTE_SQL = {
+    # Bikes without reviews: back to zero and the default rating
+    'reset': """
+        UPDATE rental_api_bike
+        SET rating_sum = 0, total_reviews = 0, rating = %s
+        WHERE NOT EXISTS (SELECT 1 FROM rental_api_review WHERE rental_api_review.bike_id = rental_api_bike.id)
+    """,
+    # Everyone else from one grouped pass over the reviews
+    'update_from': """
+        UPDATE rental_api_bike
+        SET rating_sum = totals.rating_sum,
+            total_reviews = totals.review_count,
+            rating = ROUND(totals.rating_sum * 1.0 / totals.review_count, 1)
+        FROM (
+            SELECT bike_id, SUM(rating) AS rating_sum, COUNT(*) AS review_count
+            FROM rental_api_review
+            GROUP BY bike_id
+        ) AS totals
+        WHERE totals.bike_id = rental_api_bike.id
+    """,
+}
+
+
+def recompute_ratings():
+    """Rebuild every bike's totals from Review; returns the number of bikes with reviews"""
+    with transaction.atomic():
+        if connection.vendor in ('sqlite', 'postgresql'):
+            with connection.cursor() as cursor:
+                cursor.execute(RECOMPUTE_SQL['reset'], [DEFAULT_RATING])
+                cursor.execute(RECOMPUTE_SQL['update_from'])
+                return cursor.rowcount
+        # No UPDATE ... FROM here: correlated subqueries instead
+        reviews = Review.objects.filter(bike=OuterRef('pk')).order_by().values('bike')
+        rating_sum = Coalesce(Subquery(reviews.annotate(total=Sum('rating')).values('total')), 0)
+        review_count = Coalesce(Subquery(reviews.annotate(n=Count('id')).values('n')), 0)
+        Bike.objects.update(
+            rating_sum=rating_sum,
+            total_reviews=review_count,
+            rating=rating_expression(rating_sum, review_count),
+        )
+        return Bike.objects.filter(total_reviews__gt=0).count()
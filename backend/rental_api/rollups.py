@@ -0,0 +1,143 @@
+"""
+Hourly and daily rollups of Analytics events.
+
+`manage.py rollup_analytics` folds every Analytics row past the stored
+high-water mark into AnalyticsHourlyRollup and AnalyticsDailyRollup, so
+AdminAnalyticsView sums a handful of bucket rows instead of counting the raw
+event table. Rows that arrived since the last run are counted live, which
+keeps the endpoint exact between runs. `build.sh` runs it on every deploy;
+also run it from cron (e.g. every 15 minutes) so the live tail stays short.
+
+`manage.py prune_analytics` then deletes raw events older than
+ANALYTICS_RETENTION_DAYS, but only ones already folded into the rollups, so
+the counts above never change when old events go (e.g. daily from cron,
+after a rollup).
+"""
+from datetime import datetime, time, timedelta
+
+from django.db import router, transaction
+from django.db.models import Count, F, Max, Sum
+from django.db.models.functions import TruncDay, TruncHour
+from django.utils import timezone
+
+from .models import Analytics, AnalyticsDailyRollup, AnalyticsHourlyRollup, RollupWatermark
+
+WATERMARK_NAME = 'analytics'
+
+RESOLUTIONS = {
+    'hour': (AnalyticsHourlyRollup, TruncHour),
+    'day': (AnalyticsDailyRollup, TruncDay),
+}
+
+
+def get_watermark():
+    return RollupWatermark.objects.filter(name=WATERMARK_NAME).values_list('last_id', flat=True).first() or 0
+
+
+def _fold(rows, model, trunc):
+    """Add the grouped counts of `rows` into `model`'s buckets"""
+    grouped = rows.annotate(bucket=trunc('timestamp')).values('bucket', 'action', 'page').annotate(
+        n=Count('id')
+    ).order_by()
+    buckets = 0
+    for group in grouped:
+        updated = model.objects.filter(
+            bucket=group['bucket'], action=group['action'], page=group['page']
+        ).update(count=F('count') + group['n'])
+        if not updated:
+            model.objects.create(
+                bucket=group['bucket'], action=group['action'], page=group['page'], count=group['n']
+            )
+        buckets += 1
+    return buckets
+
+
+def rollup_analytics(batch_size=50000):
+    """Fold new Analytics rows into the rollups; returns (rows, buckets) processed"""
+    start_id = get_watermark()
+    end_id = Analytics.objects.filter(id__gt=start_id).aggregate(last=Max('id'))['last']
+    if end_id is None:
+        return 0, 0
+
+    rows_done = buckets_done = 0
+    low = start_id
+    while low < end_id:
+        high = min(low + batch_size, end_id)
+        rows = Analytics.objects.filter(id__gt=low, id__lte=high)
+        with transaction.atomic(using=router.db_for_write(RollupWatermark)):
+            # Watermark and buckets move together, so a crash never double-counts
+            watermark, _created = RollupWatermark.objects.select_for_update().get_or_create(name=WATERMARK_NAME)
+            if watermark.last_id != low:
+                # Another run got here first
+                break
+            rows_done += rows.count()
+            for model, trunc in RESOLUTIONS.values():
+                buckets_done += _fold(rows, model, trunc)
+            watermark.last_id = high
+            watermark.save()
+        low = high
+    return rows_done, buckets_done
+
+
+def reset_rollups():
+    with transaction.atomic(using=router.db_for_write(RollupWatermark)):
+        AnalyticsHourlyRollup.objects.all().delete()
+        AnalyticsDailyRollup.objects.all().delete()
+        RollupWatermark.objects.filter(name=WATERMARK_NAME).delete()
+
+
+def prune_events(days, batch_size=10000):
+    """Delete rolled-up events older than `days`; returns the number of rows removed"""
+    cutoff = timezone.now() - timedelta(days=days)
+    watermark = get_watermark()
+    removed = 0
+    while True:
+        # Small batches keep each write transaction (and its lock) short
+        ids = list(Analytics.objects.filter(id__lte=watermark, timestamp__lt=cutoff).order_by('id').values_list(
+            'id', flat=True
+        )[:batch_size])
+        if not ids:
+            return removed
+        removed += Analytics.objects.filter(id__in=ids).delete()[0]
+
+
+def local_day_start(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def action_counts(start=None, end=None):
+    """Event counts per action for [start, end), from the daily rollups plus the unrolled tail
+
+    Daily buckets are matched by their local-midnight start, so bounds
+    should be local midnights (see local_day_start).
+    """
+    watermark = get_watermark()
+    rolled = AnalyticsDailyRollup.objects.all()
+    tail = Analytics.objects.filter(id__gt=watermark)
+    if start is not None:
+        rolled = rolled.filter(bucket__gte=start)
+        tail = tail.filter(timestamp__gte=start)
+    if end is not None:
+        rolled = rolled.filter(bucket__lt=end)
+        tail = tail.filter(timestamp__lt=end)
+
+    counts = {}
+    for row in rolled.values('action').annotate(n=Sum('count')).order_by():
+        counts[row['action']] = counts.get(row['action'], 0) + row['n']
+    for row in tail.values('action').annotate(n=Count('id')).order_by():
+        counts[row['action']] = counts.get(row['action'], 0) + row['n']
+    return counts
+
+
+def timeline(resolution, start=None, end=None):
+    """Rolled-up counts per bucket and action, oldest first"""
+    model, _trunc = RESOLUTIONS[resolution]
+    rows = model.objects.all()
+    if start is not None:
+        rows = rows.filter(bucket__gte=start)
+    if end is not None:
+        rows = rows.filter(bucket__lt=end)
+    return [
+        {'bucket': row['bucket'], 'action': row['action'], 'count': row['n']}
+        for row in rows.values('bucket', 'action').annotate(n=Sum('count')).order_by('bucket', 'action')
+    ]
@@ -0,0 +1,256 @@
+"""
+Database routing: telemetry on its own database, and read replicas for the
+heavy read-only endpoints.
+
+TelemetryRouter keeps Analytics and its rollup tables on the TELEMETRY_DB
+alias when DATABASES defines it, so bursts of anonymous click-tracking
+writes take that file's write lock, never the one bookings need. Those
+tables are created there by `manage.py migrate --database=analytics`; every
+other migration (including data migrations) skips that database.
+
+Views that mix in ReplicaReadsMixin answer GET/HEAD requests from one of the
+READ_REPLICAS aliases (round-robin), while every write, and every read
+outside those views, stays on `default`. ReplicaRouter only sees the
+per-request state that ReplicaRoutingMiddleware sets up, so reads inside
+booking transactions can never land on a lagging copy.
+
+Read-your-writes: when a request writes anything, the middleware pins its
+user to the primary for STICKY_SECONDS, so their next reads see their own
+change even if a replica has not caught up yet. Pins live in the shared
+Django cache (settings.CACHES), so they hold whichever worker serves the
+next request.
+
+Failover: a replica that cannot connect, or fails a query, is skipped for
+RETRY_AFTER seconds; a request whose replica failed mid-way is answered
+again from the primary.
+
+Settings (all optional)::
+
+    READ_REPLICAS = {
+        'ALIASES': ['replica'],  # DATABASES aliases; empty keeps every read on default
+        'STICKY_SECONDS': 10,
+        'RETRY_AFTER': 30,
+    }
+
+Set LOCAL_READ_REPLICA=True to add a `replica` alias that opens the primary
+file over a second connection, as a stand-in for a real replica; both
+settings.py and settings_production.py honour it.
+"""
+import contextvars
+import itertools
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.db.backends.signals import connection_created
+from rest_framework.permissions import SAFE_METHODS
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ALIASES': [],
+    'STICKY_SECONDS': 10,
+    'RETRY_AFTER': 30,
+}
+
+
+def replica_settings():
+    return {**DEFAULTS, **getattr(settings, 'READ_REPLICAS', {})}
+
+
+class RequestState:
+    """Routing decisions for the request being handled"""
+
+    def __init__(self):
+        self.read_alias = None
+        self.wrote = False
+        self.replica_failed = False
+
+
+_request_state = contextvars.ContextVar('replica_request_state', default=None)
+_down_until = {}
+_next_replica = itertools.count()
+
+
+def begin_request():
+    state = RequestState()
+    return state, _request_state.set(state)
+
+
+def end_request(token):
+    _request_state.reset(token)
+
+
+def _sticky_key(user_id):
+    return f'db_sticky:{user_id}'
+
+
+def pin_to_primary(user_id):
+    cache.set(_sticky_key(user_id), True, replica_settings()['STICKY_SECONDS'])
+
+
+def is_pinned(user_id):
+    return cache.get(_sticky_key(user_id), False)
+
+
+def mark_down(alias):
+    _down_until[alias] = time.monotonic() + replica_settings()['RETRY_AFTER']
+
+
+def choose_replica():
+    """A reachable replica alias, or None to stay on the primary"""
+    now = time.monotonic()
+    aliases = [alias for alias in replica_settings()['ALIASES'] if _down_until.get(alias, 0) <= now]
+    start = next(_next_replica)
+    for offset in range(len(aliases)):
+        alias = aliases[(start + offset) % len(aliases)]
+        try:
+            connections[alias].ensure_connection()
+            return alias
+        except DatabaseError as e:
+            logger.warning('Replica %s unavailable, reading from primary: %s', alias, e)
+            mark_down(alias)
+    return None
+
+
+def _watch_replica(execute, sql, params, many, context):
+    try:
+        return execute(sql, params, many, context)
+    except DatabaseError as e:
+        logger.warning('Query on replica %s failed, answering from primary: %s', context['connection'].alias, e)
+        mark_down(context['connection'].alias)
+        state = _request_state.get()
+        if state is not None:
+            state.replica_failed = True
+        raise
+
+
+def install_replica_watch(sender, connection, **kwargs):
+    if connection.alias in replica_settings()['ALIASES'] and _watch_replica not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_watch_replica)
+
+
+connection_created.connect(install_replica_watch, dispatch_uid='replica-watch')
+
+
+TELEMETRY_DB = 'analytics'
+# rental_api models that live on TELEMETRY_DB; add future telemetry tables here
+TELEMETRY_MODELS = frozenset({'analytics', 'analyticshourlyrollup', 'analyticsdailyrollup', 'rollupwatermark'})
+
+
+def telemetry_enabled():
+    return TELEMETRY_DB in settings.DATABASES
+
+
+def is_telemetry(app_label, model_name):
+    return app_label == 'rental_api' and model_name in TELEMETRY_MODELS
+
+
+class TelemetryRouter:
+    def _route(self, model, hints):
+        if not telemetry_enabled():
+            return None
+        if is_telemetry(model._meta.app_label, model._meta.model_name):
+            return TELEMETRY_DB
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db == TELEMETRY_DB:
+            # e.g. event.user: Django would otherwise follow the event to its database
+            return DEFAULT_DB_ALIAS
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._route(model, hints)
+
+    def db_for_write(self, model, **hints):
+        return self._route(model, hints)
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Analytics.user points across databases (no DB-level constraint)
+        if TELEMETRY_DB in (obj1._state.db, obj2._state.db):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if not telemetry_enabled():
+            return None
+        if db == TELEMETRY_DB:
+            return is_telemetry(app_label, model_name)
+        if is_telemetry(app_label, model_name):
+            return False
+        return None
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _request_state.get()
+        if state is not None and state.read_alias:
+            return state.read_alias
+        return None
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None:
+            state.wrote = True
+        # Explicitly, so objects read from a replica are never saved back to it
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        pool = {DEFAULT_DB_ALIAS, *replica_settings()['ALIASES']}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in replica_settings()['ALIASES']:
+            return False
+        return None
+
+
+class ReplicaReadsMixin:
+    """APIView mixin: serve safe-method requests from a read replica"""
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        state = _request_state.get()
+        if state is None or state.replica_failed or request.method not in SAFE_METHODS:
+            return
+        if request.user.is_authenticated and is_pinned(request.user.pk):
+            return
+        state.read_alias = choose_replica()
+
+    def dispatch(self, request, *args, **kwargs):
+        if iscoroutinefunction(super().dispatch):
+            return self._adispatch(request, *args, **kwargs)
+        state = _request_state.get()
+        try:
+            response = super().dispatch(request, *args, **kwargs)
+        except DatabaseError:
+            if state is None or not state.replica_failed:
+                raise
+            response = None
+        if self._retry_on_primary(state, response):
+            response = super().dispatch(request, *args, **kwargs)
+        return response
+
+    async def _adispatch(self, request, *args, **kwargs):
+        state = _request_state.get()
+        try:
+            response = await super().dispatch(request, *args, **kwargs)
+        except DatabaseError:
+            if state is None or not state.replica_failed:
+                raise
+            response = None
+        if self._retry_on_primary(state, response):
+            response = await super().dispatch(request, *args, **kwargs)
+        return response
+
+    def _retry_on_primary(self, state, response):
+        if state is None or not state.replica_failed or (response is not None and response.status_code < 500):
+            return False
+        # The replica broke mid-request (many views turn that into a 500
+        # themselves); a safe request can simply be re-run on the primary
+        state.read_alias = None
+        return True
@@ -0,0 +1,107 @@
+"""
+Full-text bike search.
+
+On SQLite, `?search=` is answered from the rental_api_bike_fts FTS5 index
+(created and kept in sync by triggers in migration 0024) instead of one
+LIKE '%term%' scan per column. Every term is matched as a token prefix
+("mou" finds "Mountain"), all terms must match, and results are ordered by
+BM25 with name hits weighted highest. Matching bikes carry a
+`search_snippet` with the hit wrapped in <mark>.
+
+Other databases, or a SQLite build without the index, fall back to DRF's
+SearchFilter over the same columns.
+"""
+from asgiref.sync import sync_to_async
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from rest_framework import filters
+
+from .models import Bike
+
+FTS_TABLE = 'rental_api_bike_fts'
+# Keep FTS_TABLE in step with rental_api_bike; see checks.check_bike_fts_triggers
+FTS_TRIGGERS = ('rental_api_bike_fts_ai', 'rental_api_bike_fts_ad', 'rental_api_bike_fts_au')
+SEARCH_COLUMNS = ['name', 'model', 'brand', 'bike_type', 'description']
+# BM25 column weights, in SEARCH_COLUMNS order
+COLUMN_WEIGHTS = (10.0, 5.0, 5.0, 2.0, 1.0)
+SNIPPET_TOKENS = 12
+
+_fts_available = {}
+
+
+def fts_available(alias=DEFAULT_DB_ALIAS):
+    """Whether the FTS5 index exists on this database (checked once per alias)"""
+    if alias not in _fts_available:
+        connection = connections[alias]
+        available = False
+        if connection.vendor == 'sqlite':
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+                    available = cursor.fetchone() is not None
+            except DatabaseError:
+                available = False
+        _fts_available[alias] = available
+    return _fts_available[alias]
+
+
+async def afts_available(alias=DEFAULT_DB_ALIAS):
+    if alias in _fts_available:
+        return _fts_available[alias]
+    return await sync_to_async(fts_available)(alias)
+
+
+def match_expression(terms):
+    """FTS5 query requiring every term as a token prefix, or None if nothing is searchable"""
+    phrases = []
+    for term in terms:
+        # Quoting makes FTS5 syntax in user input literal
+        term = term.replace('"', ' ').strip()
+        if term:
+            phrases.append(f'"{term}"*')
+    return ' '.join(phrases) or None
+
+
+def fts_search(queryset, terms):
+    """Bikes matching `terms`, annotated with search_rank (lower is better) and search_snippet"""
+    match = match_expression(terms)
+    if match is None:
+        return queryset
+    bike_table = Bike._meta.db_table
+    weights = ', '.join(str(weight) for weight in COLUMN_WEIGHTS)
+    return queryset.extra(
+        select={
+            'search_rank': f'bm25({FTS_TABLE}, {weights})',
+            'search_snippet': f"snippet({FTS_TABLE}, -1, '<mark>', '</mark>', '…', {SNIPPET_TOKENS})",
+        },
+        tables=[FTS_TABLE],
+        where=[f'{FTS_TABLE}.rowid = {bike_table}.id', f'{FTS_TABLE} MATCH %s'],
+        params=[match],
+    )
+
+
+def is_ranked(queryset):
+    return 'search_rank' in queryset.query.extra
+
+
+class BikeSearchFilter(filters.SearchFilter):
+    """SearchFilter backed by the FTS5 index where the database has it"""
+
+    def filter_queryset(self, request, queryset, view):
+        terms = self.get_search_terms(request)
+        if not terms:
+            return queryset
+        if fts_available(queryset.db):
+            return fts_search(queryset, terms)
+        return super().filter_queryset(request, queryset, view)
+
+
+class SearchRankOrderingFilter(filters.OrderingFilter):
+    """OrderingFilter that keeps relevance order for searches without ?ordering="""
+
+    def filter_queryset(self, request, queryset, view):
+        if is_ranked(queryset) and not self.get_ordering_param(request):
+            return queryset.order_by('search_rank', '-added_on')
+        return super().filter_queryset(request, queryset, view)
+
+    def get_ordering_param(self, request):
+        return request.query_params.get(self.ordering_param)
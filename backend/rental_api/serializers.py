@@ -1,19 +1,44 @@
 from rest_framework import serializers
 from django.contrib.auth import get_user_model, authenticate
 from django.contrib.auth.password_validation import validate_password
-from .models import Bike, Booking, Review, Analytics
+from django.db import IntegrityError
+from django.utils.dateparse import parse_datetime
+from .fieldsets import SparseFieldsetMixin
+from .usernames import create_user_with_unique_username, username_prefix
+from .models import Bike, Booking, Review, Analytics, user_email_match
 from rest_framework_simplejwt.tokens import RefreshToken
 
 
 User = get_user_model()
 
 
+def duration_hours(start, end):
+    """Hours from start to end (datetimes or ISO strings), rounded to 2 places; None if end is unset"""
+    if not end:
+        return None
+    try:
+        # Ensure we're working with datetime objects
+        if isinstance(end, str):
+            end = parse_datetime(end)
+        if isinstance(start, str):
+            start = parse_datetime(start)
+        return round((end - start).total_seconds() / 3600, 2)
+    except (TypeError, ValueError):
+        return None
+
+
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'first_name', 'last_name', 'full_name', 'is_verified', 'phone_number', 'address', 'is_staff', 'is_superuser']
         read_only_fields = ['id', 'is_verified', 'is_staff', 'is_superuser']  # These fields shouldn't be updated via profile
 
+    def validate_email(self, value):
+        # The unique index ignores case, so must this check
+        if User.objects.filter(user_email_match(value)).exclude(pk=self.instance.pk).exists():
+            raise serializers.ValidationError("A user with this email already exists.")
+        return value
+
 
 class RegisterSerializer(serializers.ModelSerializer):
     password = serializers.CharField(write_only=True, required=True, validators=[validate_password])
@@ -27,7 +52,7 @@ class RegisterSerializer(serializers.ModelSerializer):
 
     def validate_email(self, value):
         print(f"Validating email: {value}")
-        if User.objects.filter(email=value).exists():
+        if User.objects.filter(user_email_match(value)).exists():
             print(f"Email {value} already exists")
             raise serializers.ValidationError("A user with this email already exists.")
         print(f"Email {value} is valid")
@@ -46,27 +71,19 @@ class RegisterSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         email = validated_data['email']
-        full_name = validated_data['full_name']
-        phone_number = validated_data['phone_number']
-        base_username = email.split('@')[0]
-        
-        # Handle username conflicts by adding a number if needed
-        username = base_username
-        counter = 1
-        while User.objects.filter(username=username).exists():
-            username = f"{base_username}{counter}"
-            counter += 1
-        
-        user = User.objects.create(
-            username=username,
-            email=email,
-            full_name=full_name,
-            phone_number=phone_number,
-            is_verified=False,    
-        )
-        user.set_password(validated_data['password'])
-        user.save()
-        return user
+        # Usernames come from the email's local part, suffixed on collision
+        try:
+            return create_user_with_unique_username(
+                username_prefix(email),
+                validated_data['password'],
+                email=email,
+                full_name=validated_data['full_name'],
+                phone_number=validated_data['phone_number'],
+                is_verified=False,
+            )
+        except IntegrityError:
+            # A concurrent signup took the address after validate_email ran
+            raise serializers.ValidationError({'email': ["A user with this email already exists."]})
 
 
 class AdminUserCreateSerializer(serializers.ModelSerializer):
@@ -81,7 +98,7 @@ class AdminUserCreateSerializer(serializers.ModelSerializer):
         return value
 
     def validate_email(self, value):
-        if User.objects.filter(email=value).exists():
+        if User.objects.filter(user_email_match(value)).exists():
             raise serializers.ValidationError("A user with this email already exists.")
         return value
 
@@ -118,6 +135,44 @@ class AdminUserCreateSerializer(serializers.ModelSerializer):
         return user
 
 
+class AdminUserUpdateSerializer(serializers.ModelSerializer):
+    password = serializers.CharField(write_only=True, required=False, allow_blank=True)
+    username = serializers.CharField(required=False, max_length=150)
+    email = serializers.EmailField(required=False, allow_blank=True)
+    role = serializers.CharField(required=False)
+
+    def validate_username(self, value):
+        if User.objects.filter(username=value).exclude(pk=self.instance.pk).exists():
+            raise serializers.ValidationError("A user with this username already exists.")
+        return value
+
+    def validate_email(self, value):
+        if User.objects.filter(user_email_match(value)).exclude(pk=self.instance.pk).exists():
+            raise serializers.ValidationError("A user with this email already exists.")
+        return value
+
+    class Meta:
+        model = User
+        fields = ['username', 'email', 'password', 'role']
+
+    def update(self, instance, validated_data):
+        if 'username' in validated_data:
+            instance.username = validated_data['username']
+        if 'email' in validated_data:
+            instance.email = validated_data['email']
+        if validated_data.get('password'):
+            instance.set_password(validated_data['password'])
+        if 'role' in validated_data:
+            # Anything but 'admin' makes a customer, as before
+            instance.is_staff = instance.is_superuser = validated_data['role'] == 'admin'
+        try:
+            instance.save()
+        except IntegrityError:
+            # Another request took the username or address after validation ran
+            raise serializers.ValidationError("A user with this username or email already exists.")
+        return instance
+
+
 class ChangePasswordSerializer(serializers.Serializer):
     old_password = serializers.CharField(required=True, error_messages={
         'required': 'Old password wrong please input current password.',
@@ -133,7 +188,10 @@ class BikeSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Bike
-        fields = '__all__'
+        # Internal running totals and sort keys (rental_api.ratings, rental_api.popularity)
+        exclude = ['rating_sum', 'popularity']
+        # Maintained from the reviews (see rental_api.ratings)
+        read_only_fields = ['rating', 'total_reviews']
 
     def validate_image(self, value):
         """Validate image file if provided"""
@@ -178,6 +236,14 @@ class BikeSerializer(serializers.ModelSerializer):
         return f"{obj.rating}/5 ({obj.total_reviews} reviews)"
 
 
+class BikeSearchResultSerializer(BikeSerializer):
+    search_snippet = serializers.SerializerMethodField()
+
+    def get_search_snippet(self, obj):
+        """Matched text with the hit in <mark>, when the full-text index answered the search"""
+        return getattr(obj, 'search_snippet', None)
+
+
 class BookingSerializer(serializers.ModelSerializer):
     bike_name = serializers.CharField(source='bike.name', read_only=True)
     user_name = serializers.CharField(source='user.username', read_only=True)
@@ -192,74 +258,13 @@ class BookingSerializer(serializers.ModelSerializer):
         read_only_fields = ['user', 'total_price', 'actual_end_time', 'actual_total_price']
 
     def get_actual_duration_hours(self, obj):
-        if obj.actual_end_time:
-            try:
-                # Ensure we're working with datetime objects
-                if isinstance(obj.actual_end_time, str):
-                    from django.utils.dateparse import parse_datetime
-                    actual_end = parse_datetime(obj.actual_end_time)
-                else:
-                    actual_end = obj.actual_end_time
-                
-                if isinstance(obj.start_time, str):
-                    from django.utils.dateparse import parse_datetime
-                    start = parse_datetime(obj.start_time)
-                else:
-                    start = obj.start_time
-                
-                duration = (actual_end - start).total_seconds() / 3600
-                return round(duration, 2)
-            except (TypeError, ValueError):
-                return None
-        return None
+        return duration_hours(obj.start_time, obj.actual_end_time)
 
     def get_original_duration_hours(self, obj):
-        try:
-            # Check if end_time exists (it can be None for new bookings)
-            if not obj.end_time:
-                return None
-                
-            # Ensure we're working with datetime objects
-            if isinstance(obj.end_time, str):
-                from django.utils.dateparse import parse_datetime
-                end = parse_datetime(obj.end_time)
-            else:
-                end = obj.end_time
-            
-            if isinstance(obj.start_time, str):
-                from django.utils.dateparse import parse_datetime
-                start = parse_datetime(obj.start_time)
-            else:
-                start = obj.start_time
-            
-            duration = (end - start).total_seconds() / 3600
-            return round(duration, 2)
-        except (TypeError, ValueError):
-            return None
+        return duration_hours(obj.start_time, obj.end_time)
 
     def get_booked_duration_hours(self, obj):
-        try:
-            # Check if booked_end_time exists
-            if not obj.booked_end_time:
-                return None
-                
-            # Ensure we're working with datetime objects
-            if isinstance(obj.booked_end_time, str):
-                from django.utils.dateparse import parse_datetime
-                booked_end = parse_datetime(obj.booked_end_time)
-            else:
-                booked_end = obj.booked_end_time
-            
-            if isinstance(obj.start_time, str):
-                from django.utils.dateparse import parse_datetime
-                start = parse_datetime(obj.start_time)
-            else:
-                start = obj.start_time
-            
-            duration = (booked_end - start).total_seconds() / 3600
-            return round(duration, 2)
-        except (TypeError, ValueError):
-            return None
+        return duration_hours(obj.start_time, obj.booked_end_time)
 
     def validate(self, data):
         bike = data.get('bike')
@@ -276,7 +281,7 @@ class BookingSerializer(serializers.ModelSerializer):
         return data
 
 
-class AdminBookingSerializer(serializers.ModelSerializer):
+class AdminBookingSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     user = UserSerializer(read_only=True)
     bike = BikeSerializer(read_only=True)
     price_per_hour = serializers.DecimalField(source='bike.price_per_hour', read_only=True, max_digits=10, decimal_places=2)
@@ -289,77 +294,16 @@ class AdminBookingSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'bike', 'start_time', 'booked_end_time', 'end_time', 'actual_end_time', 'total_price', 'actual_total_price', 'status', 'created_at', 'price_per_hour', 'actual_duration_hours', 'original_duration_hours', 'booked_duration_hours']
 
     def get_actual_duration_hours(self, obj):
-        if obj.actual_end_time:
-            try:
-                # Ensure we're working with datetime objects
-                if isinstance(obj.actual_end_time, str):
-                    from django.utils.dateparse import parse_datetime
-                    actual_end = parse_datetime(obj.actual_end_time)
-                else:
-                    actual_end = obj.actual_end_time
-                
-                if isinstance(obj.start_time, str):
-                    from django.utils.dateparse import parse_datetime
-                    start = parse_datetime(obj.start_time)
-                else:
-                    start = obj.start_time
-                
-                duration = (actual_end - start).total_seconds() / 3600
-                return round(duration, 2)
-            except (TypeError, ValueError):
-                return None
-        return None
+        return duration_hours(obj.start_time, obj.actual_end_time)
 
     def get_original_duration_hours(self, obj):
-        try:
-            # Check if end_time exists (it can be None for new bookings)
-            if not obj.end_time:
-                return None
-                
-            # Ensure we're working with datetime objects
-            if isinstance(obj.end_time, str):
-                from django.utils.dateparse import parse_datetime
-                end = parse_datetime(obj.end_time)
-            else:
-                end = obj.end_time
-            
-            if isinstance(obj.start_time, str):
-                from django.utils.dateparse import parse_datetime
-                start = parse_datetime(obj.start_time)
-            else:
-                start = obj.start_time
-            
-            duration = (end - start).total_seconds() / 3600
-            return round(duration, 2)
-        except (TypeError, ValueError):
-            return None
+        return duration_hours(obj.start_time, obj.end_time)
 
     def get_booked_duration_hours(self, obj):
-        try:
-            # Check if booked_end_time exists
-            if not obj.booked_end_time:
-                return None
-                
-            # Ensure we're working with datetime objects
-            if isinstance(obj.booked_end_time, str):
-                from django.utils.dateparse import parse_datetime
-                booked_end = parse_datetime(obj.booked_end_time)
-            else:
-                booked_end = obj.booked_end_time
-            
-            if isinstance(obj.start_time, str):
-                from django.utils.dateparse import parse_datetime
-                start = parse_datetime(obj.start_time)
-            else:
-                start = obj.start_time
-            
-            duration = (booked_end - start).total_seconds() / 3600
-            return round(duration, 2)
-        except (TypeError, ValueError):
-            return None
+        return duration_hours(obj.start_time, obj.booked_end_time)
 
 
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     user_name = serializers.CharField(source='user.username', read_only=True)
     bike_name = serializers.CharField(source='bike.name', read_only=True)
     user = UserSerializer(read_only=True)
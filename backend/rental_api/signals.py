@@ -0,0 +1,115 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_init, pre_save, post_save, pre_delete, post_delete
+from django.dispatch import receiver
+
+from . import counters
+from .authentication import invalidate_user_on_commit
+from .popularity import refresh_popularity_on_commit
+from .ratings import review_moved
+from .facets import invalidate_facets_on_commit
+from .live import publish_bike_change_on_commit
+from .availability import availability_index
+from .models import Analytics, Bike, Booking, Review
+
+User = get_user_model()
+
+COUNTED_MODELS = (User, Bike, Booking, Review)
+
+
+@receiver(post_save, sender=Booking)
+def sync_booking_availability(sender, instance, **kwargs):
+    """Keep the in-process availability index in step with booking writes"""
+    availability_index.sync(instance)
+
+
+@receiver(post_delete, sender=Booking)
+def discard_booking_availability(sender, instance, **kwargs):
+    availability_index.discard(instance.id)
+
+
+@receiver(post_save, sender=Bike)
+@receiver(post_delete, sender=Bike)
+def invalidate_bike_facets(sender, instance, **kwargs):
+    """Catalogue edits (admin writes included) make every cached facet snapshot stale"""
+    invalidate_facets_on_commit()
+
+
+@receiver(post_save, sender=Bike)
+def publish_saved_bike(sender, instance, created, **kwargs):
+    """Admin edits reach the live availability stream too (transitions publish their own)"""
+    previous = None if created else (getattr(instance, '_counter_previous', None) or {}).get('status')
+    publish_bike_change_on_commit(instance.id, 'created' if created else 'updated', instance.status, previous)
+
+
+@receiver(post_delete, sender=Bike)
+def publish_deleted_bike(sender, instance, **kwargs):
+    publish_bike_change_on_commit(instance.id, 'deleted', None, instance.status)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    """Any write to a user (role, password, is_active, deletion) retires their cached JWT snapshot"""
+    invalidate_user_on_commit(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def detach_user_analytics(sender, instance, **kwargs):
+    """Analytics.user has no database constraint (it may live on another database); null it by hand"""
+    Analytics.objects.filter(user_id=instance.pk).update(user=None)
+
+
+@receiver(pre_save, sender=Review)
+def capture_previous_review(sender, instance, **kwargs):
+    instance._review_previous = None if instance._state.adding else (
+        Review.objects.filter(pk=instance.pk).values('bike_id', 'rating').first()
+    )
+
+
+@receiver(post_save, sender=Review)
+def update_bike_rating_on_save(sender, instance, **kwargs):
+    """Move the bike's running rating totals (and the old bike's, if the review moved)"""
+    previous = getattr(instance, '_review_previous', None)
+    review_moved(previous, {'bike_id': instance.bike_id, 'rating': instance.rating})
+    refresh_popularity_on_commit(instance.bike_id, *([previous['bike_id']] if previous else []))
+
+
+@receiver(post_delete, sender=Review)
+def update_bike_rating_on_delete(sender, instance, **kwargs):
+    review_moved({'bike_id': instance.bike_id, 'rating': instance.rating}, None)
+    refresh_popularity_on_commit(instance.bike_id)
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def refresh_popularity_for_ride(sender, instance, **kwargs):
+    """Completed rides feed the bike's volume and utilisation"""
+    if instance.status == 'completed':
+        refresh_popularity_on_commit(instance.bike_id)
+
+
+def remember_counter_state(sender, instance, **kwargs):
+    counters.remember(instance)
+
+
+def capture_previous_counter_state(sender, instance, **kwargs):
+    instance._counter_previous = None if instance._state.adding else counters.stored_state(instance)
+
+
+def update_counters_on_save(sender, instance, created, **kwargs):
+    """Apply the dashboard counter deltas for a created or updated row"""
+    previous = None if created else getattr(instance, '_counter_previous', None)
+    counters.remember(instance)
+    counters.record_change(sender, previous, instance._counter_state or counters.stored_state(instance))
+
+
+def update_counters_on_delete(sender, instance, **kwargs):
+    counters.record_change(sender, getattr(instance, '_counter_previous', None), None)
+
+
+for model in COUNTED_MODELS:
+    post_init.connect(remember_counter_state, sender=model, dispatch_uid=f'counter-init-{model.__name__}')
+    pre_save.connect(capture_previous_counter_state, sender=model, dispatch_uid=f'counter-pre-save-{model.__name__}')
+    post_save.connect(update_counters_on_save, sender=model, dispatch_uid=f'counter-save-{model.__name__}')
+    pre_delete.connect(capture_previous_counter_state, sender=model, dispatch_uid=f'counter-pre-delete-{model.__name__}')
+    post_delete.connect(update_counters_on_delete, sender=model, dispatch_uid=f'counter-delete-{model.__name__}')
@@ -1,3 +1,1473 @@
-from django.test import TestCase
+import json
+import os
+import re
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+from importlib import import_module
+from contextlib import ExitStack
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core import mail
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.mail import EmailMessage
+from django.db import IntegrityError, OperationalError, connection, connections, transaction
+from django.db.models import Sum
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.db.utils import ConnectionHandler
+from django.test import (
+    AsyncClient, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework import filters
+from rest_framework.exceptions import ValidationError
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .authentication import UserCache, _version_key, user_cache, user_version
+from .availability import ACTIVE_BOOKING_STATUSES, GENERATION_KEY, SLOT_SECONDS, availability_index, current_generation
+from .checks import check_bike_fts_triggers, check_shared_cache
+from .counters import (
+    BUILT_MARKER, TRACKING_MARKER, aggregate_dashboard_stats, apply_deltas, forget_tracking, read_counters,
+    rebuild_counters, recent_since,
+)
+from .fast_serializers import admin_booking_list_serializer, booking_list_serializer
+from .facets import VERSION_KEY as FACET_VERSION_KEY, facet_version
+from .ingest import AnalyticsBuffer, clean_event
+from .live import live_events
+from .metrics import _dump, metrics, quantile
+from .models import (
+    User, Bike, Booking, Review, Analytics, AnalyticsDailyRollup, AnalyticsHourlyRollup, DashboardCounter,
+    OutboxEmail, UsernameCounter,
+)
+from .outbox import claim_batch, drain, outbox_settings, queue_email
+from .pagination import CreatedAtKeysetPagination
+from .popularity import PRIOR_RATING, VOLUME_CAP, WINDOW, recent_activity, recompute_popularity, score
+from .ratings import DEFAULT_RATING, recompute_ratings
+from .rollups import action_counts, get_watermark, local_day_start, prune_events, rollup_analytics
+from .query_stats import begin_sampling, end_sampling, fingerprint, query_stats
+from .middleware import ReplicaRoutingMiddleware
+from .routers import TELEMETRY_DB, _down_until, _sticky_key, _watch_replica, choose_replica, is_pinned
+from .usernames import create_user_with_unique_username
+from .serializers import AdminBookingSerializer, BookingSerializer
+from .transitions import (
+    BookingTransitionError, _overlapping_bookings, cancel_booking, create_booking, end_ride, start_ride,
+)
+
+
+class SharedCacheMixin:
+    """Gives each test its own FileBasedCache directory, the way worker processes share one"""
+
+    def setUp(self):
+        super().setUp()
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir, ignore_errors=True)
+        override = override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': self.cache_dir,
+        }})
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def other_worker_cache(self):
+        """The same cache as another process sees it"""
+        return FileBasedCache(self.cache_dir, {})
+
+
+class BookingTransitionStressTest(TransactionTestCase):
+    """Many threads racing for the same bike must never double-book it"""
+
+    THREADS = 12
+
+    def setUp(self):
+        availability_index.reset()
+        self.bike = Bike.objects.create(
+            name='Storm', brand='Trek', model='X1', bike_type='mountain', price_per_hour=100
+        )
+        self.users = [
+            User.objects.create(username=f'rider{i}', email=f'rider{i}@example.com', is_verified=True)
+            for i in range(self.THREADS)
+        ]
+
+    def tearDown(self):
+        availability_index.reset()
+
+    def _race(self, target):
+        barrier = threading.Barrier(self.THREADS)
+        outcomes = []
+
+        def run(i):
+            try:
+                barrier.wait()
+                target(i)
+                outcomes.append('ok')
+            except BookingTransitionError:
+                outcomes.append('rejected')
+            except OperationalError:
+                # SQLite refused the concurrent writer outright
+                outcomes.append('locked')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return outcomes
+
+    def test_overlapping_bookings_storm(self):
+        start = timezone.now() + timedelta(hours=1)
+
+        def book(i):
+            # Every window overlaps every other one
+            create_booking(self.users[i], self.bike.id, start + timedelta(minutes=i), start + timedelta(hours=2))
+
+        outcomes = self._race(book)
+
+        self.assertEqual(outcomes.count('ok'), 1)
+        self.assertEqual(Booking.objects.filter(bike=self.bike, status='confirmed').count(), 1)
+        self.bike.refresh_from_db()
+        self.assertEqual(self.bike.status, 'booked')
+
+    def test_overlapping_bookings_storm_with_stale_index(self):
+        # Another worker's index may not know about fresh bookings; the guarded
+        # transaction alone has to keep the bike single-booked
+        start = timezone.now() + timedelta(hours=1)
+
+        def book(i):
+            create_booking(self.users[i], self.bike.id, start, start + timedelta(hours=1))
+
+        with mock.patch.object(availability_index, 'is_free', return_value=True):
+            outcomes = self._race(book)
+
+        self.assertEqual(outcomes.count('ok'), 1)
+        self.assertEqual(Booking.objects.filter(bike=self.bike, status='confirmed').count(), 1)
+
+    def test_start_ride_storm(self):
+        start = timezone.now()
+        bookings = [
+            Booking.objects.create(
+                user=self.users[i], bike=self.bike, status='confirmed',
+                start_time=start, booked_end_time=start + timedelta(hours=1),
+            )
+            for i in range(self.THREADS)
+        ]
+
+        outcomes = self._race(lambda i: start_ride(bookings[i]))
+
+        self.assertEqual(outcomes.count('ok'), 1)
+        self.assertEqual(Booking.objects.filter(bike=self.bike, status='in_use').count(), 1)
+        self.bike.refresh_from_db()
+        self.assertEqual(self.bike.status, 'in_use')
+
+
+class QueryPlanRegressionTest(TestCase):
+    """Hot endpoint queries must be answered from an index, never a full table scan"""
+
+    databases = {'default', TELEMETRY_DB}
+    BIKES = 60
+    USERS = 200
+    BOOKINGS = 20000
+    REVIEWS = 5000
+    EVENTS = 20000
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        cls.bikes = Bike.objects.bulk_create([
+            Bike(
+                name=f'Plan {i}', brand=['Trek', 'Giant', 'Hero'][i % 3], model=f'P{i}',
+                bike_type=['mountain', 'road', 'city', 'electric'][i % 4],
+                status=['available', 'booked', 'in_use'][i % 3], price_per_hour=Decimal(80 + 10 * i),
+            )
+            for i in range(cls.BIKES)
+        ])
+        cls.users = User.objects.bulk_create([
+            User(username=f'plan{i}', email=f'plan{i}@example.com', is_verified=True) for i in range(cls.USERS)
+        ])
+        cls.admin = User.objects.create(username='planadmin', email='planadmin@example.com', is_staff=True)
+        statuses = [status for status, _label in Booking.STATUS_CHOICES]
+        Booking.objects.bulk_create([
+            Booking(
+                user=cls.users[i % cls.USERS], bike=cls.bikes[i % cls.BIKES], status=statuses[i % len(statuses)],
+                start_time=now - timedelta(hours=i), booked_end_time=now - timedelta(hours=i) + timedelta(hours=2),
+                total_price=Decimal('150.00'),
+            )
+            for i in range(cls.BOOKINGS)
+        ], batch_size=2000)
+        Review.objects.bulk_create([
+            Review(user=cls.users[i % cls.USERS], bike=cls.bikes[i % cls.BIKES], rating=1 + i % 5, comment='ok')
+            for i in range(cls.REVIEWS)
+        ], batch_size=2000)
+        actions = [action for action, _label in Analytics.ACTION_CHOICES]
+        Analytics.objects.bulk_create([
+            Analytics(action=actions[i % len(actions)], page='home', timestamp=now - timedelta(minutes=i))
+            for i in range(cls.EVENTS)
+        ], batch_size=2000)
+        for alias in cls.databases:
+            with connections[alias].cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+    def assertIndexed(self, name, sql, tables, params=(), using='default'):
+        """Fail if the plan for `sql` scans any of `tables` instead of searching it"""
+        if connections[using].vendor != 'sqlite':
+            self.skipTest('EXPLAIN QUERY PLAN output is SQLite-specific')
+        with connections[using].cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = [row[-1] for row in cursor.fetchall()]
+        for step in plan:
+            match = re.match(r'SCAN (\w+)', step)
+            if match and match.group(1) in tables:
+                self.fail(f'{name}: full scan of {match.group(1)}\n{sql}\n' + '\n'.join(plan))
+
+    def assertEndpointIndexed(self, name, url, tables, user=None):
+        client = APIClient()
+        client.force_authenticate(user or self.users[0])
+        # Plans are the same on a replica; keep every query on the captured connections
+        with override_settings(READ_REPLICAS={'ALIASES': []}), ExitStack() as stack:
+            captures = {
+                alias: stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in self.databases
+            }
+            response = client.get(url)
+        self.assertEqual(response.status_code, 200, f'{name}: {response.status_code}')
+        checked = 0
+        for alias, queries in captures.items():
+            for query in queries.captured_queries:
+                if query['sql'].startswith('SELECT') and any(f'"{table}"' in query['sql'] for table in tables):
+                    self.assertIndexed(name, query['sql'], tables, using=alias)
+                    checked += 1
+        self.assertTrue(checked, f'{name}: no queries touched {tables}')
+
+    def test_user_booking_endpoints(self):
+        for name, url in [
+            ('user bookings', '/api/v1/user/bookings/'),
+            ('current bookings', '/api/v1/user/current-bookings/'),
+            ('rental history', '/api/v1/user/rental-history/'),
+        ]:
+            self.assertEndpointIndexed(name, url, {'rental_api_booking'})
+
+    def test_user_dashboard(self):
+        self.assertEndpointIndexed(
+            'user dashboard', '/api/v1/user/dashboard-stats/', {'rental_api_booking', 'rental_api_review'}
+        )
+
+    def test_bike_reviews(self):
+        self.assertEndpointIndexed('bike reviews', f'/api/v1/reviews/?bike={self.bikes[3].id}', {'rental_api_review'})
+
+    def test_bike_catalogue_filters(self):
+        self.assertEndpointIndexed(
+            'bike filters', '/api/v1/bikes/?status=available&bike_type=mountain&ordering=price_per_hour',
+            {'rental_api_bike'},
+        )
+
+    def test_admin_endpoints(self):
+        self.assertEndpointIndexed(
+            'admin bookings by status', '/api/v1/admin/bookings/?status=completed', {'rental_api_booking'}, self.admin
+        )
+        self.assertEndpointIndexed(
+            'analytics events by action', '/api/v1/admin/analytics/events/?action=contact_clicked',
+            {'rental_api_analytics'}, self.admin,
+        )
+
+    def test_booking_querysets(self):
+        now = timezone.now()
+        for name, queryset in [
+            ('active bookings', Booking.objects.filter(status__in=ACTIVE_BOOKING_STATUSES).order_by('start_time')),
+            ('overlap check', _overlapping_bookings(self.bikes[0].id, now, now + timedelta(hours=2))),
+            ('revenue', Booking.objects.filter(status='completed', created_at__gte=now - timedelta(days=30)).values(
+                'created_at').annotate(total=Sum('total_price'))),
+        ]:
+            sql, params = queryset.query.sql_with_params()
+            self.assertIndexed(name, sql, {'rental_api_booking'}, params)
+
+        with CaptureQueriesContext(connection) as queries:
+            recent_activity([self.bikes[0].id])
+        self.assertIndexed('recent activity', queries.captured_queries[0]['sql'], {'rental_api_booking'})
+
+
+# A replica reads the same file; keep the reads on the test transaction
+@override_settings(READ_REPLICAS={'ALIASES': []})
+class BikeSearchIndexTest(TestCase):
+    """The FTS index must follow every bike insert, update and delete"""
+
+    def search(self, terms):
+        response = APIClient().get('/api/v1/bikes/', {'search': terms})
+        return [bike['id'] for bike in response.data['results']]
+
+    def test_index_follows_writes(self):
+        bike = Bike.objects.create(
+            name='Roadster', brand='Giant', model='R1', bike_type='road', price_per_hour=Decimal('120.00')
+        )
+        self.assertEqual(self.search('roadst'), [bike.id])
+
+        Bike.objects.filter(id=bike.id).update(name='Cruiser')
+        self.assertEqual(self.search('roadst'), [])
+        self.assertEqual(self.search('cruis giant'), [bike.id])
+
+        bike.delete()
+        self.assertEqual(self.search('cruis'), [])
+
+    def test_missing_triggers_are_flagged(self):
+        self.assertEqual(check_bike_fts_triggers(None, databases=['default']), [])
+        with connection.cursor() as cursor:
+            # Rolled back with the test, like any other DDL on SQLite
+            cursor.execute('DROP TRIGGER rental_api_bike_fts_au')
+        [warning] = check_bike_fts_triggers(None, databases=['default'])
+        self.assertEqual(warning.id, 'rental_api.W002')
+        self.assertIn('rental_api_bike_fts_au', warning.msg)
+
+
+@override_settings(READ_REPLICAS={'ALIASES': []})
+class AsyncReadPathTest(TestCase):
+    """The async views must never touch the database synchronously under ASGI"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='rider', email='rider@example.com', is_verified=True)
+        cls.bike = Bike.objects.create(
+            name='Trekker', brand='Trek', model='T1', bike_type='city', price_per_hour=Decimal('100.00')
+        )
+        start = timezone.now() + timedelta(hours=1)
+        Booking.objects.create(
+            user=cls.user, bike=cls.bike, status='confirmed', start_time=start,
+            booked_end_time=start + timedelta(hours=1), total_price=Decimal('100.00'),
+        )
+        Review.objects.create(user=cls.user, bike=cls.bike, rating=5, comment='smooth')
+
+    async def test_endpoints(self):
+        client = AsyncClient()
+        auth = {'authorization': f'Bearer {RefreshToken.for_user(self.user).access_token}'}
+        for url in [
+            '/api/v1/bikes/', '/api/v1/bikes/?search=trek', f'/api/v1/bikes/{self.bike.id}/',
+            '/api/v1/bikes/facets/', '/api/v1/bikes/stats/', '/api/v1/reviews/', '/api/v1/admin/contact-info/',
+            '/api/v1/user/current-bookings/', '/api/v1/user/dashboard-stats/',
+        ]:
+            response = await client.get(url, headers=auth)
+            self.assertEqual(response.status_code, 200, f'{url}: {response.content[:200]}')
+
+        response = await client.get('/api/v1/user/dashboard-stats/', headers=auth)
+        self.assertEqual(response.json()['active_bookings'], 1)
+        self.assertEqual((await client.get('/api/v1/bikes/?search=trek')).json()['count'], 1)
+        self.assertEqual((await client.get('/api/v1/user/dashboard-stats/')).status_code, 401)
+
+
+@override_settings(READ_REPLICAS={'ALIASES': []}, LIVE_EVENTS={'FANOUT_DIR': None})
+class LiveBikeEventsTest(TestCase):
+    """Each committed bike change reaches open streams as one pre-encoded event"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='rider', email='rider@example.com', is_verified=True)
+        cls.bike = Bike.objects.create(
+            name='Trekker', brand='Trek', model='T1', bike_type='city', price_per_hour=Decimal('100.00')
+        )
+
+    def setUp(self):
+        # Facet snapshots cached by other tests describe rolled-back rows
+        cache.clear()
+
+    def _event(self, subscription):
+        frame = subscription.get(timeout=1)
+        self.assertIsNotNone(frame)
+        event, data = frame.decode().strip().split('\n')
+        return event, json.loads(data.removeprefix('data: '))
+
+    def test_changes_are_published(self):
+        subscription = live_events.subscribe()
+        self.addCleanup(live_events.unsubscribe, subscription)
+        start = timezone.now()
+        booking = Booking.objects.create(
+            user=self.user, bike=self.bike, status='confirmed', start_time=start,
+            booked_end_time=start + timedelta(hours=1), total_price=Decimal('100.00'),
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            start_ride(booking)
+        event, data = self._event(subscription)
+        self.assertEqual(event, 'event: bike')
+        self.assertEqual((data['bike'], data['status'], data['previous']), (self.bike.id, 'in_use', 'available'))
+        self.assertEqual(data['fleet']['in_use'], 1)
+
+        self.bike.refresh_from_db()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.bike.delete()
+        event, data = self._event(subscription)
+        self.assertEqual((data['action'], data['previous'], data['fleet']['total']), ('deleted', 'in_use', 0))
+
+    async def test_stream_starts_with_fleet_snapshot(self):
+        response = await AsyncClient().get('/api/v1/bikes/live/', headers={'accept': 'text/event-stream'})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertTrue(response.streaming)
+        self.assertTrue(
+            (await anext(response.streaming_content)).startswith(b'retry: 10000\n\nevent: fleet\ndata: {"total":1,')
+        )
+
+        frames = live_events.astream(b'first')
+        self.assertEqual(await anext(frames), b'retry: 10000\n\nfirst')
+        subscribed = len(live_events)
+        # What the server does when the client goes away
+        await frames.aclose()
+        self.assertEqual(len(live_events), subscribed - 1)
+
+    @override_settings(LIVE_EVENTS={'FANOUT_DIR': None, 'HEARTBEAT': 15, 'MAX_LIFETIME': 0.05})
+    async def test_stream_lifetime_is_capped(self):
+        frames = [frame async for frame in live_events.astream(b'first')]
+        self.assertEqual(len(frames), 1)
+        self.assertEqual(len(live_events), 0)
+
+    def test_wsgi_gets_snapshot_and_closes(self):
+        subscribed = len(live_events)
+        response = APIClient().get('/api/v1/bikes/live/', HTTP_ACCEPT='text/event-stream')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertTrue(response.content.startswith(b'retry: 10000\n\nevent: fleet\ndata: {"total":1,'))
+        self.assertEqual(len(live_events), subscribed)
+
+
+@override_settings(READ_REPLICAS={'ALIASES': []}, QUERY_STATS={'SAMPLE_RATE': 1, 'REPEAT_THRESHOLD': 3})
+class QueryStatsTest(TestCase):
+    """Sampled requests are attributed to their view, and repeated query shapes flagged"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create(username='boss', email='boss@example.com', is_staff=True)
+        cls.bikes = Bike.objects.bulk_create([
+            Bike(name=f'Bike {i}', brand='Trek', model=f'T{i}', bike_type='city', price_per_hour=Decimal('100.00'))
+            for i in range(5)
+        ])
+
+    def setUp(self):
+        query_stats.reset()
+        self.addCleanup(query_stats.reset)
+
+    def test_repeated_shapes(self):
+        self.assertEqual(
+            fingerprint("SELECT * FROM t WHERE id IN (%s, %s, %s) AND name = 'x' LIMIT 21"),
+            'SELECT * FROM t WHERE id IN (...) AND name = ? LIMIT ?',
+        )
+        log, token = begin_sampling()
+        try:
+            for bike in self.bikes:
+                Bike.objects.get(id=bike.id)
+            list(Bike.objects.all())
+        finally:
+            end_sampling(token)
+        self.assertEqual(log.count, 6)
+        [(shape, times)] = log.repeated(3)
+        self.assertEqual(times, 5)
+        self.assertIn('WHERE "rental_api_bike"."id" = %s', shape)
+
+        with override_settings(QUERY_STATS={'REPEAT_THRESHOLD': 3}), \
+                self.assertLogs('rental_api.query_stats', 'WARNING') as logs:
+            query_stats.record('bike-detail', log)
+        self.assertIn('Possible N+1 in bike-detail: 5 x', logs.output[0])
+        self.assertEqual(query_stats.snapshot()['bike-detail']['n_plus_one_requests'], 1)
+
+    def test_endpoint_reports_sampled_views(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        self.assertEqual(client.get('/api/v1/bikes/stats/').status_code, 200)
+        stats = client.get('/api/v1/admin/query-stats/').json()
+        self.assertEqual(stats['views']['bike-stats']['sampled_requests'], 1)
+        self.assertEqual(client.delete('/api/v1/admin/query-stats/').status_code, 204)
+        # The GET itself was sampled after it answered; the DELETE cleared it
+        self.assertNotIn('bike-stats', client.get('/api/v1/admin/query-stats/').json()['views'])
+        self.assertEqual(APIClient().get('/api/v1/admin/query-stats/').status_code, 401)
+
+
+@override_settings(READ_REPLICAS={'ALIASES': []})
+class MetricsTest(TestCase):
+    """Every worker's figures add up in one exposition, with quantiles per view"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create(username='boss', email='boss@example.com', is_staff=True)
+        Bike.objects.create(name='Trekker', brand='Trek', model='T1', bike_type='city', price_per_hour=Decimal('100.00'))
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        settings_override = override_settings(METRICS={'DIR': directory})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.directory = directory
+        cache.clear()
+        metrics.reset()
+        self.addCleanup(metrics.reset)
+
+    def test_exposition(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        for _ in range(2):
+            self.assertEqual(client.get('/api/v1/bikes/stats/').status_code, 200)
+        # Another worker's last flush
+        labels = (('method', 'GET'), ('status', '200'), ('view', 'bike-stats'))
+        with open(os.path.join(self.directory, f'{os.getppid()}.json'), 'w') as f:
+            json.dump(_dump({'values': {('http_responses_total', labels): 3}, 'histograms': {}, 'errors': {}}), f)
+
+        response = client.get('/api/v1/admin/metrics/')
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        text = response.content.decode()
+        self.assertIn('http_responses_total{method="GET",status="200",view="bike-stats"} 5\n', text)
+        self.assertIn('http_request_duration_seconds_count{method="GET",view="bike-stats"} 2\n', text)
+        self.assertIn('http_request_duration_seconds_quantile{method="GET",view="bike-stats",quantile="0.99"}', text)
+        self.assertIn('cache_hit_ratio{cache="facets"} 0.5\n', text)
+        self.assertIn('db_query_duration_seconds_count{alias="default"}', text)
+        self.assertEqual(APIClient().get('/api/v1/admin/metrics/').status_code, 401)
+
+    def test_quantiles_and_errors(self):
+        # Two observations in (0, 1], two in (1, 2]
+        self.assertEqual(quantile(0.5, (1, 2, 4), [2, 2, 0, 0, 5.0]), 1.0)
+        self.assertEqual(quantile(0.75, (1, 2, 4), [2, 2, 0, 0, 5.0]), 1.5)
+        self.assertEqual(quantile(0.99, (1, 2, 4), [0, 0, 0, 1, 9.0]), 4)
+
+        metrics.server_error()
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        self.assertEqual(client.get('/api/v1/admin/system-status/').json()['components']['errors'], 1)
+
+
+@override_settings(READ_REPLICAS={'ALIASES': []})
+class JWTUserCacheTest(SharedCacheMixin, TestCase):
+    """A user changed by another worker must not stay signed in from this one's LRU"""
+
+    def setUp(self):
+        super().setUp()
+        user_cache.clear()
+        self.user = User.objects.create(username='rider', email='rider@example.com', is_verified=True)
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(self.user).access_token}'}
+
+    def test_invalidation_from_another_worker(self):
+        client = APIClient()
+        self.assertEqual(client.get('/api/v1/user/profile/', **self.auth).status_code, 200)
+        # A recent snapshot is served without reading the shared version
+        with mock.patch('rental_api.authentication.user_version', wraps=user_version) as read_version:
+            self.assertEqual(client.get('/api/v1/user/profile/', **self.auth).status_code, 200)
+        read_version.assert_not_called()
+        self.assertEqual(user_cache.hits, 1)
+
+        # What the other worker's signals do when an admin deactivates the user there
+        User.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.other_worker_cache().incr(_version_key(self.user.pk))
+        # Seen once the snapshot is RECHECK seconds old
+        with override_settings(JWT_USER_CACHE={'RECHECK': 0}):
+            self.assertEqual(client.get('/api/v1/user/profile/', **self.auth).status_code, 401)
+
+    def test_unchanged_user_is_confirmed(self):
+        client = APIClient()
+        with override_settings(JWT_USER_CACHE={'RECHECK': 0}):
+            for _ in range(3):
+                self.assertEqual(client.get('/api/v1/user/profile/', **self.auth).status_code, 200)
+        self.assertEqual((user_cache.hits, user_cache.misses), (2, 1))
+
+    def test_invalidation_on_user_save(self):
+        client = APIClient()
+        self.assertEqual(client.get('/api/v1/user/profile/', **self.auth).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        # Dropped here at once, whatever RECHECK says
+        self.assertEqual(client.get('/api/v1/user/profile/', **self.auth).status_code, 401)
+        self.assertEqual(user_cache.hits, 0)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = True
+            self.user.save()
+        self.assertEqual(client.get('/api/v1/user/profile/', **self.auth).status_code, 200)
+        # Another worker's snapshot is stale against the bumped version
+        other_worker = UserCache()
+        other_worker.put(str(self.user.pk), user_version(self.user.pk) - 1, self.user, 10)
+        with mock.patch('rental_api.authentication.user_cache', other_worker), \
+                override_settings(JWT_USER_CACHE={'RECHECK': 0}):
+            self.assertEqual(client.get('/api/v1/user/profile/', **self.auth).status_code, 200)
+        self.assertEqual((other_worker.hits, other_worker.misses), (0, 1))
+
+    def test_per_process_cache_is_flagged(self):
+        self.assertEqual(check_shared_cache(None), [])
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            self.assertEqual([warning.id for warning in check_shared_cache(None)], ['rental_api.W001'])
+
+
+@override_settings(READ_REPLICAS={'ALIASES': []})
+class BikeFacetsTest(SharedCacheMixin, TestCase):
+    """Cached facets follow bike status changes, made here or in another worker"""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(username='rider', email='rider@example.com', is_verified=True)
+        self.bikes = Bike.objects.bulk_create([
+            Bike(name=f'Bike {i}', brand='Trek', model=f'T{i}', bike_type='city', price_per_hour=Decimal('100.00'))
+            for i in range(3)
+        ])
+
+    def status_counts(self):
+        return APIClient().get('/api/v1/bikes/facets/').json()['status']
+
+    def test_transitions_and_other_workers_refresh_facets(self):
+        self.assertEqual(self.status_counts(), {'available': 3})
+        start = timezone.now()
+        booking = Booking.objects.create(
+            user=self.user, bike=self.bikes[0], status='confirmed', start_time=start,
+            booked_end_time=start + timedelta(hours=1), total_price=Decimal('100.00'),
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            start_ride(booking)
+        self.assertEqual(self.status_counts(), {'available': 2, 'in_use': 1})
+
+        # Another worker changes a bike and bumps the shared version on commit
+        Bike.objects.filter(id=self.bikes[1].id).update(status='booked')
+        self.other_worker_cache().incr(FACET_VERSION_KEY)
+        self.assertEqual(self.status_counts(), {'available': 1, 'booked': 1, 'in_use': 1})
+
+
+class ProductionSqliteSettingsTest(SimpleTestCase):
+    """Every new connection under settings_production gets WAL, busy_timeout and BEGIN IMMEDIATE"""
+
+    def test_new_connection_is_configured(self):
+        production = import_module('backend.settings_production')
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        path = os.path.join(directory, 'db.sqlite3')
+        for alias, config in production.DATABASES.items():
+            with self.subTest(alias=alias):
+                # A connection of its own, so the test databases are left alone
+                handler = ConnectionHandler({'default': {**config, 'NAME': path}})
+                conn = DatabaseWrapper(handler.settings['default'], alias='production')
+                self.addCleanup(conn.close)
+                with conn.cursor() as cursor:
+                    pragmas = {}
+                    for name in ('journal_mode', 'busy_timeout', 'synchronous', 'temp_store'):
+                        cursor.execute(f'PRAGMA {name}')
+                        pragmas[name] = cursor.fetchone()[0]
+                self.assertEqual(pragmas, {'journal_mode': 'wal', 'busy_timeout': 20000, 'synchronous': 1,
+                                           'temp_store': 2})
+
+                # Transactions take the write lock when they begin
+                conn._start_transaction_under_autocommit()
+                try:
+                    other = sqlite3.connect(path, timeout=0)
+                    with self.assertRaisesMessage(sqlite3.OperationalError, 'locked'):
+                        other.execute('BEGIN IMMEDIATE')
+                    other.close()
+                finally:
+                    conn.rollback()
+                conn.close()
+
+    def test_replicas_are_configured(self):
+        production = import_module('backend.settings_production')
+        for alias in production.READ_REPLICAS['ALIASES']:
+            self.assertEqual(production.DATABASES[alias]['OPTIONS'], production.DATABASES['default']['OPTIONS'])
+        self.assertEqual('replica' in production.DATABASES, 'replica' in settings.DATABASES)
+
+
+class WorkerProcessesTest(SharedCacheMixin, TestCase):
+    """What one worker process invalidates, another sees, through the configured cache"""
+
+    def run_worker(self, code):
+        env = {**os.environ, 'DJANGO_SETTINGS_MODULE': 'backend.settings', 'CACHE_LOCATION': self.cache_dir}
+        setup = 'import django; django.setup(); '
+        subprocess.run([sys.executable, '-c', setup + code], cwd=settings.BASE_DIR, env=env, check=True, timeout=60)
+
+    @override_settings(JWT_USER_CACHE={'RECHECK': 0})
+    def test_invalidations_reach_other_processes(self):
+        user = User.objects.create(username='rider', email='rider@example.com', is_verified=True)
+        auth = {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(user).access_token}'}
+        client = APIClient()
+        user_cache.clear()
+        self.assertEqual(client.get('/api/v1/user/profile/', **auth).status_code, 200)
+        before = (user_version(user.pk), facet_version(), current_generation())
+
+        User.objects.filter(pk=user.pk).update(is_active=False)
+        self.run_worker(
+            'from rental_api.authentication import invalidate_user; '
+            'from rental_api.availability import announce_change; '
+            'from rental_api.facets import invalidate_facets; '
+            f'invalidate_user({user.pk}); invalidate_facets(); announce_change()'
+        )
+
+        after = (user_version(user.pk), facet_version(), current_generation())
+        for name, old, new in zip(('user version', 'facet version', 'availability generation'), before, after):
+            self.assertNotEqual(old, new, name)
+        self.assertEqual(client.get('/api/v1/user/profile/', **auth).status_code, 401)
+
+
+class ReplicaRoutingTest(SharedCacheMixin, TestCase):
+    """Writers are pinned to the primary in every worker; broken replicas fall back to it"""
+
+    # The analytics database has no bike table, so reading bikes there fails
+    # the way a broken replica would
+    databases = {'default', TELEMETRY_DB}
+
+    def setUp(self):
+        super().setUp()
+        self.addCleanup(_down_until.clear)
+        self.user = User.objects.create(username='rider', email='rider@example.com', is_verified=True)
+        Bike.objects.create(name='Trekker', brand='Trek', model='T1', bike_type='city', price_per_hour=Decimal('100.00'))
+
+    def test_writer_is_pinned_in_every_worker(self):
+        def write(request):
+            Bike.objects.create(name='New', brand='Giant', model='G1', bike_type='road', price_per_hour=Decimal('90.00'))
+            return None
+
+        request = RequestFactory().post('/')
+        request.user = self.user
+        ReplicaRoutingMiddleware(write)(request)
+        self.assertTrue(is_pinned(self.user.pk))
+        self.assertTrue(self.other_worker_cache().get(_sticky_key(self.user.pk)))
+
+        with override_settings(READ_REPLICAS={'ALIASES': [TELEMETRY_DB]}), \
+                mock.patch('rental_api.routers.choose_replica', return_value=None) as choose:
+            self.assertEqual(APIClient().get('/api/v1/bikes/').status_code, 200)
+            self.assertEqual(choose.call_count, 1)
+            client = APIClient()
+            client.force_authenticate(self.user)
+            self.assertEqual(client.get('/api/v1/bikes/').status_code, 200)
+            self.assertEqual(choose.call_count, 1)
+
+    def test_unreachable_replica_is_skipped(self):
+        with override_settings(READ_REPLICAS={'ALIASES': [TELEMETRY_DB]}), \
+                mock.patch.object(connections[TELEMETRY_DB], 'ensure_connection', side_effect=OperationalError('down')), \
+                self.assertLogs('rental_api.routers', 'WARNING'):
+            self.assertIsNone(choose_replica())
+        self.assertIn(TELEMETRY_DB, _down_until)
+
+    def test_failing_replica_query_is_answered_from_primary(self):
+        connection = connections[TELEMETRY_DB]
+        connection.execute_wrappers.append(_watch_replica)
+        self.addCleanup(connection.execute_wrappers.remove, _watch_replica)
+        with override_settings(READ_REPLICAS={'ALIASES': [TELEMETRY_DB]}), \
+                self.assertLogs('rental_api.routers', 'WARNING') as logs:
+            response = APIClient().get('/api/v1/bikes/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], 1)
+        self.assertIn('answering from primary', logs.output[0])
+        self.assertIn(TELEMETRY_DB, _down_until)
+
+
+@override_settings(READ_REPLICAS={'ALIASES': []})
+class AvailabilityIndexTest(SharedCacheMixin, TestCase):
+    """The index agrees with the Booking table after every write, here or in another worker"""
+
+    def setUp(self):
+        super().setUp()
+        availability_index.reset()
+        self.addCleanup(availability_index.reset)
+        self.user = User.objects.create(username='rider', email='rider@example.com', is_verified=True)
+        self.admin = User.objects.create(username='boss', email='boss@example.com', is_staff=True)
+        self.bike = Bike.objects.create(
+            name='Trekker', brand='Trek', model='T1', bike_type='city', price_per_hour=Decimal('100.00')
+        )
+        self.start = timezone.now().replace(microsecond=0) + timedelta(hours=1)
+        self.end = self.start + timedelta(hours=1)
+
+    def assertIndexMatchesDatabase(self):
+        window = (self.start - timedelta(hours=2), self.end + timedelta(hours=2))
+        self.assertEqual(
+            availability_index.conflicts(self.bike.id, *window),
+            sorted(_overlapping_bookings(self.bike.id, *window).values_list('id', flat=True)),
+        )
+
+    def commit(self, operation, *args):
+        generation = self.other_worker_cache().get(GENERATION_KEY)
+        with self.captureOnCommitCallbacks(execute=True):
+            result = operation(*args)
+        # Every other worker is told to reload
+        self.assertNotEqual(self.other_worker_cache().get(GENERATION_KEY), generation)
+        self.assertIndexMatchesDatabase()
+        return result
+
+    def test_index_follows_every_transition(self):
+        self.assertIndexMatchesDatabase()
+        booking = self.commit(create_booking, self.user, self.bike.id, self.start, self.end)
+        self.assertFalse(availability_index.is_free(self.bike.id, self.start, self.end))
+        self.commit(cancel_booking, booking)
+        self.assertTrue(availability_index.is_free(self.bike.id, self.start, self.end))
+
+        booking = self.commit(create_booking, self.user, self.bike.id, self.start, self.end)
+        self.commit(start_ride, booking)
+        self.commit(end_ride, booking, timezone.now(), Decimal('100.00'))
+        self.assertTrue(availability_index.is_free(self.bike.id, self.start, self.end))
+
+        booking = self.commit(create_booking, self.user, self.bike.id, self.start, self.end)
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        self.commit(lambda: client.delete(f'/api/v1/admin/bookings/{booking.id}/delete/'))
+        self.assertTrue(availability_index.is_free(self.bike.id, self.start, self.end))
+
+    def test_other_workers_changes_are_picked_up(self):
+        self.assertTrue(availability_index.is_free(self.bike.id, self.start, self.end))
+        # Booked through another worker: no signal here, only its announcement
+        booking, = Booking.objects.bulk_create([Booking(
+            user=self.user, bike=self.bike, status='confirmed', start_time=self.start, booked_end_time=self.end,
+        )])
+        self.other_worker_cache().set(GENERATION_KEY, 'other-worker')
+        self.assertFalse(availability_index.is_free(self.bike.id, self.start, self.end))
+        self.assertIndexMatchesDatabase()
+
+        # Cancelled there, and this worker has not heard yet: no false 409
+        Booking.objects.filter(id=booking.id).update(status='cancelled')
+        self.assertFalse(availability_index.is_free(self.bike.id, self.start, self.end))
+        with self.captureOnCommitCallbacks(execute=True):
+            create_booking(self.user, self.bike.id, self.start, self.end)
+        self.assertIndexMatchesDatabase()
+
+    def test_free_bikes_matches_exact_query(self):
+        bikes = [self.bike] + list(Bike.objects.bulk_create([
+            Bike(name=f'Bike {i}', brand='Giant', model=f'G{i}', bike_type='road', price_per_hour=Decimal('90.00'))
+            for i in range(5)
+        ]))
+        ids = [bike.id for bike in bikes]
+        # Slot-aligned, so the bitmap's outward rounding cannot differ from the exact answer
+        now = timezone.now()
+        base = now - timedelta(seconds=now.timestamp() % SLOT_SECONDS) + timedelta(minutes=30)
+        slot = timedelta(seconds=SLOT_SECONDS)
+        spans = [(0, 4), (6, 10), (2, 3), (20, 40), (130, 150)]  # the last one ends past the horizon
+        bookings = []
+        for i, (first, last) in enumerate(spans):
+            bookings.append(Booking(
+                user=self.user, bike=bikes[i], status='confirmed',
+                start_time=base + first * slot, booked_end_time=base + last * slot,
+            ))
+        # A legacy booking held for the default hour
+        bookings.append(Booking(user=self.user, bike=bikes[5], status='pending', start_time=base + 8 * slot))
+        Booking.objects.bulk_create(bookings)
+        availability_index.reset()
+
+        for first, last in [(0, 1), (3, 6), (4, 6), (9, 12), (0, 40), (100, 148), (140, 200)]:
+            start, end = base + first * slot, base + last * slot
+            busy = {bike_id for bike_id in ids if _overlapping_bookings(bike_id, start, end).exists()}
+            self.assertEqual(
+                sorted(availability_index.free_bikes(ids, start, end)), sorted(set(ids) - busy), (first, last)
+            )
+
+        # Cancelled by another worker: the search sees it once that worker announces the change
+        Booking.objects.filter(bike=bikes[1]).update(status='cancelled')
+        self.other_worker_cache().set(GENERATION_KEY, 'other-worker')
+        window = {'start_time': (base + 6 * slot).isoformat(), 'end_time': (base + 10 * slot).isoformat()}
+        response = APIClient().get('/api/v1/bikes/available/', window)
+        self.assertEqual(response.status_code, 200)
+        found = response.json()
+        found = found['results'] if isinstance(found, dict) else found
+        self.assertIn(bikes[1].id, [bike['id'] for bike in found])
+        self.assertNotIn(bikes[5].id, [bike['id'] for bike in found])
+
+
+class UserEmailUniquenessTest(TestCase):
+    """Addresses are unique ignoring case, and a clash is a validation error"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create(username='boss', email='boss@example.com', is_staff=True)
+        cls.rider = User.objects.create(username='rider', email='rider@example.com', is_verified=True)
+        cls.other = User.objects.create(username='other', email='other@example.com', is_verified=True)
+
+    def test_admin_update(self):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        url = f'/api/v1/admin/users/{self.other.id}/'
+        response = client.put(url, {'email': 'Rider@Example.com'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'email': ['A user with this email already exists.']})
+        self.assertEqual(client.put(url, {'username': 'rider'}, format='json').status_code, 400)
+
+        response = client.put(url, {'email': 'Other@Example.com', 'role': 'admin'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.other.refresh_from_db()
+        self.assertEqual(self.other.email, 'Other@Example.com')
+        self.assertTrue(self.other.is_staff)
+
+    def test_profile_update(self):
+        client = APIClient()
+        client.force_authenticate(self.other)
+        response = client.patch('/api/v1/user/update-profile/', {'email': 'RIDER@example.com'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('email', response.json())
+        response = client.patch('/api/v1/user/update-profile/', {'email': 'OTHER@example.com'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def test_migration_stops_on_duplicates(self):
+        migration = import_module('rental_api.migrations.0029_user_email_ci_unique')
+        # Stray whitespace gets past the index but not the migration's check
+        User.objects.filter(pk=self.other.pk).update(email=' RIDER@example.com')
+        with self.assertRaisesRegex(RuntimeError, rf'rider@example.com: users \[{self.rider.id}, {self.other.id}\]'):
+            migration.check_duplicate_emails(apps, None)
+        self.assertEqual(User.objects.get(pk=self.other.pk).email, ' RIDER@example.com')
+
+        User.objects.filter(pk=self.other.pk).update(email=' other@example.com ')
+        migration.check_duplicate_emails(apps, None)
+        self.assertEqual(User.objects.get(pk=self.other.pk).email, 'other@example.com')
+
+
+@override_settings(READ_REPLICAS={'ALIASES': []})
+class KeysetPaginationTest(TestCase):
+    """Cursors survive inserts, and a custom ?ordering= is honoured rather than ignored"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create(username='boss', email='boss@example.com', is_staff=True)
+        cls.bike = Bike.objects.create(
+            name='Bike', brand='Trek', model='T1', bike_type='city', price_per_hour=Decimal('100.00')
+        )
+        start = timezone.now() + timedelta(days=1)
+        cls.bookings = Booking.objects.bulk_create([
+            Booking(user=cls.admin, bike=cls.bike, status='completed', start_time=start + timedelta(hours=i),
+                    total_price=Decimal(100 * (7 - i)))
+            for i in range(7)
+        ])
+        # Two share a created_at, so the id tie-break is exercised too
+        Booking.objects.filter(pk=cls.bookings[3].pk).update(created_at=cls.bookings[2].created_at)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def test_cursor_is_stable_across_inserts(self):
+        seen = []
+        url = '/api/v1/admin/bookings/?page_size=3'
+        while url:
+            body = self.client.get(url).json()
+            seen += [booking['id'] for booking in body['results']]
+            if not Booking.objects.filter(bike=self.bike, start_time__gt=timezone.now() + timedelta(days=2)).exists():
+                # Newer than every cursor, so no later page may show it
+                Booking.objects.create(user=self.admin, bike=self.bike, status='completed',
+                                       start_time=timezone.now() + timedelta(days=3))
+            url = body['next']
+        expected = list(Booking.objects.filter(pk__in=[b.pk for b in self.bookings])
+                        .order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_ordering_switches_to_page_numbers(self):
+        body = self.client.get('/api/v1/admin/bookings/?ordering=total_price&page_size=3').json()
+        self.assertEqual(body['count'], 7)
+        prices = [Decimal(booking['total_price']) for booking in body['results']]
+        self.assertEqual(prices, sorted(prices))
+        self.assertEqual(prices[0], Decimal('100'))
+
+        # The paginator's own order stays on cursors
+        self.assertIn('next', self.client.get('/api/v1/admin/bookings/?ordering=-created_at').json())
+        self.assertNotIn('count', self.client.get('/api/v1/admin/bookings/?ordering=-created_at').json())
+        body = self.client.get('/api/v1/admin/reviews/?ordering=rating').json()
+        self.assertEqual(body['count'], 0)
+
+    def test_ordering_without_legacy_paging_is_rejected(self):
+        view = mock.Mock(filter_backends=[filters.OrderingFilter])
+        request = Request(RequestFactory().get('/', {'ordering': 'start_time'}))
+        with self.assertRaises(ValidationError):
+            CreatedAtKeysetPagination().paginate_queryset(Booking.objects.all(), request, view)
+
+
+class DashboardCountersTest(TestCase):
+    """Counters kept up to date write by write match a rebuild and the cold aggregate"""
+
+    def setUp(self):
+        forget_tracking()
+        self.addCleanup(forget_tracking)
+
+    def test_cold_writes_skip_the_counters(self):
+        with self.assertNumQueries(1):
+            apply_deltas({'users_total': 1})
+        with self.assertNumQueries(0):
+            apply_deltas({'users_total': 1})
+        self.assertFalse(DashboardCounter.objects.exists())
+
+    def test_incremental_counters_match_rebuild(self):
+        rebuild_counters(settle=0)
+        now = timezone.now()
+        since = recent_since(now)
+        moments = [
+            now, since, since - timedelta(seconds=1), now - timedelta(days=7),
+            now - timedelta(days=8), now - timedelta(days=40), now - timedelta(hours=1),
+        ]
+        users = [User.objects.create(username=f'rider{i}', email=f'rider{i}@example.com', is_verified=i % 2 == 0)
+                 for i in range(len(moments))]
+        users[0].is_staff = True
+        users[0].save()
+        bikes = [Bike.objects.create(name=f'Bike {i}', brand='Trek', model=f'T{i}', bike_type='city',
+                                     price_per_hour=Decimal('100.00')) for i in range(3)]
+        bikes[1].status = 'in_use'
+        bikes[1].save()
+
+        for i, (user, moment) in enumerate(zip(users, moments)):
+            user.date_joined = moment
+            user.save()
+            booking = Booking.objects.create(user=user, bike=bikes[i % 3], start_time=moment)
+            # Moved to its day after it was counted under today
+            booking.created_at = moment
+            booking.status = 'completed' if i % 3 else 'cancelled'
+            booking.total_price = Decimal(50 * (i + 1))
+            booking.save()
+            review = Review.objects.create(user=user, bike=bikes[i % 3], rating=1 + i % 5, comment='ok')
+            review.created_at = moment
+            review.save()
+        Review.objects.filter(user=users[2]).first().delete()
+        Booking.objects.get(user=users[4]).delete()
+
+        incremental = read_counters()
+        cold = aggregate_dashboard_stats()
+        figures = {name: value for name, value in incremental.items() if name not in (BUILT_MARKER, TRACKING_MARKER)}
+        self.assertEqual(figures, {name: cold[name] for name in figures})
+        self.assertGreater(incremental['bookings_recent'], 0)
+        self.assertLess(incremental['bookings_recent'], len(moments))
+        rebuild_counters(settle=0)
+        self.assertEqual(read_counters(), incremental)
+
+
+class AnalyticsIngestTest(TestCase):
+    """Bad tracking payloads are 400s, and queued events are written in batches"""
+
+    databases = {'default', TELEMETRY_DB}
+
+    def test_invalid_payloads(self):
+        client = APIClient()
+        url = '/api/v1/analytics/track-about-click/'
+        for payload in [
+            {'action': ['contact_clicked'], 'page': '/about'},
+            {'action': {'a': 1}, 'page': '/about'},
+            {'action': None, 'page': '/about'},
+            {'action': 'nope', 'page': '/about'},
+            {'action': 'contact_clicked', 'page': 7},
+            {'action': 'contact_clicked', 'page': 'x' * 1000},
+            ['contact_clicked', '/about'],
+        ]:
+            with self.subTest(payload=payload):
+                self.assertEqual(client.post(url, payload, format='json').status_code, 400)
+        event, errors = clean_event('contact_clicked', '/about', ip_address=' 10.0.0.1 ')
+        self.assertIsNone(errors)
+        self.assertEqual(event['ip_address'], '10.0.0.1')
+
+    @override_settings(ANALYTICS_BUFFER={'BATCH_SIZE': 2, 'MAX_QUEUE': 5})
+    def test_buffer_flushes_in_batches(self):
+        buffer = AnalyticsBuffer()
+        events = [clean_event('feature_clicked', f'/page/{i}')[0] for i in range(6)]
+        # No writer thread: flush() is driven from here
+        with mock.patch.object(buffer, '_ensure_worker'):
+            self.assertEqual([buffer.enqueue(event) for event in events], [True] * 5 + [False])
+        self.assertEqual(buffer.snapshot()['queued'], 5)
+        buffer.flush()
+        self.assertEqual(Analytics.objects.count(), 5)
+        self.assertEqual(
+            buffer.snapshot(), {'enqueued': 5, 'flushed': 5, 'dropped': 1, 'failed': 0, 'batches': 3, 'queued': 0}
+        )
+
+        with mock.patch.object(buffer, '_ensure_worker'):
+            buffer.enqueue(events[5])
+        with mock.patch.object(Analytics.objects, 'bulk_create', side_effect=OperationalError('locked')):
+            buffer.flush()
+        self.assertEqual(buffer.snapshot()['failed'], 1)
+
+        with override_settings(ANALYTICS_BUFFER={'ENABLED': False}):
+            buffer.enqueue(events[0])
+        self.assertEqual(Analytics.objects.count(), 6)
+
+
+class AnalyticsRollupTest(TestCase):
+    """Rollups advance a watermark, counts include the unrolled tail, and pruning spares unrolled events"""
+
+    databases = {'default', TELEMETRY_DB}
+
+    def track(self, action, count=1, **fields):
+        return [Analytics.objects.create(action=action, page='/about', **fields) for _ in range(count)]
+
+    def test_watermark_advances_once_per_event(self):
+        events = self.track('contact_clicked', 3) + self.track('feature_clicked', 2)
+        self.assertEqual(get_watermark(), 0)
+        rows, _buckets = rollup_analytics(batch_size=2)
+        self.assertEqual(rows, 5)
+        self.assertEqual(get_watermark(), events[-1].id)
+        self.assertEqual(rollup_analytics(), (0, 0))
+
+        self.track('contact_clicked')
+        self.assertEqual(rollup_analytics()[0], 1)
+        self.assertEqual(
+            dict(AnalyticsDailyRollup.objects.values('action').annotate(n=Sum('count')).values_list('action', 'n')),
+            {'contact_clicked': 4, 'feature_clicked': 2},
+        )
+        self.assertEqual(AnalyticsHourlyRollup.objects.aggregate(n=Sum('count'))['n'], 6)
+
+    def test_action_counts_include_unrolled_tail(self):
+        self.track('contact_clicked', 2)
+        rollup_analytics()
+        self.track('contact_clicked')
+        self.track('browse_bikes_clicked')
+        expected = {'contact_clicked': 3, 'browse_bikes_clicked': 1}
+        self.assertEqual(action_counts(), expected)
+
+        today = local_day_start(timezone.localdate())
+        self.assertEqual(action_counts(start=today, end=today + timedelta(days=1)), expected)
+        self.assertEqual(action_counts(end=today), {})
+        rollup_analytics()
+        self.assertEqual(action_counts(), expected)
+
+    def test_prune_only_deletes_rolled_up_events(self):
+        old = timezone.now() - timedelta(days=100)
+        rolled = self.track('contact_clicked', 2, timestamp=old) + self.track('contact_clicked')
+        rollup_analytics()
+        unrolled = self.track('feature_clicked', 2, timestamp=old)
+
+        self.assertEqual(prune_events(30, batch_size=1), 2)
+        self.assertEqual(
+            set(Analytics.objects.values_list('id', flat=True)), {rolled[2].id} | {event.id for event in unrolled}
+        )
+        # Counts are unchanged by pruning
+        self.assertEqual(action_counts(), {'contact_clicked': 3, 'feature_clicked': 2})
+
+
+@override_settings(EMAIL_OUTBOX={'ENABLED': True, 'BATCH_SIZE': 2, 'MAX_ATTEMPTS': 2, 'BACKOFF_BASE': 30})
+class EmailOutboxTest(TestCase):
+    """Claims are exclusive, failures back off, stale claims recover, and sent bodies do not linger"""
+
+    def queue(self, count=1):
+        return [queue_email(f'Reset {i}', f'https://example.com/reset/token-{i}/', [f'rider{i}@example.com'])
+                for i in range(count)]
+
+    def test_claims_are_exclusive_and_stale_claims_recover(self):
+        self.queue(3)
+        config = outbox_settings()
+        first, second = claim_batch(config), claim_batch(config)
+        self.assertEqual((len(first), len(second)), (2, 1))
+        self.assertEqual(claim_batch(config), [])
+        self.assertEqual(OutboxEmail.objects.filter(status='sending').count(), 3)
+
+        # A worker that died mid-send leaves its rows claimed; they come back after CLAIM_TIMEOUT
+        abandoned = timezone.now() - timedelta(seconds=config['CLAIM_TIMEOUT'] + 1)
+        OutboxEmail.objects.filter(id=first[0].id).update(claimed_at=abandoned)
+        self.assertEqual([email.id for email in claim_batch(config)], [first[0].id])
+
+    def test_retry_backoff_and_redaction(self):
+        [email] = self.queue()
+        with mock.patch.object(EmailMessage, 'send', side_effect=OSError('connection reset')):
+            self.assertEqual(drain(), {'sent': 0, 'retried': 1, 'failed': 0})
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.attempts, email.last_error), ('pending', 1, 'connection reset'))
+        self.assertGreater(email.next_attempt_at, timezone.now() + timedelta(seconds=25))
+        # Not due until the backoff has passed
+        self.assertEqual(drain(), {'sent': 0, 'retried': 0, 'failed': 0})
+
+        OutboxEmail.objects.filter(id=email.id).update(next_attempt_at=timezone.now())
+        with mock.patch.object(EmailMessage, 'send', side_effect=OSError('connection reset')):
+            self.assertEqual(drain(), {'sent': 0, 'retried': 0, 'failed': 1})
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.body), ('failed', ''))
+
+        [email] = self.queue()
+        self.assertEqual(drain()['sent'], 1)
+        self.assertIn('token-0', mail.outbox[0].body)
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.body), ('sent', ''))
+
+    def test_old_sent_rows_are_purged(self):
+        old, recent = self.queue(2)
+        drain()
+        OutboxEmail.objects.filter(id=old.id).update(sent_at=timezone.now() - timedelta(days=8))
+        drain()
+        self.assertEqual(list(OutboxEmail.objects.values_list('id', flat=True)), [recent.id])
+
+    def test_admin_hides_bodies(self):
+        [email] = self.queue()
+        admin = User.objects.create(username='boss', email='boss@example.com', is_staff=True, is_superuser=True)
+        self.client.force_login(admin)
+        response = self.client.get(f'/admin/rental_api/outboxemail/{email.id}/change/')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, 'token-0')
+
+
+class UsernameAllocationTest(TestCase):
+    """Usernames come from the email prefix, suffixed from a per-prefix counter"""
+
+    def create(self, prefix, email=None, password='s3cret-pass'):
+        return create_user_with_unique_username(prefix, password, email=email or f'{User.objects.count()}@x.com')
+
+    def test_suffixes_follow_the_counter(self):
+        self.assertEqual([self.create('info').username for _ in range(3)], ['info', 'info1', 'info2'])
+        self.assertEqual(UsernameCounter.objects.get(prefix='info').next_suffix, 3)
+
+    def test_counter_is_seeded_from_existing_names(self):
+        for username in ('sam', 'sam7', 'sam12x', 'samantha'):
+            User.objects.create(username=username, email=f'{username}@example.com')
+        self.assertEqual(self.create('sam').username, 'sam8')
+        self.assertEqual(self.create('sam').username, 'sam9')
+
+    def test_collisions_take_the_next_suffix(self):
+        self.create('ann')
+        self.create('ann')
+        # Made some other way, where the counter is about to point
+        User.objects.create(username='ann2', email='ann2@example.com')
+        with mock.patch('rental_api.usernames.make_password', wraps=make_password) as hashing:
+            user = self.create('ann')
+        self.assertEqual(user.username, 'ann3')
+        # Hashed once, whatever the number of attempts
+        self.assertEqual(hashing.call_count, 1)
+        self.assertTrue(User.objects.get(pk=user.pk).check_password('s3cret-pass'))
+
+    def test_other_integrity_errors_are_raised(self):
+        self.create('bob', email='bob@example.com')
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                self.create('bobby', email='BOB@example.com')
+        self.assertFalse(User.objects.filter(username__startswith='bobby').exists())
+
+
+class UsernameAllocationRaceTest(TransactionTestCase):
+    """Signups racing for one prefix never end up with the same username"""
+
+    THREADS = 8
+
+    def test_concurrent_signups(self):
+        barrier = threading.Barrier(self.THREADS)
+        usernames, locked = [], []
+
+        def signup(i):
+            try:
+                barrier.wait()
+                usernames.append(create_user_with_unique_username('info', 'pw', email=f'info{i}@example.com').username)
+            except OperationalError:
+                # SQLite refused the concurrent writer outright
+                locked.append(i)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=signup, args=(i,)) for i in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(usernames) + len(locked), self.THREADS)
+        self.assertTrue(usernames)
+        self.assertEqual(len(set(usernames)), len(usernames))
+        self.assertEqual(sorted(User.objects.values_list('username', flat=True)), sorted(usernames))
+
+
+@override_settings(READ_REPLICAS={'ALIASES': []})
+class PopularityTest(TestCase):
+    """The popularity score and the ?ordering=-popularity sort it drives"""
+
+    def test_score_terms(self):
+        unknown = score(0, 0, 0, 0)
+        self.assertEqual(unknown, round(0.6 * (PRIOR_RATING - 1) / 4, 6))
+        # One five-star review barely moves a bike off the prior; many do
+        one = score(5, 1, 0, 0)
+        many = score(500, 100, 0, 0)
+        self.assertLess(unknown, one)
+        self.assertLess(one, many)
+        self.assertLess(many, 0.6)
+        self.assertGreater(score(1, 1, 0, 0), score(1 * 20, 20, 0, 0))
+
+        self.assertAlmostEqual(score(0, 0, VOLUME_CAP, 0) - unknown, 0.25, places=5)
+        self.assertEqual(score(0, 0, VOLUME_CAP * 10, 0), score(0, 0, VOLUME_CAP, 0))
+        self.assertLess(score(0, 0, 5, 0), score(0, 0, 10, 0))
+
+        self.assertAlmostEqual(score(0, 0, 0, WINDOW.total_seconds()) - unknown, 0.15, places=5)
+        self.assertAlmostEqual(score(0, 0, 0, WINDOW.total_seconds() / 2) - unknown, 0.075, places=5)
+        self.assertEqual(score(0, 0, 0, WINDOW.total_seconds() * 3), score(0, 0, 0, WINDOW.total_seconds()))
+
+    def test_ordering_and_backfill(self):
+        quiet, reviewed, busy = Bike.objects.bulk_create([
+            Bike(name=name, brand='Trek', model=name, bike_type='city', price_per_hour=Decimal('100.00'))
+            for name in ('Quiet', 'Reviewed', 'Busy')
+        ])
+        users = [User.objects.create(username=f'rider{i}', email=f'rider{i}@example.com') for i in range(12)]
+        Review.objects.bulk_create([Review(user=user, bike=reviewed, rating=5, comment='great') for user in users[:3]])
+        Bike.objects.filter(id=reviewed.id).update(rating_sum=15, total_reviews=3)
+        start = timezone.now() - timedelta(days=2)
+        Booking.objects.bulk_create([
+            Booking(user=user, bike=busy, status='completed', start_time=start + timedelta(hours=i),
+                    booked_end_time=start + timedelta(hours=i, minutes=50), total_price=Decimal('100.00'))
+            for i, user in enumerate(users)
+        ])
+        Booking.objects.create(user=users[0], bike=quiet, status='completed', start_time=start - WINDOW,
+                               booked_end_time=start - WINDOW + timedelta(hours=1))
+
+        self.assertEqual(recompute_popularity(), 3)
+        response = APIClient().get('/api/v1/bikes/', {'ordering': '-popularity'})
+        self.assertEqual([bike['name'] for bike in response.json()['results']], ['Busy', 'Reviewed', 'Quiet'])
+        # The ride outside the window does not count
+        self.assertEqual(Bike.objects.get(id=quiet.id).popularity, score(0, 0, 0, 0))
+
+        migration = import_module('rental_api.migrations.0033_backfill_bike_popularity')
+        scores = dict(Bike.objects.values_list('id', 'popularity'))
+        Bike.objects.update(popularity=0)
+        migration.backfill_popularity(apps, None)
+        self.assertEqual(dict(Bike.objects.values_list('id', 'popularity')), scores)
+
+
+class FastBookingSerializerTest(TestCase):
+    """The .values() fast path renders exactly the bytes the DRF serializers do"""
+
+    @classmethod
+    def setUpTestData(cls):
+        users = [
+            User.objects.create(username='rider', email='rider@example.com', full_name='Rider One'),
+            User.objects.create(username='other', email='', phone_number='98000', is_verified=True),
+        ]
+        bikes = [
+            Bike.objects.create(name='Plain', brand='Trek', model='T1', bike_type='city',
+                                price_per_hour=Decimal('150.00')),
+            Bike.objects.create(name='Pictured', brand='Giant', model='G2', bike_type='mountain',
+                                price_per_hour=Decimal('99.99'), image='bikes/pictured.jpg',
+                                description='Nested \u00e9 text'),
+        ]
+        start = timezone.now().replace(microsecond=123456) - timedelta(days=1)
+        Booking.objects.bulk_create([
+            # Pending with every optional field null
+            Booking(user=users[0], bike=bikes[0], start_time=start, status='pending'),
+            Booking(user=users[1], bike=bikes[1], start_time=start, status='completed',
+                    booked_end_time=start + timedelta(minutes=95), end_time=start + timedelta(hours=2),
+                    actual_end_time=start + timedelta(minutes=101, seconds=7),
+                    total_price=Decimal('300.50'), actual_total_price=Decimal('166.65')),
+            Booking(user=users[0], bike=bikes[1], start_time=start + timedelta(hours=3), status='cancelled',
+                    booked_end_time=start + timedelta(hours=4), total_price=Decimal('0.01')),
+        ])
+
+    def assertSameBytes(self, serializer_class, fast_serializer, query=''):
+        request = Request(RequestFactory().get(f'/api/v1/admin/bookings/{query}'))
+        queryset = Booking.objects.order_by('id')
+        slow = serializer_class(queryset.select_related('user', 'bike'), many=True, context={'request': request}).data
+        fast = fast_serializer.data(queryset, request)
+        renderer = JSONRenderer()
+        self.assertEqual(renderer.render(fast), renderer.render(slow))
+
+    def test_booking_serializer(self):
+        self.assertSameBytes(BookingSerializer, booking_list_serializer)
+
+    def test_admin_booking_serializer(self):
+        for query in ['', '?expand=bike', '?expand=', '?fields=id,user,total_price,booked_duration_hours',
+                      '?fields=bike,start_time&expand=bike']:
+            with self.subTest(query=query):
+                self.assertSameBytes(AdminBookingSerializer, admin_booking_list_serializer, query)
+        # Outside UTC too
+        with timezone.override('America/New_York'):
+            self.assertSameBytes(AdminBookingSerializer, admin_booking_list_serializer)
+
+
+@override_settings(READ_REPLICAS={'ALIASES': []})
+class ReviewFieldsetTest(TestCase):
+    """?fields= and ?expand= trim review payloads without adding queries, and unknown names are ignored"""
+
+    QUERIES = ['', '?expand=user', '?expand=bike_detail', '?expand=user,bike_detail', '?expand=',
+               '?fields=id,rating', '?fields=id,user&expand=user', '?fields=bike_name,bike_detail&expand=bike_detail']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create(username='admin', email='admin@example.com', is_staff=True)
+        cls.review_page(1)
+
+    @classmethod
+    def review_page(cls, count):
+        start = Review.objects.count()
+        for i in range(start, start + count):
+            user = User.objects.create(username=f'rider{i}', email=f'rider{i}@example.com')
+            bike = Bike.objects.create(name=f'Bike {i}', brand='Trek', model=f'T{i}', bike_type='city',
+                                       price_per_hour=Decimal('100.00'))
+            Review.objects.create(user=user, bike=bike, rating=1 + i % 5, comment='ok')
+
+    def fetch(self, url):
+        client = APIClient()
+        client.force_authenticate(self.admin)
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()['results']
+
+    def test_query_count_is_constant(self):
+        for base in ['/api/v1/reviews/', '/api/v1/admin/reviews/']:
+            counts = {}
+            for query in self.QUERIES:
+                with CaptureQueriesContext(connection) as queries:
+                    self.fetch(base + query)
+                counts[query] = len(queries)
+            # Expanding a relation joins it rather than querying it per row
+            self.assertEqual(len(set(counts.values())), 1, counts)
+            with self.subTest(base=base):
+                self.review_page(4)
+                for query, expected in counts.items():
+                    with self.subTest(query=query), self.assertNumQueries(expected):
+                        results = self.fetch(base + query)
+                    self.assertEqual(len(results), Review.objects.count())
+
+    def test_payload_shape(self):
+        url = '/api/v1/admin/reviews/'
+        full = self.fetch(url)[0]
+        self.assertIsInstance(full['user'], dict)
+        self.assertIsInstance(full['bike_detail'], dict)
+
+        collapsed = self.fetch(url + '?expand=user')[0]
+        self.assertIsInstance(collapsed['user'], dict)
+        self.assertEqual(collapsed['bike_detail'], full['bike'])
+        self.assertEqual(set(collapsed), set(full))
+        self.assertEqual(set(self.fetch(url + '?fields=id,rating')[0]), {'id', 'rating'})
+
+    def test_unknown_names_are_ignored(self):
+        url = '/api/v1/admin/reviews/'
+        full = self.fetch(url)[0]
+        self.assertEqual(set(self.fetch(url + '?fields=id,nope,user__password')[0]), {'id'})
+        self.assertEqual(self.fetch(url + '?fields=nope'), [{}])
+        self.assertEqual(self.fetch(url + '?expand=nope,user,password')[0]['user'], full['user'])
+        self.assertEqual(self.fetch(url + '?expand=nope')[0]['user'], full['user']['id'])
+
+
+@override_settings(READ_REPLICAS={'ALIASES': []})
+class BikeRatingTotalsTest(TestCase):
+    """Review writes move the bike's running totals; recompute_ratings rebuilds them"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.bikes = Bike.objects.bulk_create([
+            Bike(name=f'Bike {i}', brand='Trek', model=f'T{i}', bike_type='city', price_per_hour=Decimal('100.00'))
+            for i in range(3)
+        ])
+        cls.users = [User.objects.create(username=f'rider{i}', email=f'rider{i}@example.com') for i in range(3)]
+
+    def totals(self, bike):
+        return tuple(Bike.objects.filter(id=bike.id).values_list('rating_sum', 'total_reviews', 'rating').get())
+
+    def test_running_totals(self):
+        first, second, _ = self.bikes
+        review = Review.objects.create(user=self.users[0], bike=first, rating=5, comment='great')
+        Review.objects.create(user=self.users[1], bike=first, rating=2, comment='meh')
+        self.assertEqual(self.totals(first), (7, 2, Decimal('3.5')))
+
+        review.rating = 4
+        review.save()
+        self.assertEqual(self.totals(first), (6, 2, Decimal('3.0')))
+
+        review.bike = second
+        review.save()
+        self.assertEqual(self.totals(first), (2, 1, Decimal('2.0')))
+        self.assertEqual(self.totals(second), (4, 1, Decimal('4.0')))
+
+        review.delete()
+        self.assertEqual(self.totals(second), (0, 0, DEFAULT_RATING))
+
+    def test_recompute(self):
+        first, second, third = self.bikes
+        Review.objects.bulk_create([
+            Review(user=self.users[0], bike=first, rating=5, comment='a'),
+            Review(user=self.users[1], bike=first, rating=4, comment='b'),
+            Review(user=self.users[2], bike=first, rating=4, comment='c'),
+            Review(user=self.users[0], bike=second, rating=1, comment='d'),
+        ])
+        # bulk_create skips the signals; the third bike has stale totals and no reviews
+        Bike.objects.filter(id=third.id).update(rating_sum=9, total_reviews=2, rating=Decimal('4.5'))
+        self.assertEqual(recompute_ratings(), 2)
+        self.assertEqual(self.totals(first), (13, 3, Decimal('4.3')))
+        self.assertEqual(self.totals(second), (1, 1, Decimal('1.0')))
+        self.assertEqual(self.totals(third), (0, 0, DEFAULT_RATING))
+
+    def test_internal_fields_stay_out_of_the_api(self):
+        bike = APIClient().get('/api/v1/bikes/').json()['results'][0]
+        self.assertIn('rating', bike)
+        self.assertIn('total_reviews', bike)
+        self.assertNotIn('rating_sum', bike)
+        self.assertNotIn('popularity', bike)
@@ -0,0 +1,188 @@
+"""
+Guarded booking state transitions.
+
+Every transition is a compare-and-swap: a single UPDATE ... WHERE status =
+<expected> per table inside one transaction, with the affected-row count
+telling us whether we won. Two requests racing for the same bike or the
+same booking can therefore never both succeed, and each UPDATE only writes
+the columns that actually change.
+
+Because update() bypasses model signals, the dashboard counters are
+adjusted inside the transaction, and the availability index, the bike
+facet cache, the live availability stream and (for finished rides) the
+popularity score are updated once it commits.
+"""
+from django.db import transaction
+from django.db.models import Case, Exists, F, OuterRef, Q, Value, When
+from django.utils import timezone
+from rest_framework import status
+
+from . import counters
+from .facets import invalidate_facets_on_commit
+from .live import publish_bike_change_on_commit
+from .popularity import refresh_popularity_on_commit
+from .availability import ACTIVE_BOOKING_STATUSES, DEFAULT_BOOKING_DURATION, availability_index
+from .models import Bike, Booking
+
+
+class BookingTransitionError(Exception):
+    """A transition lost its compare-and-swap or was not allowed"""
+
+    def __init__(self, message, status_code=status.HTTP_400_BAD_REQUEST, details=None):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+        self.details = details
+
+    def as_response_data(self):
+        data = {'error': self.message}
+        if self.details:
+            data['details'] = self.details
+        return data
+
+
+def _has_active_bookings():
+    return Exists(Booking.objects.filter(bike=OuterRef('pk'), status__in=ACTIVE_BOOKING_STATUSES))
+
+
+def _status_after_release():
+    """Bike status once a booking lets go of it: booked if others remain, else available"""
+    return Case(When(_has_active_bookings(), then=Value('booked')), default=Value('available'))
+
+
+def _overlapping_bookings(bike_id, start, end):
+    """Active bookings on the bike whose window intersects [start, end)"""
+    ends_after_start = (
+        Q(booked_end_time__gt=start)
+        | Q(booked_end_time__isnull=True, end_time__gt=start)
+        | Q(booked_end_time__isnull=True, end_time__isnull=True, start_time__gt=start - DEFAULT_BOOKING_DURATION)
+    )
+    if start < timezone.now():
+        # An overdue ride keeps the bike until it is ended
+        ends_after_start |= Q(status='in_use')
+    return Booking.objects.filter(
+        bike_id=bike_id, status__in=ACTIVE_BOOKING_STATUSES, start_time__lt=end
+    ).filter(ends_after_start)
+
+
+def _sync_index_on_commit(booking):
+    transaction.on_commit(lambda: availability_index.sync(booking))
+
+
+def _record_booking_change(booking, previous):
+    counters.remember(booking)
+    counters.record_change(Booking, previous, booking._counter_state)
+
+
+def _record_bike_status(bike_id, old_status, new_status=None):
+    if new_status is None:
+        new_status = Bike.objects.filter(id=bike_id).values_list('status', flat=True).get()
+    if new_status != old_status:
+        counters.record_change(Bike, {'status': old_status}, {'status': new_status})
+        invalidate_facets_on_commit()
+        publish_bike_change_on_commit(bike_id, 'status', new_status, old_status)
+
+
+def _release_bike(bike_id, expected_status):
+    """Hand the bike back: booked if other bookings remain, else available"""
+    released = Bike.objects.filter(id=bike_id, status=expected_status).update(status=_status_after_release())
+    if released:
+        _record_bike_status(bike_id, expected_status)
+
+
+def create_booking(user, bike_id, start, end):
+    """Reserve [start, end) on a bike, refusing any overlap"""
+    unavailable = BookingTransitionError(
+        'This bike is not available for booking.',
+        status.HTTP_409_CONFLICT,
+        'The bike is already booked for part of the selected time.',
+    )
+    # The index only pre-filters: a "taken" answer is confirmed against the
+    # database, since a change from another worker may not have reached it yet
+    if not availability_index.is_free(bike_id, start, end):
+        if _overlapping_bookings(bike_id, start, end).exists():
+            raise unavailable
+        availability_index.reset()
+
+    with transaction.atomic():
+        # Writing first takes the bike's row (on SQLite, the database) write
+        # lock, so the overlap check below cannot race another reservation.
+        claimed = Bike.objects.filter(id=bike_id, status='available').update(status='booked')
+        if claimed:
+            _record_bike_status(bike_id, 'available', 'booked')
+        else:
+            # Already booked or out on a ride: keep the status but still lock the row
+            locked = Bike.objects.filter(id=bike_id).update(status=F('status'))
+            if not locked:
+                raise BookingTransitionError('Bike not found.', status.HTTP_404_NOT_FOUND)
+        if _overlapping_bookings(bike_id, start, end).exists():
+            raise unavailable
+        booking = Booking.objects.create(
+            user=user,
+            bike_id=bike_id,
+            start_time=start,
+            booked_end_time=end,  # User-selected end time
+            end_time=None,  # Legacy field (deprecated)
+            total_price=None,  # Will be calculated when ride ends
+            status='confirmed'
+        )
+    return booking
+
+
+def cancel_booking(booking):
+    """pending/confirmed -> cancelled, releasing the bike if nothing else holds it"""
+    if booking.status not in ('pending', 'confirmed'):
+        raise BookingTransitionError('Cannot cancel this booking.')
+    previous = counters.stored_state(booking)
+    with transaction.atomic():
+        cancelled = Booking.objects.filter(id=booking.id, status=booking.status).update(status='cancelled')
+        if not cancelled:
+            raise BookingTransitionError('Cannot cancel this booking.')
+        booking.status = 'cancelled'
+        _record_booking_change(booking, previous)
+        _release_bike(booking.bike_id, 'booked')
+        _sync_index_on_commit(booking)
+    return booking
+
+
+def start_ride(booking):
+    """confirmed -> in_use on both the booking and the bike"""
+    previous = counters.stored_state(booking)
+    with transaction.atomic():
+        started = Booking.objects.filter(id=booking.id, status='confirmed').update(status='in_use')
+        if not started:
+            raise BookingTransitionError('Ride cannot be started.')
+        for expected_status in ('booked', 'available'):
+            if Bike.objects.filter(id=booking.bike_id, status=expected_status).update(status='in_use'):
+                _record_bike_status(booking.bike_id, expected_status, 'in_use')
+                break
+        else:
+            # Someone else is still riding this bike; the booking update rolls back too
+            raise BookingTransitionError(
+                'Ride cannot be started.', status.HTTP_409_CONFLICT, 'The bike is still in use.'
+            )
+        booking.status = 'in_use'
+        _record_booking_change(booking, previous)
+        _sync_index_on_commit(booking)
+    return booking
+
+
+def end_ride(booking, actual_end_time, actual_total_price):
+    """in_use -> completed for a booking the caller has already priced"""
+    previous = counters.stored_state(booking)
+    with transaction.atomic():
+        ended = Booking.objects.filter(id=booking.id, status='in_use').update(
+            status='completed',
+            actual_end_time=actual_end_time,
+            actual_total_price=actual_total_price,
+        )
+        if not ended:
+            raise BookingTransitionError('Cannot end this ride.')
+        booking.status = 'completed'
+        booking.actual_end_time = actual_end_time
+        booking.actual_total_price = actual_total_price
+        _record_booking_change(booking, previous)
+        _release_bike(booking.bike_id, 'in_use')
+        _sync_index_on_commit(booking)
+        refresh_popularity_on_commit(booking.bike_id)
+    return booking
@@ -1,14 +1,14 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
-    BikeListView, BikeAdminViewSet,
+    BikeListView, BikeAdminViewSet, AvailableBikeSearchView,
     UserRegistrationView, UserLoginView, VerifyEmailView,
     PasswordResetRequestView, SetNewPasswordView, ChangePasswordView,
     BookingCreateView, UserBookingsView, UserCurrentBookingsView, UserRentalHistoryView, AdminBookingListView, AdminBookingUpdateView,
     ReviewCreateView, ReviewListView, AdminReviewViewSet, AdminReviewDeleteView, CancelBookingView, StartRideView, EndRideView, UpdateProfileView,
     AdminUserListView, UserReviewDeleteView, AdminUserDetailView, AdminUserDeleteView, AdminUserRoleUpdateView,
     AdminBookingDeleteView, AdminDashboardStatsView, AdminUserCreateView, UserProfileView, UserDashboardStatsView,
-    bike_stats, AdminAnalyticsView, AnalyticsTrackView, TokenRefreshView, SystemStatusView, AdminContactInfoView
+    BikeStatsView, BikeLiveView, AdminAnalyticsView, AdminAnalyticsEventListView, AnalyticsTrackView, TokenRefreshView, SystemStatusView, MetricsView, QueryStatsView, AdminContactInfoView
 )
 
 router = DefaultRouter()
@@ -70,9 +70,13 @@ urlpatterns = [
     
     # System Status
     path('admin/system-status/', SystemStatusView.as_view(), name='system-status'),
+    path('admin/metrics/', MetricsView.as_view(), name='metrics'),
+    path('admin/query-stats/', QueryStatsView.as_view(), name='query-stats'),
 
     # Bike Stats
-    path('bikes/stats/', bike_stats, name='bike-stats'),
+    path('bikes/stats/', BikeStatsView.as_view(), name='bike-stats'),
+    path('bikes/live/', BikeLiveView.as_view(), name='bike-live'),
+    path('bikes/available/', AvailableBikeSearchView.as_view(), name='bike-available'),
     
     # Admin Contact Info
     path('admin/contact-info/', AdminContactInfoView.as_view(), name='admin-contact-info'),
@@ -80,5 +84,6 @@ urlpatterns = [
     # DRF Router 
     path('', include(router.urls)),
     path('admin/analytics/', AdminAnalyticsView.as_view(), name='admin-analytics'),
+    path('admin/analytics/events/', AdminAnalyticsEventListView.as_view(), name='admin-analytics-events'),
     path('analytics/track-about-click/', AnalyticsTrackView.as_view(), name='analytics-track'),
 ]
@@ -0,0 +1,90 @@
+"""
+Unique usernames derived from an email's local part.
+
+The first signup for a prefix gets the bare prefix. After that, the prefix
+has a UsernameCounter row whose next_suffix is claimed with one F() UPDATE,
+so `info`, `info1`, `info2`, ... cost O(1) queries however many already
+exist. The counter is seeded once per prefix from a single indexed range
+query over existing `<prefix><digits>` usernames.
+
+Nothing is pre-checked: the INSERT itself is the test, and an IntegrityError
+(a concurrent signup, or a name created some other way) just claims the
+next suffix and tries again. The password is hashed once, before the first
+write, so the slow PBKDF2 run never happens while a write lock is held.
+"""
+import re
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .models import UsernameCounter
+
+User = get_user_model()
+
+USERNAME_MAX_LENGTH = User._meta.get_field('username').max_length
+SUFFIX_ROOM = 10  # digits kept free for the suffix
+MAX_ATTEMPTS = 20
+
+
+def username_prefix(email):
+    return email.split('@')[0][:USERNAME_MAX_LENGTH - SUFFIX_ROOM]
+
+
+def highest_suffix(prefix):
+    """Largest N among existing `<prefix>N` usernames, 0 if none"""
+    # Every '<prefix><digits>' sorts between '<prefix>0' and '<prefix>:' (':' follows '9')
+    names = User.objects.filter(username__gte=f'{prefix}0', username__lt=f'{prefix}:')
+    pattern = re.compile(rf'{re.escape(prefix)}(\d+)')
+    highest = 0
+    for username in names.values_list('username', flat=True).iterator():
+        match = pattern.fullmatch(username)
+        if match:
+            highest = max(highest, int(match.group(1)))
+    return highest
+
+
+def claim_existing_suffix(prefix):
+    """Next suffix from `prefix`'s counter, or None if the prefix has no counter yet"""
+    with transaction.atomic():
+        if not UsernameCounter.objects.filter(prefix=prefix).update(next_suffix=F('next_suffix') + 1):
+            return None
+        return UsernameCounter.objects.get(prefix=prefix).next_suffix - 1
+
+
+def claim_suffix(prefix):
+    """Hand out the next suffix for `prefix`, seeding its counter if needed; unique across concurrent callers"""
+    suffix = claim_existing_suffix(prefix)
+    if suffix is not None:
+        return suffix
+    first = highest_suffix(prefix) + 1
+    try:
+        with transaction.atomic():
+            UsernameCounter.objects.create(prefix=prefix, next_suffix=first + 1)
+        return first
+    except IntegrityError:
+        # Someone else seeded it first
+        return claim_existing_suffix(prefix)
+
+
+def create_user_with_unique_username(prefix, password, **fields):
+    """Save a new user as `prefix`, or `prefix<N>` with the next free N"""
+    # Before any write: under IMMEDIATE transactions the lock is taken by the first one
+    password = make_password(password)
+    # A prefix with a counter already has its bare name taken
+    suffix = claim_existing_suffix(prefix)
+    username = prefix if suffix is None else f'{prefix}{suffix}'
+    for _attempt in range(MAX_ATTEMPTS):
+        user = User(username=username, password=password, **fields)
+        try:
+            with transaction.atomic():
+                user.save()
+            return user
+        except IntegrityError:
+            if User.objects.filter(username=username).exists():
+                username = f'{prefix}{claim_suffix(prefix)}'
+                continue
+            # Some other constraint failed; retrying would not help
+            raise
+    raise IntegrityError(f'Could not allocate a username for prefix "{prefix}"')
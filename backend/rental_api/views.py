@@ -1,16 +1,23 @@
+import os
+
 from rest_framework import viewsets, permissions, status, filters, serializers
 from rest_framework.views import APIView
 from rest_framework.generics import UpdateAPIView, ListAPIView
 from rest_framework.response import Response
+from rest_framework.renderers import JSONRenderer
+from rest_framework.settings import api_settings
 from django.contrib.auth import get_user_model
 from django.contrib.auth.tokens import PasswordResetTokenGenerator
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
 from django.utils.encoding import force_str
 from django.utils.http import urlsafe_base64_decode
+from django.utils.dateparse import parse_date
 from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
-from django.core.mail import send_mail
 from django.conf import settings
 from rest_framework.permissions import IsAuthenticated
+from django.db import transaction
 from django.db.models import Q, Count, Sum, Avg
 from .utils import verify_reset_token
 from django.utils.encoding import force_bytes
@@ -19,67 +26,82 @@ from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import AllowAny
 from datetime import timedelta
 from django.db.models import Count, Q
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import action
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
 from jwt import decode as jwtDecode
 from rest_framework_simplejwt.tokens import RefreshToken
 
 from .utils import generate_verification_token, generate_reset_token
+from .availability import availability_index, BOOKING_HORIZON
+from .transitions import BookingTransitionError, create_booking, cancel_booking, start_ride, end_ride
+from .counters import dashboard_stats
+from .authentication import invalidate_user_on_commit
+from .ingest import analytics_buffer, clean_event
+from .outbox import queue_email
+from .rollups import action_counts, local_day_start, timeline
+from .fast_serializers import booking_list_serializer, admin_booking_list_serializer
+from .fieldsets import optimize_queryset
+from .search import BikeSearchFilter, SearchRankOrderingFilter, afts_available
+from .facets import acached_facet_counts
+from .query_stats import query_stats, query_stats_settings
+from .metrics import exposition, recent_server_errors
+from .live import EventStreamRenderer, encode_event, fleet_counts, live_events, retry_frame
+from .pagination import (
+    AsyncPageNumberPagination, CreatedAtKeysetPagination, PagedCreatedAtKeysetPagination, DateJoinedKeysetPagination,
+    TimestampKeysetPagination, apaginated_response, paginated_response,
+)
+from .async_api import AsyncAPIView, AsyncGenericViewSet
+from .routers import ReplicaReadsMixin
 from .permissions import IsOwnerOrAdmin, IsAdminUser, IsVerifiedUser
-from .models import Bike, Booking, Review, Analytics
+from .models import Bike, Booking, Review, Analytics, user_email_match
 from .serializers import (
     UserSerializer, RegisterSerializer, LoginSerializer, ChangePasswordSerializer,
-    BikeSerializer, BookingSerializer, AdminBookingSerializer, ReviewSerializer, SetNewPasswordSerializer, AnalyticsSerializer,
-    AdminUserCreateSerializer
+    BikeSerializer, BikeSearchResultSerializer, BookingSerializer, AdminBookingSerializer, ReviewSerializer, SetNewPasswordSerializer, AnalyticsSerializer,
+    AdminUserCreateSerializer, AdminUserUpdateSerializer
 )
 
 User = get_user_model()
 
 
 # User Dashboard Stats
-class UserDashboardStatsView(APIView):
+class UserDashboardStatsView(AsyncAPIView):
     permission_classes = [IsAuthenticated]
     
-    def get(self, request):
+    async def get(self, request):
         """Get user-specific dashboard statistics"""
         try:
             user = request.user
             
             # Get user's bookings
             user_bookings = Booking.objects.filter(user=user)
-            total_bookings = user_bookings.count()
-            
-            # Calculate booking statistics
-            active_bookings = user_bookings.filter(status__in=['confirmed', 'in_progress']).count()
-            completed_bookings = user_bookings.filter(status__in=['completed', 'returned']).count()
-            cancelled_bookings = user_bookings.filter(status='cancelled').count()
-            
-            # Calculate total spent
-            total_spent = user_bookings.filter(status='completed').aggregate(
-                total=Sum('total_price')
-            )['total'] or 0
+
+            # Every booking statistic in one pass over the user's bookings
+            booking_stats = await user_bookings.aaggregate(
+                total=Count('id'),
+                active=Count('id', filter=Q(status__in=['confirmed', 'in_progress'])),
+                completed=Count('id', filter=Q(status__in=['completed', 'returned'])),
+                cancelled=Count('id', filter=Q(status='cancelled')),
+                spent=Sum('total_price', filter=Q(status='completed')),
+            )
             
             # Get recent bookings (last 5)
             recent_bookings = user_bookings.order_by('-created_at')[:5]
             
-            # Get user's reviews
-            user_reviews = Review.objects.filter(user=user).count()
-            
-            # Calculate average rating given by user
-            avg_rating_given = Review.objects.filter(user=user).aggregate(
-                avg_rating=Avg('rating')
-            )['avg_rating'] or 0
+            # Get user's reviews and the average rating they gave
+            review_stats = await Review.objects.filter(user=user).aaggregate(
+                total=Count('id'), avg_rating=Avg('rating')
+            )
 
             return Response({
-                'total_bookings': total_bookings,
-                'active_bookings': active_bookings,
-                'completed_bookings': completed_bookings,
-                'cancelled_bookings': cancelled_bookings,
-                'total_spent': float(total_spent),
-                'total_reviews': user_reviews,
-                'avg_rating_given': round(avg_rating_given, 1),
-                'recent_bookings': BookingSerializer(recent_bookings, many=True).data
+                'total_bookings': booking_stats['total'],
+                'active_bookings': booking_stats['active'],
+                'completed_bookings': booking_stats['completed'],
+                'cancelled_bookings': booking_stats['cancelled'],
+                'total_spent': float(booking_stats['spent'] or 0),
+                'total_reviews': review_stats['total'],
+                'avg_rating_given': round(review_stats['avg_rating'] or 0, 1),
+                'recent_bookings': await booking_list_serializer.adata(recent_bookings)
             })
             
         except Exception as e:
@@ -141,18 +163,18 @@ class UserRegistrationView(APIView):
         print("Registration request data:", request.data)
         serializer = RegisterSerializer(data=request.data)
         if serializer.is_valid():
-            user = serializer.save()
-            uid = urlsafe_base64_encode(force_bytes(user.pk))
-            # token = generate_verification_token(user.email)
-            token = PasswordResetTokenGenerator().make_token(user)
-            verification_link = f"http://localhost:5173/verify-email?uid={uid}&token={token}"
-            send_mail(
-                subject="Verify your Bike Rental Account",
-                message=f"Click here to verify your email: {verification_link}",
-                from_email=settings.DEFAULT_FROM_EMAIL,
-                recipient_list=[user.email],
-                fail_silently=False,
-            )
+            with transaction.atomic():
+                user = serializer.save()
+                uid = urlsafe_base64_encode(force_bytes(user.pk))
+                # token = generate_verification_token(user.email)
+                token = PasswordResetTokenGenerator().make_token(user)
+                verification_link = f"http://localhost:5173/verify-email?uid={uid}&token={token}"
+                # Sent by the outbox workers once the new user is committed
+                queue_email(
+                    subject="Verify your Bike Rental Account",
+                    message=f"Click here to verify your email: {verification_link}",
+                    recipient_list=[user.email],
+                )
             return Response({"message": "User registered. Please verify your email."}, status=status.HTTP_201_CREATED)
         else:
             print("Registration validation errors:", serializer.errors)
@@ -217,7 +239,7 @@ class PasswordResetRequestView(APIView):
             return Response({"error": "Email is required."}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            user = User.objects.get(email=email)
+            user = User.objects.get(user_email_match(email))
         except User.DoesNotExist:
             # Don't reveal if user exists or not for security
             return Response({"message": "If an account with this email exists, a password reset link has been sent."}, status=status.HTTP_200_OK)
@@ -243,12 +265,10 @@ Best regards,
 Bike Rental Team
             """
 
-            send_mail(
+            queue_email(
                 subject="Reset your Bike Rental password",
                 message=email_message,
-                from_email=settings.DEFAULT_FROM_EMAIL,
                 recipient_list=[email],
-                fail_silently=False,
             )
             return Response({"message": "Password reset link sent to your email."}, status=status.HTTP_200_OK)
         except Exception as e:
@@ -271,7 +291,7 @@ class SetNewPasswordView(APIView):
             return Response({'error': 'Invalid or expired token. Please request a new password reset.'}, status=400)
 
         try:
-            user = User.objects.get(email=email)
+            user = User.objects.get(user_email_match(email))
         except User.DoesNotExist:
             return Response({'error': 'User not found.'}, status=404)
 
@@ -309,20 +329,52 @@ class ChangePasswordView(UpdateAPIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class BikeListView(viewsets.ReadOnlyModelViewSet):
+class BikeListView(ReplicaReadsMixin, AsyncGenericViewSet):
     queryset = Bike.objects.all()
     serializer_class = BikeSerializer
     permission_classes = [permissions.AllowAny]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    pagination_class = AsyncPageNumberPagination
+    # ?search= goes through the FTS5 index and is ranked by relevance (see rental_api.search)
+    filter_backends = [DjangoFilterBackend, BikeSearchFilter, SearchRankOrderingFilter]
     filterset_fields = {
         'bike_type': ['exact'],
         'status': ['exact'],
         'price_per_hour': ['gte', 'lte']
     }
-    search_fields = ['name', 'model', 'brand', 'bike_type']
-    ordering_fields = ['price_per_hour', 'name', 'added_on']
+    search_fields = ['name', 'model', 'brand', 'bike_type', 'description']
+    ordering_fields = ['price_per_hour', 'name', 'added_on', 'rating', 'total_reviews', 'popularity']
     ordering = ['-added_on']
 
+    def get_serializer_class(self):
+        if self.action == 'list' and self.request.query_params.get(api_settings.SEARCH_PARAM):
+            return BikeSearchResultSerializer
+        return BikeSerializer
+
+    async def list(self, request, *args, **kwargs):
+        queryset = await self.afilter_queryset(self.get_queryset())
+        page = await self.paginator.apaginate_queryset(queryset, request, view=self)
+        if page is not None:
+            return self.get_paginated_response(self.get_serializer(page, many=True).data)
+        return Response(self.get_serializer([bike async for bike in queryset], many=True).data)
+
+    async def retrieve(self, request, *args, **kwargs):
+        return Response(self.get_serializer(await self.aget_object()).data)
+
+    async def afilter_queryset(self, queryset):
+        # The search backend checks once per database whether the FTS index exists
+        await afts_available(queryset.db)
+        return self.filter_queryset(queryset)
+
+    @action(detail=False, methods=['get'])
+    async def facets(self, request):
+        """Facet counts for the same filters as the list, e.g. /bikes/facets/?search=trek&status=available"""
+        params = {
+            name: request.query_params.getlist(name)
+            for name in request.query_params
+            if name not in ('page', 'page_size', 'ordering', 'cursor')
+        }
+        return Response(await acached_facet_counts(await self.afilter_queryset(self.get_queryset()), params))
+
     def get_queryset(self):
         queryset = Bike.objects.all()
         
@@ -334,6 +386,52 @@ class BikeListView(viewsets.ReadOnlyModelViewSet):
         return queryset
 
 
+class AvailableBikeSearchView(ListAPIView):
+    """
+    Public endpoint listing bikes that are free for a whole time window,
+    e.g. ?start_time=...&end_time=...&bike_type=mountain&price_per_hour__lte=500
+    """
+    serializer_class = BikeSerializer
+    permission_classes = [permissions.AllowAny]
+
+    def _parse_time(self, name):
+        value = self.request.query_params.get(name)
+        if not value:
+            raise ValidationError({name: 'This query parameter is required.'})
+        try:
+            parsed = timezone.datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError as e:
+            raise ValidationError({name: f'Invalid time format: {str(e)}'})
+        if parsed.tzinfo is None:
+            parsed = timezone.make_aware(parsed)
+        return parsed
+
+    def get_queryset(self):
+        start_time = self._parse_time('start_time')
+        end_time = self._parse_time('end_time')
+        if end_time <= start_time:
+            raise ValidationError({'end_time': 'End time must be after start time.'})
+        if start_time > timezone.now() + BOOKING_HORIZON:
+            raise ValidationError({'start_time': 'Cannot search more than 36 hours in advance.'})
+
+        queryset = Bike.objects.all()
+        params = self.request.query_params
+        bike_type = params.get('type') or params.get('bike_type')
+        if bike_type:
+            queryset = queryset.filter(bike_type=bike_type)
+        try:
+            if params.get('price_per_hour__gte'):
+                queryset = queryset.filter(price_per_hour__gte=params['price_per_hour__gte'])
+            if params.get('price_per_hour__lte'):
+                queryset = queryset.filter(price_per_hour__lte=params['price_per_hour__lte'])
+        except Exception:
+            raise ValidationError({'price_per_hour': 'Price filters must be numbers.'})
+
+        candidate_ids = list(queryset.values_list('id', flat=True))
+        free_ids = availability_index.free_bikes(candidate_ids, start_time, end_time)
+        return queryset.filter(id__in=free_ids)
+
+
 class BikeAdminViewSet(viewsets.ModelViewSet):
     queryset = Bike.objects.all()
     serializer_class = BikeSerializer
@@ -381,7 +479,7 @@ class BookingCreateView(APIView):
             return Response({'error': 'Start time cannot be more than 5 minutes in the past.'}, status=status.HTTP_400_BAD_REQUEST)
         
         # Check if start time is more than 36 hours in the future
-        max_booking_time = now + timedelta(hours=36)
+        max_booking_time = now + BOOKING_HORIZON
         if fmt_start > max_booking_time:
             return Response({'error': 'Cannot book more than 36 hours in advance.'}, status=status.HTTP_400_BAD_REQUEST)
 
@@ -389,28 +487,14 @@ class BookingCreateView(APIView):
         if fmt_booked_end <= fmt_start:
             return Response({'error': 'Booked end time must be after start time.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Check for conflicts (simplified - just check if bike is available)
-        if bike.status != 'available':
-            return Response({
-                'error': 'This bike is not available for booking.',
-                'details': 'The bike is currently not available.'
-            }, status=status.HTTP_409_CONFLICT)
-        
         try:
-            booking = Booking.objects.create(
-                user=request.user,
-                bike=bike,
-                start_time=fmt_start,
-                booked_end_time=fmt_booked_end,  # User-selected end time
-                end_time=None,  # Legacy field (deprecated)
-                total_price=None,  # Will be calculated when ride ends
-                status='confirmed'
-            )
-            bike.status = 'booked'
-            bike.save()
+            # Overlap check and reservation happen in one guarded transaction
+            booking = create_booking(request.user, bike.id, fmt_start, fmt_booked_end)
 
             serializer = BookingSerializer(booking)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
+        except BookingTransitionError as e:
+            return Response(e.as_response_data(), status=e.status_code)
         except Exception as e:
             return Response({'error': f'Failed to create booking: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -420,23 +504,23 @@ class UserBookingsView(APIView):
 
     def get(self, request):
         # Get all bookings for the user, ordered by newest first
-        bookings = Booking.objects.filter(user=request.user).order_by('-created_at')
-        serializer = BookingSerializer(bookings, many=True)
-        return Response(serializer.data)
+        bookings = Booking.objects.filter(user=request.user).order_by('-created_at', '-id')
+        paginator = CreatedAtKeysetPagination()
+        rows = booking_list_serializer.values(bookings, extra=paginator.key_fields)
+        return paginated_response(paginator, request, rows, booking_list_serializer.serialize, self)
 
 
-class UserCurrentBookingsView(APIView):
+class UserCurrentBookingsView(AsyncAPIView):
     permission_classes = [IsAuthenticated, IsOwnerOrAdmin]
 
-    def get(self, request):
+    async def get(self, request):
         # Get only current bookings (confirmed, in_use, pending)
         current_statuses = ['pending', 'confirmed', 'in_use']
         bookings = Booking.objects.filter(
             user=request.user, 
             status__in=current_statuses
         ).order_by('-created_at')
-        serializer = BookingSerializer(bookings, many=True)
-        return Response(serializer.data)
+        return Response(await booking_list_serializer.adata(bookings))
 
 
 class UserRentalHistoryView(APIView):
@@ -448,21 +532,34 @@ class UserRentalHistoryView(APIView):
         bookings = Booking.objects.filter(
             user=request.user, 
             status__in=history_statuses
-        ).order_by('-created_at')
-        serializer = BookingSerializer(bookings, many=True)
-        return Response(serializer.data)
+        ).order_by('-created_at', '-id')
+        paginator = CreatedAtKeysetPagination()
+        rows = booking_list_serializer.values(bookings, extra=paginator.key_fields)
+        return paginated_response(paginator, request, rows, booking_list_serializer.serialize, self)
 
 
-class AdminBookingListView(ListAPIView):
+class AdminBookingListView(ReplicaReadsMixin, ListAPIView):
     queryset = Booking.objects.all()
     serializer_class = AdminBookingSerializer
     permission_classes = [IsAdminUser]
+    pagination_class = PagedCreatedAtKeysetPagination
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['status', 'bike__name', 'user__username']
     search_fields = ['user__username', 'bike__name']
     ordering_fields = ['created_at', 'start_time', 'end_time', 'total_price']
     ordering = ['-created_at']
 
+    def list(self, request, *args, **kwargs):
+        # Same output as AdminBookingSerializer, built straight from .values()
+        # rows: one joined query per page, and no user/bike join when ?expand= drops them
+        rows = admin_booking_list_serializer.values(
+            self.filter_queryset(self.get_queryset()), request, extra=getattr(self.paginator, 'key_fields', ())
+        )
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(admin_booking_list_serializer.serialize(page, request))
+        return Response(admin_booking_list_serializer.serialize(rows, request))
+
 
 class AdminBookingUpdateView(APIView):
     permission_classes = [IsAdminUser]
@@ -491,7 +588,9 @@ class ReviewCreateView(APIView):
             
             serializer = ReviewSerializer(data=request.data, context={'request': request})
             if serializer.is_valid():
-                review = serializer.save(user=request.user)
+                # The bike's rating totals move in the same transaction
+                with transaction.atomic():
+                    review = serializer.save(user=request.user)
                 return Response({'message': 'Review submitted successfully'}, status=status.HTTP_201_CREATED)
             else:
                 print(f"Serializer errors: {serializer.errors}")
@@ -506,12 +605,30 @@ class AdminReviewViewSet(viewsets.ModelViewSet):
     queryset = Review.objects.all()
     serializer_class = ReviewSerializer
     permission_classes = [IsAdminUser]
+    pagination_class = PagedCreatedAtKeysetPagination
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['rating', 'bike__name', 'user__username']
     search_fields = ['user__username', 'bike__name', 'comment']
     ordering_fields = ['created_at', 'rating']
     ordering = ['-created_at']
 
+    def get_queryset(self):
+        # Join whatever the (possibly ?fields=-trimmed) serializer will read
+        return optimize_queryset(super().get_queryset(), self.get_serializer())
+
+    # Review writes and the bike rating totals commit together
+    @transaction.atomic
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+
+    @transaction.atomic
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+
 
 class AdminReviewDeleteView(APIView):
     permission_classes = [IsAdminUser]
@@ -519,7 +636,8 @@ class AdminReviewDeleteView(APIView):
     def delete(self, request, review_id):
         try:
             review = Review.objects.get(id=review_id)
-            review.delete()
+            with transaction.atomic():
+                review.delete()
             return Response({'message': 'Review deleted successfully'}, status=status.HTTP_200_OK)
         except Review.DoesNotExist:
             return Response({'error': 'Review not found'}, status=status.HTTP_404_NOT_FOUND)
@@ -538,10 +656,10 @@ class CancelBookingView(APIView):
         if booking.status not in ['pending', 'confirmed']:
             return Response({'error': 'Cannot cancel this booking.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        booking.status = 'cancelled'
-        booking.bike.status = 'available'
-        booking.bike.save()
-        booking.save()
+        try:
+            cancel_booking(booking)
+        except BookingTransitionError as e:
+            return Response(e.as_response_data(), status=e.status_code)
         return Response({'message': 'Booking cancelled successfully.'}, status=status.HTTP_200_OK)
 
 
@@ -558,10 +676,10 @@ class StartRideView(APIView):
         if booking.status != 'confirmed':
             return Response({'error': 'Ride cannot be started.'}, status=status.HTTP_400_BAD_REQUEST)
 
-        booking.status = 'in_use'
-        booking.bike.status = 'in_use'
-        booking.bike.save()
-        booking.save()
+        try:
+            start_ride(booking)
+        except BookingTransitionError as e:
+            return Response(e.as_response_data(), status=e.status_code)
         return Response({'message': 'Ride started successfully.'}, status=status.HTTP_200_OK)
 
 
@@ -616,13 +734,9 @@ class EndRideView(APIView):
             # Calculate final cost
             final_total_price = Decimal(str(final_duration_hours)) * booking.bike.price_per_hour
             
-            # Update booking with actual end time and cost
-            booking.actual_end_time = actual_end_time
-            booking.actual_total_price = final_total_price
-            booking.status = 'completed'
-            booking.bike.status = 'available'  # Make bike immediately available
-            booking.bike.save()
-            booking.save()
+            # Update booking with actual end time and cost; the bike is made
+            # available again unless it is reserved for later
+            end_ride(booking, actual_end_time, final_total_price)
             
             return Response({
                 'message': 'Ride ended successfully. Bike is now available.',
@@ -639,6 +753,8 @@ class EndRideView(APIView):
                     'pricing_rule': pricing_rule
                 }
             }, status=status.HTTP_200_OK)
+        except BookingTransitionError as e:
+            return Response(e.as_response_data(), status=e.status_code)
         except Exception as e:
             return Response({'error': f'Failed to end ride: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
@@ -660,7 +776,8 @@ class UserReviewDeleteView(APIView):
         except Review.DoesNotExist:
             return Response({'error': 'Review not found or not yours'}, status=status.HTTP_404_NOT_FOUND)
 
-        review.delete()
+        with transaction.atomic():
+            review.delete()
         return Response({'message': 'Review deleted successfully'}, status=status.HTTP_200_OK)
 
 # Admin: Delete User
@@ -671,6 +788,7 @@ class AdminUserDeleteView(APIView):
         try:
             user = User.objects.get(id=user_id)
             user.delete()
+            invalidate_user_on_commit(user_id)
             return Response({'message': 'User deleted successfully'}, status=status.HTTP_200_OK)
         except User.DoesNotExist:
             return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
@@ -690,6 +808,7 @@ class AdminUserRoleUpdateView(APIView):
             if is_superuser is not None:
                 user.is_superuser = is_superuser
             user.save()
+            invalidate_user_on_commit(user.id)
             return Response({'message': 'User role updated successfully'}, status=status.HTTP_200_OK)
         except User.DoesNotExist:
             return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
@@ -709,38 +828,17 @@ class AdminUserDetailView(APIView):
     def put(self, request, user_id):
         try:
             user = User.objects.get(id=user_id)
-            
-            # Update basic fields
-            if 'username' in request.data:
-                user.username = request.data['username']
-            if 'email' in request.data:
-                user.email = request.data['email']
-            
-            # Update password if provided
-            if 'password' in request.data and request.data['password']:
-                user.set_password(request.data['password'])
-            
-            # Update role if provided
-            if 'role' in request.data:
-                role = request.data['role']
-                if role == 'admin':
-                    user.is_staff = True
-                    user.is_superuser = True
-                else:
-                    user.is_staff = False
-                    user.is_superuser = False
-            
-            user.save()
-            
+        except User.DoesNotExist:
+            return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        serializer = AdminUserUpdateSerializer(user, data=request.data, partial=True)
+        if serializer.is_valid():
+            user = serializer.save()
             return Response({
                 'message': 'User updated successfully',
                 'user': UserSerializer(user).data
             }, status=status.HTTP_200_OK)
-            
-        except User.DoesNotExist:
-            return Response({'error': 'User not found'}, status=status.HTTP_404_NOT_FOUND)
-        except Exception as e:
-            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 # Admin: Delete Booking
 class AdminBookingDeleteView(APIView):
@@ -769,70 +867,48 @@ class AdminUserCreateView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 # Admin: Dashboard Summary Stats
-class AdminDashboardStatsView(APIView):
+class AdminDashboardStatsView(ReplicaReadsMixin, APIView):
     permission_classes = [IsAdminUser]
 
     def get(self, request):
         try:
+            # One read of the maintained counters, or one aggregate per table when cold
+            counters = dashboard_stats()
+
             # Basic counts
-            total_users = User.objects.count()
-            total_bikes = Bike.objects.count()
-            total_bookings = Booking.objects.count()
-            total_reviews = Review.objects.count()
+            total_users = int(counters['users_total'])
+            total_bikes = int(counters['bikes_total'])
+            total_bookings = int(counters['bookings_total'])
+            total_reviews = int(counters['reviews_total'])
             
             # User breakdown
-            admin_users = User.objects.filter(is_staff=True).count()
-            customer_users = User.objects.filter(is_staff=False, is_superuser=False).count()
-            verified_users = User.objects.filter(is_verified=True).count()
+            admin_users = int(counters['users_admin'])
+            customer_users = int(counters['users_customer'])
+            verified_users = int(counters['users_verified'])
             
             # Bike status breakdown
-            available_bikes = Bike.objects.filter(status='available').count()
-            booked_bikes = Bike.objects.filter(status='booked').count()
-            in_use_bikes = Bike.objects.filter(status='in_use').count()
+            available_bikes = int(counters['bikes_available'])
+            booked_bikes = int(counters['bikes_booked'])
+            in_use_bikes = int(counters['bikes_in_use'])
             
             # Booking status breakdown
-            pending_bookings = Booking.objects.filter(status='pending').count()
-            confirmed_bookings = Booking.objects.filter(status='confirmed').count()
-            completed_bookings = Booking.objects.filter(status='completed').count()
-            cancelled_bookings = Booking.objects.filter(status='cancelled').count()
+            pending_bookings = int(counters['bookings_pending'])
+            confirmed_bookings = int(counters['bookings_confirmed'])
+            completed_bookings = int(counters['bookings_completed'])
+            cancelled_bookings = int(counters['bookings_cancelled'])
             
             # Recent activity (last 7 days)
-            from datetime import timedelta
-            from django.utils import timezone
-            
-            week_ago = timezone.now() - timedelta(days=7)
-            recent_bookings = Booking.objects.filter(created_at__gte=week_ago).count()
-            recent_users = User.objects.filter(date_joined__gte=week_ago).count()
-            recent_reviews = Review.objects.filter(created_at__gte=week_ago).count()
-            
-            # Revenue calculation (completed bookings)
-            total_revenue = Booking.objects.filter(status='completed').aggregate(
-                total=Sum('total_price')
-            )['total'] or 0
-            
-            # Daily revenue (today)
-            today = timezone.now().date()
-            daily_revenue = Booking.objects.filter(
-                status='completed',
-                created_at__date=today
-            ).aggregate(
-                total=Sum('total_price')
-            )['total'] or 0
+            recent_bookings = int(counters['bookings_recent'])
+            recent_users = int(counters['users_recent'])
+            recent_reviews = int(counters['reviews_recent'])
             
-            # Monthly revenue (current month)
-            current_month = timezone.now().month
-            current_year = timezone.now().year
-            monthly_revenue = Booking.objects.filter(
-                status='completed',
-                created_at__month=current_month,
-                created_at__year=current_year
-            ).aggregate(
-                total=Sum('total_price')
-            )['total'] or 0
+            # Revenue from completed bookings: all time, today and this month
+            total_revenue = counters['revenue_total']
+            daily_revenue = counters['revenue_daily']
+            monthly_revenue = counters['revenue_monthly']
             
             # Average rating
-            from django.db.models import Avg
-            avg_rating = Review.objects.aggregate(avg_rating=Avg('rating'))['avg_rating'] or 0
+            avg_rating = float(counters['reviews_rating_sum']) / total_reviews if total_reviews else 0
 
             return Response({
                 # Basic stats
@@ -903,51 +979,69 @@ class AdminUserListView(APIView):
                 Q(username__icontains=search) | Q(email__icontains=search)
             )
 
-        serializer = UserSerializer(users, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        def serialize(page):
+            return UserSerializer(page, many=True).data
+        return paginated_response(DateJoinedKeysetPagination(), request, users, serialize, self)
 
 
-class ReviewListView(APIView):
+class ReviewListView(ReplicaReadsMixin, AsyncAPIView):
     """
     Public endpoint to list reviews with optional bike filtering
     """
     permission_classes = [permissions.AllowAny]
     
-    def get(self, request):
+    async def get(self, request):
         # Get bike filter from query parameters
         bike_id = request.query_params.get('bike')
         
-        # Start with all reviews
-        reviews = Review.objects.select_related('user', 'bike').order_by('-created_at')
+        # ?fields= / ?expand= trim the payload; the joins follow what is left
+        serializer = ReviewSerializer(context={'request': request})
+        reviews = optimize_queryset(Review.objects.order_by('-created_at'), serializer)
         
         # Filter by bike if bike_id is provided
         if bike_id:
             reviews = reviews.filter(bike_id=bike_id)
         
-        serializer = ReviewSerializer(reviews, many=True)
-        return Response(serializer.data)
-
-
-@api_view(['GET'])
-@permission_classes([AllowAny])
-def bike_stats(request):
-    """Get bike statistics for the frontend"""
-    try:
-        total_bikes = Bike.objects.count()
-        available_bikes = Bike.objects.filter(status='available').count()
-        booked_bikes = Bike.objects.filter(status='booked').count()
-        in_use_bikes = Bike.objects.filter(status='in_use').count()
-        
-        stats = {
-            'total': total_bikes,
-            'available': available_bikes,
-            'booked': booked_bikes,
-            'in_use': in_use_bikes,
-        }
-        
-        return Response(stats)
-    except Exception as e:
-        return Response({'error': str(e)}, status=500)
+        def serialize(page):
+            return ReviewSerializer(page, many=True, context={'request': request}).data
+        return await apaginated_response(CreatedAtKeysetPagination(), request, reviews, serialize, self)
+
+
+class BikeStatsView(AsyncAPIView):
+    permission_classes = [AllowAny]
+
+    async def get(self, request):
+        """Get bike statistics for the frontend"""
+        try:
+            # Served from the (cached) unfiltered facet snapshot
+            facets = await acached_facet_counts(Bike.objects.all(), {})
+            return Response(fleet_counts(facets))
+        except Exception as e:
+            return Response({'error': str(e)}, status=500)
+
+
+class BikeLiveView(AsyncAPIView):
+    """Server-sent events: a fleet snapshot, then one event per bike change (see rental_api/live.py)"""
+    permission_classes = [AllowAny]
+    renderer_classes = [EventStreamRenderer, JSONRenderer]
+
+    async def get(self, request):
+        try:
+            facets = await acached_facet_counts(Bike.objects.all(), {})
+            first_frame = encode_event('fleet', fleet_counts(facets))
+        except Exception as e:
+            return Response({'error': str(e)}, status=500)
+        if isinstance(request._request, ASGIRequest):
+            response = StreamingHttpResponse(live_events.astream(first_frame), content_type='text/event-stream')
+        else:
+            # A WSGI stream would hold a worker thread for as long as the client
+            # stays; send the snapshot and let EventSource reconnect after RETRY
+            response = HttpResponse(retry_frame() + first_frame, content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Stop nginx from buffering the stream
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
 
 
 class AnalyticsTrackView(APIView):
@@ -962,22 +1056,23 @@ class AnalyticsTrackView(APIView):
             else:
                 ip = request.META.get('REMOTE_ADDR')
 
-            # Create analytics entry
-            analytics_data = {
-                'action': request.data.get('action', ''),
-                'page': request.data.get('page', ''),
-                'user': request.user if request.user.is_authenticated else None,
-                'ip_address': ip or '',
-                'user_agent': request.META.get('HTTP_USER_AGENT', '')
-            }
+            if not isinstance(request.data, dict):
+                return Response({'error': 'Expected a JSON object.'}, status=400)
 
-            serializer = AnalyticsSerializer(data=analytics_data)
-            if serializer.is_valid():
-                serializer.save()
-                return Response({'message': 'Analytics tracked successfully'}, status=201)
-            else:
-                print(f"Analytics serializer errors: {serializer.errors}")
-                return Response(serializer.errors, status=400)
+            # Validate cheaply and hand the event to the ingestion buffer
+            event, errors = clean_event(
+                action=request.data.get('action', ''),
+                page=request.data.get('page', ''),
+                user_id=request.user.id if request.user.is_authenticated else None,
+                ip_address=ip,
+                user_agent=request.META.get('HTTP_USER_AGENT', ''),
+            )
+            if errors:
+                print(f"Analytics validation errors: {errors}")
+                return Response(errors, status=400)
+
+            analytics_buffer.enqueue(event)
+            return Response({'message': 'Analytics tracked successfully'}, status=201)
 
         except Exception as e:
             print(f"Analytics tracking error: {e}")
@@ -987,12 +1082,28 @@ class AnalyticsTrackView(APIView):
 class AdminAnalyticsView(APIView):
     permission_classes = [IsAdminUser]
 
+    def _parse_day(self, name):
+        value = self.request.query_params.get(name)
+        if not value:
+            return None
+        day = parse_date(value)
+        if day is None:
+            raise ValidationError({name: 'Use the YYYY-MM-DD format.'})
+        return day
+
     def get(self, request):
         try:
-            # Get analytics data
-            total_clicks = Analytics.objects.count()
-            browse_bikes_clicks = Analytics.objects.filter(action='browse_bikes_clicked').count()
-            about_page_visits = Analytics.objects.filter(action='about_page_visited').count()
+            # Optional inclusive date range, e.g. ?start_date=2025-08-01&end_date=2025-08-31
+            start_day = self._parse_day('start_date')
+            end_day = self._parse_day('end_date')
+            start = local_day_start(start_day) if start_day else None
+            end = local_day_start(end_day + timedelta(days=1)) if end_day else None
+
+            # Counts come from the rollup tables plus events not rolled up yet
+            counts = action_counts(start, end)
+            total_clicks = sum(counts.values())
+            browse_bikes_clicks = counts.get('browse_bikes_clicked', 0)
+            about_page_visits = counts.get('about_page_visited', 0)
             
             # Get recent analytics
             recent_analytics = Analytics.objects.all()[:10]
@@ -1001,15 +1112,35 @@ class AdminAnalyticsView(APIView):
                 'total_clicks': total_clicks,
                 'browse_bikes_clicks': browse_bikes_clicks,
                 'about_page_visits': about_page_visits,
-                'recent_analytics': AnalyticsSerializer(recent_analytics, many=True).data
+                'clicks_by_action': counts,
+                'recent_analytics': AnalyticsSerializer(recent_analytics, many=True).data,
+                'ingestion': analytics_buffer.snapshot(),
             }
+
+            resolution = request.query_params.get('resolution')
+            if resolution:
+                if resolution not in ('hour', 'day'):
+                    raise ValidationError({'resolution': "Must be 'hour' or 'day'."})
+                analytics_data['timeline'] = timeline(resolution, start, end)
             
             return Response(analytics_data)
             
+        except ValidationError as e:
+            return Response(e.detail, status=400)
         except Exception as e:
             return Response({'error': str(e)}, status=500)
 
 
+class AdminAnalyticsEventListView(ListAPIView):
+    """Raw tracked events, newest first, keyset-paginated on (timestamp, id)"""
+    queryset = Analytics.objects.all()
+    serializer_class = AnalyticsSerializer
+    permission_classes = [IsAdminUser]
+    pagination_class = TimestampKeysetPagination
+    filter_backends = [DjangoFilterBackend]
+    filterset_fields = ['action', 'page', 'user']
+
+
 class TokenRefreshView(APIView):
     permission_classes = [AllowAny]
     
@@ -1038,6 +1169,39 @@ class TokenRefreshView(APIView):
             return Response({'error': 'Token refresh failed'}, status=500)
 
 
+class MetricsView(APIView):
+    """Latency histograms and p50/p95/p99, status codes, DB and cache figures of every worker"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        try:
+            return HttpResponse(exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
+        except Exception as e:
+            return Response({'error': str(e)}, status=500)
+
+
+class QueryStatsView(APIView):
+    """Sampled SQL counts, times and repeated queries per endpoint, for this worker process"""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        try:
+            config = query_stats_settings()
+            return Response({
+                'pid': os.getpid(),
+                'since': query_stats.since,
+                'sample_rate': config['SAMPLE_RATE'],
+                'repeat_threshold': config['REPEAT_THRESHOLD'],
+                'views': query_stats.snapshot(),
+            })
+        except Exception as e:
+            return Response({'error': str(e)}, status=500)
+
+    def delete(self, request):
+        query_stats.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
 class SystemStatusView(APIView):
     permission_classes = [IsAdminUser]
     
@@ -1058,9 +1222,8 @@ class SystemStatusView(APIView):
             # Check if server is running
             server_status = "online"
             
-            # Check if there are any critical errors in logs (simplified check)
-            # In a real implementation, you might check log files or error tracking
-            error_count = 0  # This could be implemented to check actual error logs
+            # 5xx responses from any worker in the last 15 minutes
+            error_count = recent_server_errors(minutes=15)
             
             # Determine overall system status
             if db_status == "online" and server_status == "online" and error_count == 0:
@@ -1104,16 +1267,16 @@ class SystemStatusView(APIView):
 
 
 # Admin Contact Information API
-class AdminContactInfoView(APIView):
+class AdminContactInfoView(AsyncAPIView):
     permission_classes = [permissions.AllowAny]
     
-    def get(self, request):
+    async def get(self, request):
         """Get admin contact information for public display"""
         try:
             # Get the first admin user (superuser or staff)
-            admin_user = User.objects.filter(
+            admin_user = await User.objects.filter(
                 Q(is_superuser=True) | Q(is_staff=True)
-            ).first()
+            ).afirst()
             
             if admin_user:
                 return Response({
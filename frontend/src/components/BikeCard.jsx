@@ -97,7 +97,7 @@ const BikeCard = ({ bike }) => {
         
         try {
             setLoadingReviews(true);
-            const response = await api.get(`reviews/?bike=${bike.id}`);
+            const response = await api.get(`reviews/?pagination=legacy&bike=${bike.id}`);
             console.log('Reviews API response:', response.data);
             setReviews(response.data);
         } catch (error) {
@@ -21,8 +21,8 @@ const Home = () => {
       setError('');
       
       const [bikesResponse, reviewsResponse] = await Promise.all([
-        api.get('bikes/'),
-        api.get('reviews/')
+        api.get('bikes/?ordering=-popularity'),
+        api.get('reviews/?pagination=legacy')
       ]);
       
       // Handle both paginated and non-paginated responses
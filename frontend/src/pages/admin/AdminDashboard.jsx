@@ -22,11 +22,11 @@ const AdminDashboard = () => {
         setStats(statsRes.data);
         
         // Fetch recent bookings with expanded user and bike data
-        const bookingsRes = await api.get('admin/bookings/?page_size=10');
+        const bookingsRes = await api.get('admin/bookings/?pagination=legacy&page_size=10');
         setRecentBookings(bookingsRes.data.results || bookingsRes.data || []);
         
         // Fetch all users
-        const usersRes = await api.get('admin/users/');
+        const usersRes = await api.get('admin/users/?pagination=legacy');
         setAllUsers(usersRes.data || []);
         
       } catch (err) {
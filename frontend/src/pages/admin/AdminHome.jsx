@@ -31,7 +31,7 @@ const AdminHome = () => {
         }
         
         // Fetch all users
-        const usersRes = await api.get('admin/users/');
+        const usersRes = await api.get('admin/users/?pagination=legacy');
         if (isMounted) {
           setAllUsers(usersRes.data || []);
         }
@@ -88,7 +88,7 @@ const ManageBookings = () => {
   const fetchBookings = async () => {
     try {
       setLoading(true);
-      const res = await api.get('admin/bookings/');
+      const res = await api.get('admin/bookings/?pagination=legacy');
       setBookings(res.data.results || res.data || []);
       setError('');
     } catch (err) {
@@ -74,7 +74,7 @@ const ModerateReviews = () => {
 
   const fetchReviews = async () => {
     try {
-      const res = await api.get('admin/reviews/');
+      const res = await api.get('admin/reviews/?pagination=legacy');
       setReviews(res.data.results || res.data || []);
       setError('');
     } catch (err) {
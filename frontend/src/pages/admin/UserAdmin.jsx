@@ -84,7 +84,7 @@ const UserAdmin = () => {
 
   const fetchUsers = async () => {
     try {
-      const res = await api.get('admin/users/');
+      const res = await api.get('admin/users/?pagination=legacy');
       setUsers(res.data.results || res.data || []);
       setError('');
     } catch (err) {
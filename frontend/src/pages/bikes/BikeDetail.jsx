@@ -76,7 +76,7 @@ const BikeDetail = () => {
     const fetchReviewsSafely = async () => {
       try {
         setReviewsLoading(true);
-        const response = await api.get(`reviews/?bike=${id}`);
+        const response = await api.get(`reviews/?pagination=legacy&bike=${id}`);
         if (isMounted) {
           setReviews(response.data);
         }
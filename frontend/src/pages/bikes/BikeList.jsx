@@ -98,6 +98,7 @@ const FilterSection = ({ typeFilter, statusFilter, sortBy, onFilterChange, onCle
 
   const sortOptions = [
     { value: "", label: "Sort By" },
+    { value: "-popularity", label: "Most Popular" },
     { value: "price_per_hour", label: "Price: Low to High" },
     { value: "-price_per_hour", label: "Price: High to Low" },
     { value: "name", label: "Name: A to Z" },
@@ -17,7 +17,7 @@ const RentalHistory = () => {
   const fetchRentalHistory = async () => {
     try {
       setLoading(true);
-      const response = await api.get('user/rental-history/');
+      const response = await api.get('user/rental-history/?pagination=legacy');
       setBookings(response.data);
       setError('');
     } catch (error) {
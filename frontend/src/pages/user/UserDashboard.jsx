@@ -31,7 +31,7 @@ export default function UserDashboard() {
         }
         
         // Fetch user bookings
-        const bookingsResponse = await api.get('user/bookings/');
+        const bookingsResponse = await api.get('user/bookings/?pagination=legacy');
         if (isMounted) {
           setBookings(bookingsResponse.data);
         }